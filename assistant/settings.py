@@ -57,7 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'chat_buddy.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise, ASGI-native
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,6 +89,80 @@ load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Image-based PDF processing: peak memory budget per upload for rasterized
+# pages, and the most Gemini vision calls one upload may run in parallel
+VISION_MEMORY_CEILING_MB = int(os.getenv('VISION_MEMORY_CEILING_MB', '256'))
+VISION_MAX_WORKERS = int(os.getenv('VISION_MAX_WORKERS', '5'))
+
+# How much of a document is read for summarization: long documents are
+# condensed with map-reduce, so these bound cost rather than prompt size
+VISION_MAX_PAGES = int(os.getenv('VISION_MAX_PAGES', '100'))
+PDF_DOCUMENT_CHAR_BUDGET = int(os.getenv('PDF_DOCUMENT_CHAR_BUDGET', '300000'))
+
+# Process-wide cap on concurrent Gemini calls. The cap adapts between MIN and
+# MAX: it grows on success and halves on 429s / timeouts.
+LLM_INITIAL_CONCURRENCY = int(os.getenv('LLM_INITIAL_CONCURRENCY', '4'))
+LLM_MIN_CONCURRENCY = int(os.getenv('LLM_MIN_CONCURRENCY', '1'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+# Deadlines (seconds, retries included) for chat answers and for background
+# work. Chat requests still running at the LLM_HEDGE_PERCENTILE latency of
+# recent ones (but at least LLM_HEDGE_MIN_DELAY) are duplicated and the
+# first answer wins; 0 disables hedging.
+LLM_INTERACTIVE_DEADLINE = float(os.getenv('LLM_INTERACTIVE_DEADLINE', '45'))
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', '300'))
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '1.0'))
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv('LLM_STREAM_IDLE_TIMEOUT', '30'))
+# Use a local stub LLM server (manage.py run_llm_stub) instead of Gemini
+LLM_STUB_URL = os.getenv('LLM_STUB_URL', '')
+
+# Chat answers about an uploaded material get the top RETRIEVAL_TOP_K
+# matching chunks of it, up to MATERIAL_CONTEXT_TOKENS tokens
+MATERIAL_CONTEXT_TOKENS = int(os.getenv('MATERIAL_CONTEXT_TOKENS', '1200'))
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '8'))
+
+# Chat prompts include the newest conversation messages up to
+# HISTORY_TOKEN_BUDGET tokens, each cut to HISTORY_MESSAGE_TOKENS
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '3000'))
+HISTORY_MESSAGE_TOKENS = int(os.getenv('HISTORY_MESSAGE_TOKENS', '800'))
+# Older turns are folded into a rolling per-session summary this often
+SESSION_SUMMARY_EVERY_TURNS = int(os.getenv('SESSION_SUMMARY_EVERY_TURNS', '5'))
+
+# Answers to standalone questions (first question about a material, or
+# flagged standalone by the client) are cached per process
+ANSWER_CACHE_MAX_BYTES = int(os.getenv('ANSWER_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', str(24 * 60 * 60)))  # seconds
+
+# Write chat turns of existing sessions after the response, in batched
+# transactions, instead of before it. Queued turns are lost if the process
+# is killed before they are written.
+CHAT_WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'False') == 'True'
+
+# Longest a chat answer waits for web reference results (seconds, counted
+# from the start of the request); later results are only cached
+REFERENCE_SEARCH_BUDGET = float(os.getenv('REFERENCE_SEARCH_BUDGET', '2.5'))
+# A web search queries its sources in parallel and returns with whatever
+# answered within this many seconds
+WEB_SEARCH_BUDGET = float(os.getenv('WEB_SEARCH_BUDGET', '6'))
+
+# Web search results cache: 'memory' (per process), 'sqlite' (a file shared
+# by the workers on this machine, at SEARCH_CACHE_PATH) or 'django' (the
+# SEARCH_CACHE_ALIAS entry of CACHES, e.g. Redis shared across machines)
+SEARCH_CACHE_BACKEND = os.getenv('SEARCH_CACHE_BACKEND', 'memory')
+SEARCH_CACHE_PATH = os.getenv('SEARCH_CACHE_PATH', str(BASE_DIR / 'search_cache.sqlite3'))
+SEARCH_CACHE_ALIAS = os.getenv('SEARCH_CACHE_ALIAS', 'default')
+SEARCH_CACHE_MAX_BYTES = int(os.getenv('SEARCH_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', str(60 * 60)))  # seconds
+# A reference source that found nothing (or failed) is not asked again for
+# this many seconds, and an expired result is served for up to
+# SEARCH_STALE_TTL seconds longer while it is refreshed in the background
+SEARCH_NEGATIVE_TTL = int(os.getenv('SEARCH_NEGATIVE_TTL', str(5 * 60)))
+SEARCH_STALE_TTL = int(os.getenv('SEARCH_STALE_TTL', str(24 * 60 * 60)))
+# English labels of Wikidata entities referenced by search results, per process
+WIKIDATA_LABEL_CACHE_MAX_BYTES = int(os.getenv('WIKIDATA_LABEL_CACHE_MAX_BYTES', str(2 * 1024 * 1024)))
+WIKIDATA_LABEL_CACHE_TTL = int(os.getenv('WIKIDATA_LABEL_CACHE_TTL', str(7 * 24 * 60 * 60)))  # seconds
+
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
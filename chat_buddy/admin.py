@@ -1,6 +1,9 @@
 from django.contrib import admin
-from .models import StudyMaterial, ChatMessage
+from .models import StudyMaterial, ChatMessage, ExtractedText, MaterialChunk, MaterialIndex
 
 admin.site.register(StudyMaterial)
 admin.site.register(ChatMessage)
+admin.site.register(ExtractedText)
+admin.site.register(MaterialChunk)
+admin.site.register(MaterialIndex)
 # Register your models here.
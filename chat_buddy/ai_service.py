@@ -5,12 +5,35 @@ from PIL import Image
 import pytesseract
 from pdf2image import convert_from_path
 from docx import Document
-import tempfile
+import io
 import os
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import Future, wait as wait_futures
+
+from .answer_cache import get_cached_answer, cache_answer
+from .extraction_cache import PAGE_SEPARATOR, ExtractedPages
+from .files import mapped_file
+from .llm_scheduler import (
+    generate_content, generate_content_async, stream_content_async,
+    PRIORITY_INTERACTIVE, PRIORITY_SUMMARY, PRIORITY_BULK,
+)
+from .prompts import (
+    PromptAssembler, CHAT_PROMPT_TOKEN_BUDGET, SUMMARY_PROMPT_TOKEN_BUDGET,
+    SECTION_MATERIAL, SECTION_REFERENCE, SECTION_HISTORY, SECTION_SUMMARY,
+    DEFAULT_SYSTEM_PROMPT, CHRISTIAN_TOPIC_NOTE,
+    PDF_SUMMARY_PROMPT, IMAGE_SUMMARY_PROMPT, DOCUMENT_SUMMARY_PROMPT,
+)
+from .retrieval import MATERIAL_CONTEXT_TOKENS
+from .summarizer import condense_text
+from .tokens import chars_for_tokens
 
 # Try to import web search functionality, but don't fail if it's not available
 try:
-    from .web_service import search_web, format_search_results_for_ai, is_current_event_question
+    from .web_service import (
+        search_web, search_web_async, submit_search, format_search_results_for_ai, is_current_event_question,
+    )
     WEB_SEARCH_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: Web search not available: {e}")
@@ -20,6 +43,14 @@ except ImportError as e:
     def search_web(query, max_results=3):
         return None
     
+    async def search_web_async(query):
+        return None
+
+    def submit_search(query):
+        future = Future()
+        future.set_result(None)
+        return future
+    
     def format_search_results_for_ai(results):
         return ""
     
@@ -40,155 +71,390 @@ except:
         print("Note: Tesseract not found. Gemini Vision API will be used for image/image-PDF processing.")
 
 # Initialize Google Generative AI with proper error handling
-google_api_key = getattr(settings, 'GOOGLE_API_KEY', None) or os.getenv('GOOGLE_API_KEY')
-if not google_api_key:
-    raise ValueError("GOOGLE_API_KEY is not set. Please add it to your .env file or Django settings.")
+llm_stub_url = getattr(settings, 'LLM_STUB_URL', None)
+if llm_stub_url:
+    # Local stand-in with injected latency (manage.py run_llm_stub), for testing
+    from .llm_stub import StubModel
+    model = StubModel(llm_stub_url)
+else:
+    google_api_key = getattr(settings, 'GOOGLE_API_KEY', None) or os.getenv('GOOGLE_API_KEY')
+    if not google_api_key:
+        raise ValueError("GOOGLE_API_KEY is not set. Please add it to your .env file or Django settings.")
+
+    genai.configure(api_key=google_api_key)
+    model = genai.GenerativeModel('gemini-2.5-flash')
+
+# Extractors report failures as plain strings starting with one of these
+EXTRACTION_FAILURE_PREFIXES = (
+    'Unable to extract',
+    'No readable text',
+    'Failed to extract',
+)
+
+# Most PDF text read per document. Everything read is condensed with
+# map-reduce (see summarizer.py) before it reaches the summary prompt.
+PDF_DOCUMENT_CHAR_BUDGET = getattr(settings, 'PDF_DOCUMENT_CHAR_BUDGET', 300000)
+
+# A page needs at least this many letters/digits, and not be mostly symbols, to skip vision
+MIN_PAGE_TEXT_CHARS = 40
+MIN_PAGE_ALNUM_RATIO = 0.3
+# Upper bound on pages sent to Gemini vision per document
+MAX_VISION_PAGES = getattr(settings, 'VISION_MAX_PAGES', 100)
+# Typical transcription length of one scanned page, used for budgeting
+VISION_PAGE_CHAR_ESTIMATE = 1500
+
+# Page rasterization for Gemini vision
+RASTER_DPI = 200
+MAX_IMAGE_WIDTH = 1600
+# Approximate size of one rasterized RGB page (1600 x ~2260 px) and how many
+# copies of it a vision worker holds while preprocessing (convert, enhance, encode)
+ESTIMATED_PAGE_MB = 11
+PAGE_COPIES_PER_WORKER = 3
+
+
+def _spread_page_order(page_count):
+    """
+    Order page indices so that every prefix is spread across the whole document:
+    the first page, then the middle, then the quarter points, and so on.
+    """
+    if page_count <= 0:
+        return []
+    order = [0]
+    spans = deque([(1, page_count)])
+    while spans:
+        lo, hi = spans.popleft()
+        if lo >= hi:
+            continue
+        mid = (lo + hi) // 2
+        order.append(mid)
+        spans.append((lo, mid))
+        spans.append((mid + 1, hi))
+    return order
+
+
+def iter_pdf_pages(pdf_path, sample_pages=False):
+    """
+    Lazily yield (page_index, text) for each page of a PDF's text layer.
+    With sample_pages=True pages come in spread order (see _spread_page_order)
+    instead of front to back, so stopping early still covers the whole document.
+    """
+    with mapped_file(pdf_path) as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+        order = _spread_page_order(page_count) if sample_pages else range(page_count)
+        for idx in order:
+            yield idx, pdf_reader.pages[idx].extract_text() or ""
+
+
+def page_has_usable_text(page_text):
+    """
+    Decide whether a page's text layer is real content. Scanned pages usually
+    have no text layer, or only a scanner watermark ("Scanned with CamScanner")
+    or OCR garbage, and must be read with Gemini vision instead.
+    """
+    visible = [c for c in page_text if not c.isspace()]
+    alphanumeric = sum(1 for c in visible if c.isalnum())
+    if alphanumeric < MIN_PAGE_TEXT_CHARS:
+        return False
+    return alphanumeric / len(visible) >= MIN_PAGE_ALNUM_RATIO
+
+
+def count_pdf_pages(pdf_path):
+    """Return the number of pages in a PDF"""
+    with mapped_file(pdf_path) as file:
+        return len(PyPDF2.PdfReader(file).pages)
 
-genai.configure(api_key=google_api_key)
-model = genai.GenerativeModel('gemini-2.5-flash')
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text content from PDF file with fallback to Gemini vision for image-based PDFs"""
-    text = ""
+def classify_pdf_pages(pdf_path, char_budget=None, token_budget=None, sample_pages=False):
+    """
+    Read the PDF text layer page by page and split pages into those with usable
+    text and those that need Gemini vision. Stops as soon as the budget is met
+    (vision pages count as VISION_PAGE_CHAR_ESTIMATE characters each).
+    Returns (text_pages, vision_page_indices) where text_pages maps page index -> text.
+    """
+    if token_budget is not None:
+        token_chars = chars_for_tokens(token_budget)
+        char_budget = token_chars if char_budget is None else min(char_budget, token_chars)
+
+    text_pages = {}
+    vision_pages = []
+    collected = 0
+    for idx, page_text in iter_pdf_pages(pdf_path, sample_pages=sample_pages):
+        if page_has_usable_text(page_text):
+            text_pages[idx] = page_text
+            collected += len(page_text) + 1
+        elif len(vision_pages) < MAX_VISION_PAGES:
+            vision_pages.append(idx)
+            collected += VISION_PAGE_CHAR_ESTIMATE
+        if char_budget is not None and collected >= char_budget:
+            break
+
+    return text_pages, sorted(vision_pages)
+
+
+def extract_pdf_pages(pdf_path, progress_callback=None, char_budget=None,
+                      token_budget=None, sample_pages=False):
+    """
+    Extract text content from PDF file, page by page: pages with a usable text
+    layer are read directly and only image-only (scanned) pages go to Gemini vision.
+    Returns a list of (page_number, text) in page order (page numbers are 1-based).
+    Extraction stops once char_budget / token_budget is met; sample_pages spreads
+    the pages read across the whole document instead of taking only the first ones.
+    progress_callback(done, total) is called as vision pages complete.
+    The result's failed_pages lists the page numbers that could not be read.
+    """
     try:
-        # First try normal PDF text extraction (fast, for text-based PDFs)
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n"
-        
-        # If text extracted successfully, return it
-        if text.strip():
-            return text
-        
-        # If no text was extracted, it's likely an image-based PDF - use Gemini vision
-        print("Text-based extraction failed, attempting Gemini vision analysis on PDF pages...")
-        text = extract_text_from_pdf_with_gemini_vision(pdf_path)
-            
+        text_pages, vision_pages = classify_pdf_pages(
+            pdf_path, char_budget=char_budget, token_budget=token_budget, sample_pages=sample_pages
+        )
     except Exception as e:
-        # If normal extraction fails, try Gemini vision
+        # If PyPDF2 cannot read the file at all, try Gemini vision on the leading pages
         print(f"PyPDF2 extraction error, falling back to Gemini vision: {str(e)}")
         try:
-            text = extract_text_from_pdf_with_gemini_vision(pdf_path)
+            pages = _transcribe_pdf_pages(pdf_path, range(MAX_VISION_PAGES), progress_callback=progress_callback)
         except Exception as e2:
             raise Exception(f"Failed to extract PDF text: {str(e2)}")
-    
-    return text if text.strip() else "Unable to extract text from this PDF."
+    else:
+        pages = dict(text_pages)
+        if vision_pages:
+            print(f"{len(vision_pages)} page(s) have no usable text layer, sending them to Gemini vision...")
+            try:
+                pages.update(extract_pdf_pages_with_gemini_vision(
+                    pdf_path, vision_pages, progress_callback=progress_callback
+                ))
+            except Exception as e:
+                # e.g. poppler missing: keep the text-layer pages and report
+                # the image-only ones as failed
+                print(f"Gemini vision extraction failed, keeping text-layer pages only: {str(e)}")
+                pages.update(dict.fromkeys(vision_pages))
+
+    return ExtractedPages(
+        [(idx + 1, pages[idx].strip()) for idx in sorted(pages) if pages[idx] and pages[idx].strip()],
+        failed_pages=[idx + 1 for idx in sorted(pages) if pages[idx] is None],
+    )
 
 
-def extract_text_from_pdf_with_gemini_vision(pdf_path):
-    """
-    Extract text from image-based PDFs (including scanned / handwritten pages)
-    using Gemini's vision API.
-    Speed optimisations:
-    - 200 DPI (sharp enough for Gemini, ~44% smaller than 300 DPI)
-    - Images resized to max 1 600 px wide before encoding
-    - JPEG encoding (5-10× smaller than PNG)
-    - All pages processed IN PARALLEL via ThreadPoolExecutor
-    Quality:
-    - PIL contrast + sharpness enhancement before sending
-    - Gemini prompt explicitly ignores scanner watermarks (CamScanner, etc.)
-    """
-    import base64
-    from PIL import ImageEnhance
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+def join_pages(pages):
+    """Join (page_number, text) pages into one document string"""
+    return PAGE_SEPARATOR.join(text for _, text in pages)
+
+
+def extract_text_from_pdf(pdf_path, progress_callback=None, char_budget=None,
+                          token_budget=None, sample_pages=False):
+    """Extract text content from PDF file as one string (see extract_pdf_pages)"""
+    text = join_pages(extract_pdf_pages(
+        pdf_path, progress_callback=progress_callback, char_budget=char_budget,
+        token_budget=token_budget, sample_pages=sample_pages
+    ))
+    return text if text.strip() else "Unable to extract text from this PDF."
+
 
+def _convert_pdf_to_images(pdf_path, first_page, last_page):
+    """Rasterize a page range with pdf2image, preferring the bundled Windows poppler if present"""
     poppler_path = r'C:\Users\HomePC\Downloads\poppler\poppler-25.12.0\Library\bin'
+    # Render straight to the width sent to Gemini instead of rendering at full
+    # DPI and downscaling afterwards; this keeps each page bitmap small.
+    options = dict(first_page=first_page, last_page=last_page, dpi=RASTER_DPI,
+                   size=(MAX_IMAGE_WIDTH, None), thread_count=1)
 
     try:
         try:
             if os.path.exists(poppler_path):
-                images = convert_from_path(
-                    pdf_path, first_page=1, last_page=20,
-                    dpi=200, poppler_path=poppler_path
-                )
-            else:
-                images = convert_from_path(pdf_path, first_page=1, last_page=20, dpi=200)
+                return convert_from_path(pdf_path, poppler_path=poppler_path, **options)
+            return convert_from_path(pdf_path, **options)
         except Exception as e:
             print(f"Poppler path failed, trying system poppler: {e}")
-            images = convert_from_path(pdf_path, first_page=1, last_page=20, dpi=200)
+            return convert_from_path(pdf_path, **options)
 
     except Exception as e:
         raise Exception(f"Failed to convert PDF pages to images: {str(e)}")
 
-    PAGE_PROMPT = (
-        "You are reading a scanned document page.\n"
-        "Your task: extract ONLY the actual document content — "
-        "handwritten notes, printed text, diagrams, tables, equations, "
-        "and any legible writing made by the document author.\n\n"
-        "IMPORTANT RULES:\n"
-        "1. IGNORE all scanner / app watermarks, logos, and branding. "
-        "This includes 'CamScanner', 'Adobe Scan', 'Microsoft Lens', "
-        "'Genius Scan', any app name, website URL, or promotional text "
-        "added by a scanning app — do NOT transcribe these.\n"
-        "2. If the page contains handwriting, transcribe it faithfully, "
-        "preserving line breaks, numbering, and structure.\n"
-        "3. If text is partially illegible, give your best reading and "
-        "mark uncertain words with [?].\n"
-        "4. Preserve the original layout: headings, bullet points, "
-        "numbered lists, tables, and paragraph breaks.\n"
-        "5. Return ONLY the transcribed text — no commentary or explanations."
-    )
 
-    def process_page(args):
-        """Preprocess one page image and call Gemini. Returns (idx, text)."""
-        idx, img = args
-        tmp_path = None
-        try:
-            # Preprocess
-            img = img.convert('RGB')
-            img = ImageEnhance.Contrast(img).enhance(1.8)
-            img = ImageEnhance.Sharpness(img).enhance(2.0)
-
-            # Resize to max 1600px wide to reduce payload size
-            max_width = 1600
-            if img.width > max_width:
-                ratio = max_width / img.width
-                img = img.resize(
-                    (max_width, int(img.height * ratio)),
-                    resample=Image.LANCZOS
-                )
-
-            # Save as JPEG (much smaller than PNG)
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp:
-                img.save(tmp, format='JPEG', quality=90, optimize=True)
-                tmp_path = tmp.name
-
-            with open(tmp_path, 'rb') as f:
-                img_data = base64.standard_b64encode(f.read()).decode('utf-8')
-
-            response = model.generate_content([
-                PAGE_PROMPT,
-                {"mime_type": "image/jpeg", "data": img_data}
-            ])
-
-            page_text = response.text.strip() if response.text else ""
-            return (idx, page_text)
+def _iter_page_images(pdf_path, page_indices):
+    """Rasterize pages one at a time, yielding (page_index, PIL image). Stops at the end of the document."""
+    for idx in page_indices:
+        images = _convert_pdf_to_images(pdf_path, idx + 1, idx + 1)
+        if not images:
+            return
+        yield idx, images[0]
 
-        except Exception as e:
-            print(f"Error processing page {idx + 1} with Gemini: {e}")
-            return (idx, "")
-        finally:
-            if tmp_path and os.path.exists(tmp_path):
-                os.unlink(tmp_path)
 
-    # Process all pages IN PARALLEL (up to 5 concurrent Gemini calls)
-    results = {}
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {executor.submit(process_page, (idx, img)): idx
-                   for idx, img in enumerate(images)}
-        for future in as_completed(futures):
-            idx, page_text = future.result()
-            if page_text:
-                results[idx] = page_text
+def _vision_pipeline_size():
+    """
+    Size the rasterize -> Gemini pipeline so that peak memory per upload stays
+    under VISION_MEMORY_CEILING_MB however many pages the document has.
+    Each worker holds a few copies of a page while preprocessing it; the rest
+    of the ceiling is the window of rasterized pages waiting in the queue.
+    Returns (worker_count, queue_size).
+    """
+    ceiling = getattr(settings, 'VISION_MEMORY_CEILING_MB', 256)
+    max_workers = getattr(settings, 'VISION_MAX_WORKERS', 5)
+    per_worker = ESTIMATED_PAGE_MB * PAGE_COPIES_PER_WORKER
+    workers = max(1, min(max_workers, int(ceiling // per_worker)))
+    window = max(1, int((ceiling - workers * per_worker) // ESTIMATED_PAGE_MB))
+    return workers, window
+
+
+def extract_text_from_pdf_with_gemini_vision(pdf_path, progress_callback=None):
+    """
+    Extract text from the first MAX_VISION_PAGES pages of an image-based PDF
+    (including scanned / handwritten pages) using Gemini's vision API.
+    """
+    results = _transcribe_pdf_pages(pdf_path, range(MAX_VISION_PAGES), progress_callback=progress_callback)
 
     # Reassemble in original page order
-    full_text = "\n\n".join(results[i] for i in sorted(results))
+    full_text = "\n\n".join(results[i] for i in sorted(results) if results[i])
     return full_text if full_text.strip() else "No readable text found in this PDF."
 
 
+def extract_pdf_pages_with_gemini_vision(pdf_path, page_indices, progress_callback=None):
+    """
+    Transcribe only the given (0-based) pages of a PDF with Gemini vision.
+    Returns a dict mapping page index -> text for pages that produced text,
+    and -> None for pages that failed.
+    """
+    return _transcribe_pdf_pages(pdf_path, page_indices, progress_callback=progress_callback)
+
+
+VISION_PAGE_PROMPT = (
+    "You are reading a scanned document page.\n"
+    "Your task: extract ONLY the actual document content — "
+    "handwritten notes, printed text, diagrams, tables, equations, "
+    "and any legible writing made by the document author.\n\n"
+    "IMPORTANT RULES:\n"
+    "1. IGNORE all scanner / app watermarks, logos, and branding. "
+    "This includes 'CamScanner', 'Adobe Scan', 'Microsoft Lens', "
+    "'Genius Scan', any app name, website URL, or promotional text "
+    "added by a scanning app — do NOT transcribe these.\n"
+    "2. If the page contains handwriting, transcribe it faithfully, "
+    "preserving line breaks, numbering, and structure.\n"
+    "3. If text is partially illegible, give your best reading and "
+    "mark uncertain words with [?].\n"
+    "4. Preserve the original layout: headings, bullet points, "
+    "numbered lists, tables, and paragraph breaks.\n"
+    "5. Return ONLY the transcribed text — no commentary or explanations."
+)
+
+
+def _transcribe_page_image(idx, img):
+    """Preprocess one page image and call Gemini. Returns (idx, text); text is None if it failed."""
+    from PIL import ImageEnhance
+
+    try:
+        # Preprocess
+        img = img.convert('RGB')
+        img = ImageEnhance.Contrast(img).enhance(1.8)
+        img = ImageEnhance.Sharpness(img).enhance(2.0)
+
+        # Resize to max 1600px wide to reduce payload size
+        if img.width > MAX_IMAGE_WIDTH:
+            ratio = MAX_IMAGE_WIDTH / img.width
+            img = img.resize(
+                (MAX_IMAGE_WIDTH, int(img.height * ratio)),
+                resample=Image.LANCZOS
+            )
+
+        # Encode as JPEG (much smaller than PNG) in memory and send the raw
+        # bytes; the client packs them into the request without base64 text
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=90, optimize=True)
+        del img
+
+        response = generate_content(model, [
+            VISION_PAGE_PROMPT,
+            {"mime_type": "image/jpeg", "data": buffer.getvalue()}
+        ], priority=PRIORITY_BULK)
+
+        page_text = response.text.strip() if response.text else ""
+        return (idx, page_text)
+
+    except Exception as e:
+        print(f"Error processing page {idx + 1} with Gemini: {e}")
+        return (idx, None)
+
+
+def _transcribe_pdf_pages(pdf_path, page_indices, progress_callback=None):
+    """
+    Rasterize PDF pages and transcribe them with Gemini vision.
+    Returns a dict mapping page index -> transcribed text. Pages that failed
+    (Gemini errors, or rasterization stopping early) map to None, so callers
+    can tell a failed page from a blank one.
+
+    Pages stream through a producer/consumer pipeline: one thread rasterizes a
+    page at a time into a bounded queue and vision workers drain it, so only
+    a fixed window of page bitmaps is ever in memory (see _vision_pipeline_size).
+    Speed optimisations:
+    - 200 DPI, rendered directly at max 1 600 px wide
+    - JPEG encoding (5-10× smaller than PNG)
+    - Pages transcribed IN PARALLEL by several vision workers
+    Quality:
+    - PIL contrast + sharpness enhancement before sending
+    - Gemini prompt explicitly ignores scanner watermarks (CamScanner, etc.)
+    """
+    import queue
+    import threading
+
+    page_indices = list(page_indices)
+    workers, window = _vision_pipeline_size()
+    pages = queue.Queue(maxsize=window)
+    end_of_pages = object()
+    results = {}
+    errors = []
+    lock = threading.Lock()
+    done = 0
+
+    def produce():
+        try:
+            for item in _iter_page_images(pdf_path, page_indices):
+                pages.put(item)  # blocks while the window is full
+        except Exception as e:
+            print(f"Error rasterizing PDF pages: {e}")
+            errors.append(e)
+        finally:
+            for _ in range(workers):
+                pages.put(end_of_pages)
+
+    def consume():
+        nonlocal done
+        while True:
+            item = pages.get()
+            if item is end_of_pages:
+                return
+            # A consumer must keep draining the queue whatever happens to one
+            # page: if they all stopped, the producer would block forever
+            idx = item[0]
+            try:
+                idx, page_text = _transcribe_page_image(*item)
+            except Exception as e:
+                print(f"Error transcribing page {idx + 1}: {e}")
+                page_text = None
+            del item
+            with lock:
+                if page_text or page_text is None:
+                    results[idx] = page_text
+                done += 1
+                finished = done
+            if progress_callback:
+                try:
+                    progress_callback(finished, len(page_indices))
+                except Exception as e:
+                    print(f"Vision progress callback failed: {e}")
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=consume, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors and not done:
+        raise errors[0]
+    if errors:
+        for idx in page_indices:
+            results.setdefault(idx, None)
+    return results
+
+
 def is_tesseract_available():
     """Check if tesseract is installed and available"""
     try:
@@ -208,8 +474,7 @@ def extract_text_from_image(image_path):
     try:
         # Primary method: Use Gemini's vision API for reliable text extraction
         with open(image_path, 'rb') as f:
-            import base64
-            img_data = base64.standard_b64encode(f.read()).decode("utf-8")
+            img_data = f.read()
         
         # Determine image type
         image_type = "image/jpeg"
@@ -220,7 +485,7 @@ def extract_text_from_image(image_path):
         elif image_path.lower().endswith('.webp'):
             image_type = "image/webp"
         
-        response = model.generate_content([
+        response = generate_content(model, [
             (
                 "You are reading a scanned or photographed document/image.\n"
                 "Your task: extract ONLY the actual content created by the document author — "
@@ -238,7 +503,7 @@ def extract_text_from_image(image_path):
                 "mime_type": image_type,
                 "data": img_data,
             }
-        ])
+        ], priority=PRIORITY_SUMMARY)
         
         if response.text.strip():
             return response.text
@@ -287,54 +552,61 @@ def extract_text_from_word(doc_path):
         return f"Failed to extract text from Word document: {str(e)}"
 
 
-def summarize_pdf(pdf_path, user_instruction=None):
+def extract_pages_for_file(file_path, file_type, progress_callback=None):
     """
-    Summarize PDF content with structured formatting using Google Gemini
+    Run the extractor matching file_type ('pdf', 'image' or 'document').
+    Returns a list of (page_number, text); page_number is None for Word
+    documents, which have no fixed pages. Returns [] if nothing was extracted.
     """
-    try:
-        pdf_text = extract_text_from_pdf(pdf_path)
-        
-        if not pdf_text.strip():
-            return "Unable to extract text from this PDF. The document may be image-based or encrypted."
-        
-        # Limit text length for API context window
-        pdf_text = pdf_text[:15000]
-        
-        prompt = f"""You are LearnBuddy. Analyze this material and provide a STYLED summary.
+    if file_type == 'pdf':
+        return extract_pdf_pages(file_path, progress_callback=progress_callback,
+                                 char_budget=PDF_DOCUMENT_CHAR_BUDGET, sample_pages=True)
 
-### FORMATTING RULES:
-1. Use ## for Section Headers.
-2. Use * for Bullet Points.
-3. Use --- to separate sections.
-4. Always put a double line break between paragraphs.
+    if file_type == 'image':
+        text, page_number = extract_text_from_image(file_path), 1
+    else:
+        text, page_number = extract_text_from_word(file_path), None
 
-Document Content:
-{pdf_text}
+    # Extractors report failures as plain strings
+    if not text.strip() or text.startswith(EXTRACTION_FAILURE_PREFIXES):
+        return []
+    return [(page_number, text.strip())]
 
-Please provide:
-## Overview
-(2-3 sentences about the main topic)
 
----
-## Key Concepts
-* (Concept 1)
-* (Concept 2)
+def build_summary_prompt(label, instructions, content_label, text, user_instruction=None):
+    """Summary prompt: static instructions first, then the document and the user's request"""
+    prompt = PromptAssembler(label, SUMMARY_PROMPT_TOKEN_BUDGET)
+    prompt.add('instructions', instructions)
+    prompt.add('document', text, header=f"{content_label}:\n", priority=SECTION_MATERIAL)
+    if user_instruction:
+        prompt.add('request', f"**User's specific request:** {user_instruction}\nMake sure to address this specific request directly in your response.")
+    return prompt.build()
 
----
-## Learning Objectives
-* (Goal 1)
 
----
-## Notable Facts
-* (Fact 1)
-
-If this contains religious content, highlight it warmly. Format in a friendly, helpful tone.
-In the course of summarizing documents, do not give the same response as the general response. Give a more clear, precise and concise explanation with more detailed explanation about the document's content."""
-
-        if user_instruction:
-            prompt += f"\n\n**User's specific request:** {user_instruction}\nMake sure to address this specific request directly in your response."
+def summarize_pdf(pdf_path, user_instruction=None, extracted_text=None, progress_callback=None):
+    """
+    Summarize PDF content with structured formatting using Google Gemini.
+    Pass extracted_text to reuse text that was already extracted (e.g. from the extraction cache).
+    progress_callback(done, total) is called as the steps condensing a long document complete.
+    """
+    try:
+        if extracted_text is None:
+            extracted_text = extract_text_from_pdf(
+                pdf_path, char_budget=PDF_DOCUMENT_CHAR_BUDGET, sample_pages=True
+            )
+        pdf_text = extracted_text
+        
+        if not pdf_text.strip():
+            return "Unable to extract text from this PDF. The document may be image-based or encrypted."
+        
+        # Condense long documents (map-reduce) to fit the API context window
+        pdf_text = condense_text(model, pdf_text, progress_callback=progress_callback)
+        
+        prompt = build_summary_prompt(
+            'summarize_pdf', PDF_SUMMARY_PROMPT, "Document Content", pdf_text, user_instruction
+        )
 
-        response = model.generate_content(prompt)
+        response = generate_content(model, prompt, priority=PRIORITY_SUMMARY)
         result = response.text
         print(f"Successfully summarized PDF using Google Gemini 2.5 Flash")
         return result
@@ -343,49 +615,24 @@ In the course of summarizing documents, do not give the same response as the gen
         return f"I processed the PDF, but encountered an issue generating a detailed summary. Error: {str(e)}"
 
 
-def summarize_image(image_path, user_instruction=None):
+def summarize_image(image_path, user_instruction=None, extracted_text=None, progress_callback=None):
     """
     Extract and analyze text from image with structured formatting using Google Gemini
     """
     try:
-        image_text = extract_text_from_image(image_path)
+        image_text = extracted_text if extracted_text is not None else extract_text_from_image(image_path)
         
         if not image_text.strip():
             return "Unable to extract text from this image. The image may be too blurry or contain no readable text."
         
-        # Limit text length for API context window
-        image_text = image_text[:8000]
+        # Condense long text (map-reduce) to fit the API context window
+        image_text = condense_text(model, image_text, progress_callback=progress_callback)
         
-        prompt = f"""You are LearnBuddy. Analyze this text extracted from an image and provide a STYLED summary.
-
-### FORMATTING RULES:
-1. Use ## for Section Headers.
-2. Use * for Bullet Points.
-3. Use --- to separate sections.
-4. Always put a double line break between paragraphs.
-
-Extracted Text from Image:
-{image_text}
-
-Please provide:
-## Overview
-(2-3 sentences about the main content)
-
----
-## Key Points
-* (Point 1)
-* (Point 2)
-
----
-## Notable Information
-* (Info 1)
+        prompt = build_summary_prompt(
+            'summarize_image', IMAGE_SUMMARY_PROMPT, "Extracted Text from Image", image_text, user_instruction
+        )
 
-Format in a friendly, helpful tone. Be clear and precise in your explanation."""
-
-        if user_instruction:
-            prompt += f"\n\n**User's specific request:** {user_instruction}\nMake sure to address this specific request directly in your response."
-
-        response = model.generate_content(prompt)
+        response = generate_content(model, prompt, priority=PRIORITY_SUMMARY)
         result = response.text
         print(f"Successfully analyzed image using Google Gemini 2.5 Flash")
         return result
@@ -394,144 +641,248 @@ Format in a friendly, helpful tone. Be clear and precise in your explanation."""
         return f"I processed the image, but encountered an issue generating a summary. Error: {str(e)}"
 
 
-def summarize_document(doc_path, user_instruction=None):
+def summarize_document(doc_path, user_instruction=None, extracted_text=None, progress_callback=None):
     """
     Extract and summarize text from Word documents (.docx) with structured formatting
     """
     try:
-        doc_text = extract_text_from_word(doc_path)
+        doc_text = extracted_text if extracted_text is not None else extract_text_from_word(doc_path)
         
         if not doc_text.strip() or "Failed to extract" in doc_text:
             return doc_text if doc_text else "Unable to extract text from this document."
         
-        # Limit text length for API context window
-        doc_text = doc_text[:8000]
+        # Condense long documents (map-reduce) to fit the API context window
+        doc_text = condense_text(model, doc_text, progress_callback=progress_callback)
         
-        prompt = f"""You are LearnBuddy. Analyze this text extracted from a Word document and provide a STYLED summary.
+        prompt = build_summary_prompt(
+            'summarize_document', DOCUMENT_SUMMARY_PROMPT, "Document Content", doc_text, user_instruction
+        )
 
-### FORMATTING RULES:
-1. Use ## for Section Headers.
-2. Use * for Bullet Points.
-3. Use --- to separate sections.
-4. Always put a double line break between paragraphs.
+        response = generate_content(model, prompt, priority=PRIORITY_SUMMARY)
+        result = response.text
+        print(f"Successfully summarized document using Google Gemini 2.5 Flash")
+        return result
+        
+    except Exception as e:
+        return f"I processed the document, but encountered an issue generating a summary. Error: {str(e)}"
 
-Document Content:
-{doc_text}
 
-Please provide:
-## Overview
-(2-3 sentences about the document)
+def _reference_info(user_message, search_results):
+    """Format web search results for the prompt, if they found anything"""
+    if search_results and search_results.get('knowledge'):
+        print(f"Found reference information for: {user_message}")
+        return format_search_results_for_ai(search_results)
+    return ""
 
----
-## Key Concepts
-* (Concept 1)
-* (Concept 2)
 
----
-## Important Topics
-* (Topic 1)
+# Longest a chat answer waits for web reference results, counted from when
+# the search started. Results arriving later are still cached for next time.
+REFERENCE_SEARCH_BUDGET = getattr(settings, 'REFERENCE_SEARCH_BUDGET', 2.5)
 
----
-## Key Takeaways
-* (Takeaway 1)
 
-Format in a friendly, helpful tone. Be clear and precise in your explanation."""
+class ReferenceLookup:
+    """
+    Web reference search for a chat question (Wikipedia etc., for current
+    events/news questions), started as early as possible so it overlaps
+    with the rest of the turn's preparation, and awaited with a deadline.
+    """
+
+    def __init__(self, user_message, budget=REFERENCE_SEARCH_BUDGET):
+        self.user_message = user_message
+        self.budget = budget
+        self.deadline = time.monotonic() + budget
+        self.future = submit_search(user_message) if is_current_event_question(user_message) else None
+
+    def _remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def _info(self):
+        if not self.future.done():
+            print(f"Web search missed its {self.budget}s budget, answering without it")
+            return ""
+        try:
+            return _reference_info(self.user_message, self.future.result())
+        except Exception as e:
+            # Don't break the chat if search fails - just continue without it
+            print(f"Web search error (non-blocking): {e}")
+            return ""
+
+    def result(self):
+        """Formatted reference information, or "" if none arrived in time"""
+        if self.future is None:
+            return ""
+        wait_futures([self.future], timeout=self._remaining())
+        return self._info()
+
+    async def result_async(self):
+        """Async result(); never cancels the search"""
+        if self.future is None:
+            return ""
+        await asyncio.wait([asyncio.wrap_future(self.future)], timeout=self._remaining())
+        return self._info()
+
+
+def build_chat_prompt(user_message, conversation_history=None, material_context=None,
+                      system_context=None, is_christian_topic=False, conversation_summary=None,
+                      current_event_info=None):
+    """
+    Build the full Gemini prompt for a chat turn
+    Includes real-time web search for current events/news questions, unless
+    the caller already looked it up (current_event_info)
+    """
+    # Check if user is asking about current events
+    if current_event_info is None:
+        current_event_info = ReferenceLookup(user_message).result()
+    
+    # Build conversation context
+    conversation_text = ""
+    if conversation_history:
+        # Already limited to the recent messages that fit the history budget
+        for msg in conversation_history:
+            role = msg.get('role', 'user')
+            if 'parts' in msg:
+                content = msg['parts'][0] if msg['parts'] else ""
+            elif 'text' in msg:
+                content = msg['text']
+            elif 'content' in msg:
+                content = msg['content']
+            else:
+                content = str(msg)
+            
+            if role == 'model':
+                role = 'Assistant'
+            elif role == 'assistant':
+                role = 'Assistant'
+            else:
+                role = 'User'
+            
+            if content:
+                conversation_text += f"{role}: {str(content)}\n\n"
+    
+    # Static instructions first so the prefix is identical across turns
+    prompt = PromptAssembler('chat', CHAT_PROMPT_TOKEN_BUDGET)
+    prompt.add('system', system_context or DEFAULT_SYSTEM_PROMPT)
+    prompt.add('summary', conversation_summary, header="Summary of the earlier conversation:\n",
+               priority=SECTION_SUMMARY)
+    prompt.add('history', conversation_text.strip(), header="Previous conversation:\n",
+               priority=SECTION_HISTORY, keep='end')
+    prompt.add('material', material_context, header="STUDY MATERIAL CONTEXT:\n",
+               priority=SECTION_MATERIAL, max_tokens=MATERIAL_CONTEXT_TOKENS)
+    prompt.add('reference', current_event_info.strip(), priority=SECTION_REFERENCE)
+    if is_christian_topic:
+        prompt.add('note', CHRISTIAN_TOPIC_NOTE)
+    prompt.add('question', f"User: {user_message}\nAssistant:")
+    return prompt.build()
 
-        if user_instruction:
-            prompt += f"\n\n**User's specific request:** {user_instruction}\nMake sure to address this specific request directly in your response."
 
-        response = model.generate_content(prompt)
-        result = response.text
-        print(f"Successfully summarized document using Google Gemini 2.5 Flash")
-        return result
-        
-    except Exception as e:
-        return f"I processed the document, but encountered an issue generating a summary. Error: {str(e)}"
 def ask_buddy(user_message, conversation_history=None, material_context=None, 
-              system_context=None, is_christian_topic=False, file=None):
+              system_context=None, is_christian_topic=False, file=None, conversation_summary=None,
+              cache_key=None):
     """
     Get AI response with improved layout using Google Gemini
     Includes real-time web search for current events/news questions
+    Answers are reused from the answer cache when a cache_key is given.
     """
     try:
-        system_message = """You are LearnBuddy. Your personality:
-1. CHRISTIAN TOPICS: Use Scripture references and be warm and encouraging (not necessarily emojis).
-2. EDUCATIONAL CONTENT: Break down complex topics using bullet points and headers.
-3. GENERAL TONE: Friendly and organized. Always use double line breaks between ideas.
-4. MATHEMATICS GENIUS: For mathematical content:
-   - ALWAYS use Unicode superscript/subscript characters directly in your output:
-     * Superscripts: Use ⁰¹²³⁴⁵⁶⁷⁸⁹ instead of writing ^2, ^3, etc.
-     * Subscripts: Use ₀₁₂₃₄₅₆₇₈₉ instead of writing _1, _2, etc.
-     * Examples: x² instead of x^2, a₁ instead of a_1, E=mc² instead of E=mc^2
-   - Use proper mathematical symbols: × or · for multiplication, ÷ for division
-   - Never spell out mathematical operations (not "x times y", not "x squared")
-   - Use mathematical symbols for operators (not words)
-   - For Greek letters use: π, α, β, γ, δ, ε, ζ, η, θ, λ, μ, ν, ξ, ρ, σ, τ, φ, χ, ψ, ω
-   - Break down complex problems with clear steps
-   - Keep output clean and readable with proper mathematical formatting"""
-
-        if system_context:
-            system_message = system_context
-        
-        # Check if user is asking about current events
-        current_event_info = ""
-        if is_current_event_question(user_message):
-            try:
-                # Try to get reference information (Wikipedia for general knowledge)
-                search_results = search_web(user_message, max_results=3)
-                if search_results and search_results.get('knowledge'):
-                    current_event_info = format_search_results_for_ai(search_results)
-                    print(f"Found reference information for: {user_message}")
-            except Exception as e:
-                # Don't break the chat if search fails - just continue without it
-                print(f"Web search error (non-blocking): {e}")
-        
-        # Build conversation context
-        conversation_text = ""
-        if conversation_history:
-            for msg in conversation_history[-12:]:  # Last 12 messages for rich context
-                role = msg.get('role', 'user')
-                if 'parts' in msg:
-                    content = msg['parts'][0] if msg['parts'] else ""
-                elif 'text' in msg:
-                    content = msg['text']
-                elif 'content' in msg:
-                    content = msg['content']
-                else:
-                    content = str(msg)
-                
-                if role == 'model':
-                    role = 'Assistant'
-                elif role == 'assistant':
-                    role = 'Assistant'
-                else:
-                    role = 'User'
-                
-                if content:
-                    conversation_text += f"{role}: {str(content)[:1000]}\n\n"
-        
-        # Build full prompt
-        full_prompt = system_message + "\n\n"
-        
-        if conversation_text:
-            full_prompt += "Previous conversation:\n" + conversation_text + "\n"
-        
-        if material_context:
-            full_prompt += f"STUDY MATERIAL CONTEXT:\n{material_context[:4000]}\n\n"
-        
-        if current_event_info:
-            full_prompt += current_event_info + "\n"
+        if cache_key:
+            cached = get_cached_answer(cache_key)
+            if cached is not None:
+                return cached
+
+        full_prompt = build_chat_prompt(
+            user_message,
+            conversation_history=conversation_history,
+            material_context=material_context,
+            system_context=system_context,
+            is_christian_topic=is_christian_topic,
+            conversation_summary=conversation_summary,
+        )
+        response = generate_content(model, full_prompt, priority=PRIORITY_INTERACTIVE)
+        result = response.text
+        if cache_key and result:
+            cache_answer(cache_key, result)
+        return result
         
+    except Exception as e:
         if is_christian_topic:
-            full_prompt += "The user is asking about Christian/Biblical topics. Respond with warmth and Scripture references using clear headers.\n\n"
-        
-        full_prompt += f"User: {user_message}\nAssistant:"
-        
-        response = model.generate_content(full_prompt)
+            return "I'm experiencing a technical issue. Please share a specific verse you'd like to discuss, or feel free to rephrase your question."
+        return f"I'm here to help, but I encountered a technical issue. (Error: {str(e)})"
+
+
+async def build_chat_prompt_async(user_message, reference_lookup=None, **kwargs):
+    """
+    build_chat_prompt for async views: the web search does not block the
+    event loop. Pass the turn's ReferenceLookup if it was started earlier.
+    """
+    if reference_lookup is None:
+        reference_lookup = ReferenceLookup(user_message)
+    current_event_info = await reference_lookup.result_async()
+    return build_chat_prompt(user_message, current_event_info=current_event_info, **kwargs)
+
+
+async def ask_buddy_async(user_message, conversation_history=None, material_context=None,
+                          system_context=None, is_christian_topic=False, conversation_summary=None,
+                          cache_key=None, reference_lookup=None):
+    """ask_buddy for async views, using the async Gemini client"""
+    try:
+        if cache_key:
+            cached = get_cached_answer(cache_key)
+            if cached is not None:
+                return cached
+
+        full_prompt = await build_chat_prompt_async(
+            user_message,
+            conversation_history=conversation_history,
+            material_context=material_context,
+            system_context=system_context,
+            is_christian_topic=is_christian_topic,
+            conversation_summary=conversation_summary,
+            reference_lookup=reference_lookup,
+        )
+        response = await generate_content_async(model, full_prompt, priority=PRIORITY_INTERACTIVE)
         result = response.text
+        if cache_key and result:
+            cache_answer(cache_key, result)
         return result
-        
+
     except Exception as e:
         if is_christian_topic:
             return "I'm experiencing a technical issue. Please share a specific verse you'd like to discuss, or feel free to rephrase your question."
-        return f"I'm here to help, but I encountered a technical issue. (Error: {str(e)})"
\ No newline at end of file
+        return f"I'm here to help, but I encountered a technical issue. (Error: {str(e)})"
+
+
+async def stream_buddy_async(user_message, conversation_history=None, material_context=None,
+                             system_context=None, is_christian_topic=False, conversation_summary=None,
+                             cache_key=None, reference_lookup=None):
+    """
+    Same answer as ask_buddy, yielded as text pieces while Gemini generates it.
+    Errors are raised rather than turned into a reply, so the caller can tell
+    a partial answer from a failed one. Only complete answers are cached.
+    """
+    if cache_key:
+        cached = get_cached_answer(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    full_prompt = await build_chat_prompt_async(
+        user_message,
+        conversation_history=conversation_history,
+        material_context=material_context,
+        system_context=system_context,
+        is_christian_topic=is_christian_topic,
+        conversation_summary=conversation_summary,
+        reference_lookup=reference_lookup,
+    )
+    pieces = []
+    async for chunk in stream_content_async(model, full_prompt, priority=PRIORITY_INTERACTIVE):
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. only finish/safety metadata)
+            continue
+        if text:
+            pieces.append(text)
+            yield text
+    if cache_key and pieces:
+        cache_answer(cache_key, ''.join(pieces))
@@ -0,0 +1,56 @@
+"""
+Cache of chat answers for standalone questions.
+
+Students studying the same material ask the same questions. An answer that
+does not depend on conversation history is fully determined by the question,
+the material and the prompt templates, so it is cached under a key built
+from exactly those and reused instead of calling Gemini again.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+
+from .intents import is_time_sensitive
+from .memory_cache import MemoryCache
+from .prompts import PROMPT_VERSION
+
+answer_cache = MemoryCache(
+    max_bytes=getattr(settings, 'ANSWER_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+    ttl=getattr(settings, 'ANSWER_CACHE_TTL', 24 * 60 * 60),
+)
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s?!.]+$')
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    question = _WHITESPACE.sub(' ', question.lower()).strip()
+    return _TRAILING_PUNCTUATION.sub('', question)
+
+
+def answer_cache_key(question, material=None):
+    """
+    Cache key for a standalone question about material (or no material), or
+    None if the answer should not be cached because it depends on when it
+    is asked (news, prices, "today" ...). Reference lookups for other
+    questions return the same facts for a day, so those answers are cached.
+    """
+    if is_time_sensitive(question):
+        return None
+    if material is None:
+        material_key = ''
+    else:
+        # Materials stored before content hashing fall back to their id
+        material_key = material.content_hash or f"material-{material.pk}"
+    raw = f"{PROMPT_VERSION}\0{material_key}\0{normalize_question(question)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def get_cached_answer(key):
+    return answer_cache.get(key)
+
+
+def cache_answer(key, answer):
+    answer_cache.set(key, answer)
@@ -0,0 +1,67 @@
+"""
+Split extracted material text into MaterialChunk rows.
+
+Chunks never cross page boundaries, so every chunk keeps its page number,
+and prefer to break between paragraphs. Offsets refer to the material's
+full extracted text, i.e. the pages joined with PAGE_SEPARATOR.
+"""
+import re
+
+from django.db import transaction
+
+from .extraction_cache import PAGE_SEPARATOR
+from .models import MaterialChunk
+
+CHUNK_CHARS = 1500
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def _split_spans(text, chunk_chars):
+    """Yield (start, end) spans of at most chunk_chars covering text, cut at paragraph breaks when possible"""
+    boundaries = [m.end() for m in _PARAGRAPH_BREAK.finditer(text)] + [len(text)]
+    start = 0
+    end = 0
+    for boundary in boundaries:
+        if boundary - start <= chunk_chars:
+            end = boundary
+            continue
+        if end > start:
+            yield start, end
+            start = end
+        # A single paragraph larger than a chunk is hard-split
+        while boundary - start > chunk_chars:
+            yield start, start + chunk_chars
+            start += chunk_chars
+        end = boundary
+    if end > start:
+        yield start, end
+
+
+def iter_page_chunks(pages, chunk_chars=CHUNK_CHARS):
+    """Yield (page_number, text, char_start, char_end) for (page_number, text) pages"""
+    offset = 0
+    for page_number, page_text in pages:
+        for start, end in _split_spans(page_text, chunk_chars):
+            if page_text[start:end].strip():
+                yield page_number, page_text[start:end], offset + start, offset + end
+        offset += len(page_text) + len(PAGE_SEPARATOR)
+
+
+def store_material_chunks(material, pages):
+    """Replace the material's chunks with chunks of the given pages, in one bulk insert"""
+    chunks = [
+        MaterialChunk(
+            material=material,
+            page_number=page_number,
+            ordinal=ordinal,
+            text=text,
+            char_start=char_start,
+            char_end=char_end,
+        )
+        for ordinal, (page_number, text, char_start, char_end) in enumerate(iter_page_chunks(pages))
+    ]
+    with transaction.atomic():
+        MaterialChunk.objects.filter(material=material).delete()
+        MaterialChunk.objects.bulk_create(chunks, batch_size=500)
+    return chunks
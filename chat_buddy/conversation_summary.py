@@ -0,0 +1,111 @@
+"""
+Rolling per-session conversation summaries.
+
+Every few turns, the messages that have left the recent window are folded
+into ChatSession.summary in the background. A chat prompt then carries the
+summary plus the messages after it, so its size stays bounded however long
+the session grows.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from .ai_service import model
+from .llm_scheduler import generate_content, PRIORITY_SUMMARY
+from .models import ChatSession
+from .tokens import chars_for_tokens
+
+# Fold older messages into the summary once this many turns are unsummarized
+SUMMARY_EVERY_TURNS = getattr(settings, 'SESSION_SUMMARY_EVERY_TURNS', 5)
+# Newest messages always left out of the summary; the prompt sends them verbatim
+KEEP_RECENT_MESSAGES = 6
+SUMMARY_TOKENS = 400
+# Longest slice of a single message fed to a summary update
+MESSAGE_CHARS = 2000
+
+SUMMARY_PROMPT = """You maintain a running summary of a tutoring conversation between a student and LearnBuddy, a study assistant.
+
+Update the summary with the new messages. Keep the topics covered, questions asked, key explanations, answers and results, and anything the student struggled with or asked to remember. Drop greetings and small talk.
+Write compact bullet points, at most {max_words} words in total. Output only the updated summary.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='session-summary')
+# Sessions with an update queued or running in this process
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _format_messages(messages):
+    lines = []
+    for msg in messages:
+        role = 'Assistant' if msg.role in ('assistant', 'model') else 'User'
+        lines.append(f"{role}: {msg.content[:MESSAGE_CHARS]}")
+    return "\n\n".join(lines)
+
+
+def update_session_summary(session_id):
+    """Fold the session's messages that have left the recent window into its summary"""
+    session = ChatSession.objects.only('summary', 'summarized_through').get(pk=session_id)
+    unsummarized = list(session.messages
+                        .filter(id__gt=session.summarized_through)
+                        .order_by('id')
+                        .only('id', 'role', 'content'))
+    to_fold = unsummarized[:-KEEP_RECENT_MESSAGES]
+    if not to_fold:
+        return False
+
+    prompt = SUMMARY_PROMPT.format(
+        max_words=SUMMARY_TOKENS * 3 // 4,
+        summary=session.summary or "(none yet)",
+        messages=_format_messages(to_fold),
+    )
+    response = generate_content(model, prompt, priority=PRIORITY_SUMMARY)
+    summary = (response.text or '').strip()[:chars_for_tokens(SUMMARY_TOKENS * 2)]
+    if not summary:
+        return False
+
+    # Only apply if no other update advanced the summary meanwhile
+    return bool(ChatSession.objects.filter(
+        pk=session_id,
+        summarized_through=session.summarized_through,
+    ).update(summary=summary, summarized_through=to_fold[-1].id))
+
+
+def _run_update(session_id):
+    try:
+        update_session_summary(session_id)
+    except Exception as e:
+        print(f"Session summary update failed for session {session_id}: {e}")
+    finally:
+        with _pending_lock:
+            _pending.discard(session_id)
+        connection.close()
+
+
+def _summary_due(unsummarized):
+    return unsummarized >= KEEP_RECENT_MESSAGES + 2 * SUMMARY_EVERY_TURNS
+
+
+def _submit_update(session_id):
+    with _pending_lock:
+        if session_id in _pending:
+            return False
+        _pending.add(session_id)
+    _executor.submit(_run_update, session_id)
+    return True
+
+
+def schedule_summary_update(session):
+    """Queue a background summary update if enough turns have piled up since the last one"""
+    unsummarized = session.messages.filter(id__gt=session.summarized_through).count()
+    if not _summary_due(unsummarized):
+        return False
+    return _submit_update(session.pk)
+
@@ -0,0 +1,120 @@
+import hashlib
+import os
+
+from django.db import IntegrityError
+
+from .files import mapped_file
+from .models import ExtractedText
+
+# Bump the version for a file type whenever its extractor changes output,
+# so stale cached pages are ignored instead of served.
+EXTRACTOR_VERSIONS = {
+    'pdf': 6,
+    'image': 2,
+    'document': 2,
+}
+
+# Extracted pages are joined with a blank line into one document string
+PAGE_SEPARATOR = "\n\n"
+
+
+class ExtractedPages(list):
+    """(page_number, text) pages, plus the numbers of pages that failed to extract"""
+
+    def __init__(self, pages=(), failed_pages=()):
+        super().__init__(pages)
+        self.failed_pages = list(failed_pages)
+
+
+def hash_uploaded_file(uploaded_file):
+    """Return the SHA-256 hex digest of an uploaded file's bytes"""
+    # Large uploads are already spooled to disk by Django; hash them in place
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        return hash_file(uploaded_file.temporary_file_path())
+
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def hash_file(file_path):
+    """Return the SHA-256 hex digest of a file on disk"""
+    if os.path.getsize(file_path) == 0:
+        return hashlib.sha256(b'').hexdigest()
+    with mapped_file(file_path) as mapped:
+        return hashlib.sha256(mapped).hexdigest()
+
+
+def _pages_to_entry(pages):
+    """Pack (page_number, text) pages into joined text + [page_number, start_offset] pairs"""
+    offsets = []
+    position = 0
+    for page_number, page_text in pages:
+        offsets.append([page_number, position])
+        position += len(page_text) + len(PAGE_SEPARATOR)
+    return PAGE_SEPARATOR.join(page_text for _, page_text in pages), offsets
+
+
+def _entry_to_pages(text, offsets):
+    """Inverse of _pages_to_entry"""
+    pages = []
+    for i, (page_number, start) in enumerate(offsets):
+        end = offsets[i + 1][1] - len(PAGE_SEPARATOR) if i + 1 < len(offsets) else len(text)
+        pages.append((page_number, text[start:end]))
+    return pages
+
+
+def get_cached_pages(content_hash, file_type):
+    """Get previously extracted (page_number, text) pages for this content, or None"""
+    version = EXTRACTOR_VERSIONS.get(file_type)
+    if not content_hash or version is None:
+        return None
+    entry = (ExtractedText.objects
+             .filter(content_hash=content_hash, file_type=file_type, extractor_version=version)
+             .only('text', 'page_offsets')
+             .first())
+    return _entry_to_pages(entry.text, entry.page_offsets) if entry else None
+
+
+def cache_pages(content_hash, file_type, pages):
+    """
+    Store extracted pages for this content. Empty extractions, and partial
+    ones (some pages failed), are not cached, so they are retried next time.
+    """
+    version = EXTRACTOR_VERSIONS.get(file_type)
+    if not content_hash or version is None or not pages:
+        return
+    failed_pages = getattr(pages, 'failed_pages', None)
+    if failed_pages:
+        print(f"Not caching extraction of {content_hash[:12]}: page(s) {failed_pages} failed")
+        return
+    text, offsets = _pages_to_entry(pages)
+    try:
+        ExtractedText.objects.create(
+            content_hash=content_hash,
+            file_type=file_type,
+            extractor_version=version,
+            text=text,
+            page_offsets=offsets,
+        )
+    except IntegrityError:
+        # Another request extracted the same file concurrently
+        pass
+
+
+def get_or_extract_pages(content_hash, file_type, extract):
+    """
+    Return extracted (page_number, text) pages for the content, running
+    extract() only on a cache miss. extract is a zero-argument callable
+    that performs the real extraction and returns pages.
+    """
+    cached = get_cached_pages(content_hash, file_type)
+    if cached is not None:
+        print(f"Extraction cache hit for {file_type} {content_hash[:12]}")
+        return cached
+
+    pages = extract()
+    cache_pages(content_hash, file_type, pages)
+    return pages
@@ -0,0 +1,20 @@
+import io
+import mmap
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def mapped_file(path):
+    """
+    Open a file read-only and memory-map it, so readers (hashing, PyPDF2)
+    page it in from the OS cache instead of copying it into Python buffers.
+    Yields a seekable bytes-like object.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            yield io.BytesIO(b'')
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
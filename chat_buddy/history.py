@@ -0,0 +1,72 @@
+"""
+Conversation history for chat prompts.
+
+Only the newest messages of a session are read, newest first through the
+(session, created_at) index, and packed into the prompt against a token
+budget instead of fixed message and character counts.
+"""
+from django.conf import settings
+
+from .tokens import estimate_tokens, chars_for_tokens
+
+# Total tokens of history sent with a chat turn
+HISTORY_TOKEN_BUDGET = getattr(settings, 'HISTORY_TOKEN_BUDGET', 3000)
+# No single message (e.g. a long upload summary) may take more than this
+HISTORY_MESSAGE_TOKENS = getattr(settings, 'HISTORY_MESSAGE_TOKENS', 800)
+# Upper bound on rows read, whatever their size
+HISTORY_MAX_MESSAGES = 50
+
+# Messages recorded for a file upload rather than typed in the chat
+UPLOAD_BUBBLE_PREFIX = "\U0001f4ce "
+UPLOAD_SUMMARY_PREFIX = "[Uploaded file:"
+
+
+def is_upload_message(content):
+    """True for the user bubble and summary message recorded for an upload"""
+    return content.startswith((UPLOAD_BUBBLE_PREFIX, UPLOAD_SUMMARY_PREFIX))
+
+
+def _recent_messages(session, after_id):
+    return (session.messages
+            .filter(id__gt=after_id)
+            .order_by('-created_at', '-id')
+            .only('role', 'content')[:HISTORY_MAX_MESSAGES])
+
+
+def _pack_history(recent, token_budget, message_tokens):
+    """Keep newest-first messages until token_budget is spent; return them oldest first"""
+    history = []
+    used_tokens = 0
+    for msg in recent:
+        content = msg.content
+        if estimate_tokens(content) > message_tokens:
+            content = content[:chars_for_tokens(message_tokens)]
+        tokens = estimate_tokens(content)
+        if used_tokens + tokens > token_budget:
+            break
+        used_tokens += tokens
+        history.append({
+            "role": msg.role if msg.role in ['user', 'assistant'] else 'user',
+            "parts": [content],
+            "text": content
+        })
+
+    history.reverse()
+    return history
+
+
+def load_recent_history(session, token_budget=HISTORY_TOKEN_BUDGET,
+                        message_tokens=HISTORY_MESSAGE_TOKENS, after_id=0):
+    """
+    Return the session's most recent messages that fit in token_budget, oldest
+    first, as conversation_history entries for ask_buddy. Messages up to
+    after_id (already covered by the session summary) are skipped.
+    """
+    return _pack_history(_recent_messages(session, after_id), token_budget, message_tokens)
+
+
+async def load_recent_history_async(session, token_budget=HISTORY_TOKEN_BUDGET,
+                                    message_tokens=HISTORY_MESSAGE_TOKENS, after_id=0):
+    """Async load_recent_history"""
+    recent = [msg async for msg in _recent_messages(session, after_id)]
+    return _pack_history(recent, token_budget, message_tokens)
@@ -0,0 +1,101 @@
+"""
+Shared HTTP client for outbound reference lookups.
+
+All web_service sources fetch through http_get, so they share one set of
+keep-alive connection pools (one pool per host): repeated lookups to
+wikipedia.org, wikidata.org etc. reuse open TLS connections instead of
+paying DNS, TCP and TLS setup on every request. Idempotent GETs are retried
+with backoff on connection errors and 429/5xx responses, and the
+User-Agent and timeout policy live here rather than in every helper.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# One identifying User-Agent for every source (MusicBrainz and Wikimedia
+# require a contact in it)
+USER_AGENT = getattr(
+    settings, 'OUTBOUND_USER_AGENT',
+    'LearnBuddy/1.0 (Educational AI Assistant; +https://learnbuddy.app; learnbuddy@example.com)',
+)
+# Seconds to establish a connection, and default seconds to wait for a response
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+
+# Hosts kept in the pool manager, and connections kept open per host. The
+# per-host size matches the web search source pool, so no thread waits for
+# a connection.
+POOL_HOSTS = 16
+POOL_CONNECTIONS_PER_HOST = 32
+
+RETRY = Retry(
+    total=2,
+    connect=2,
+    read=1,
+    status=2,
+    backoff_factor=0.25,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({'GET', 'HEAD'}),
+    # A long Retry-After would hold the thread far past the caller's deadline
+    respect_retry_after_header=False,
+    raise_on_status=False,
+)
+
+_adapter = HTTPAdapter(
+    pool_connections=POOL_HOSTS,
+    pool_maxsize=POOL_CONNECTIONS_PER_HOST,
+    max_retries=RETRY,
+)
+# Sessions keep cookies and are not safe to share between threads; each
+# thread gets its own, all mounted on the one adapter that owns the pools.
+_local = threading.local()
+
+
+def get_session():
+    """This thread's requests.Session, backed by the shared connection pools"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers['User-Agent'] = USER_AGENT
+        session.mount('https://', _adapter)
+        session.mount('http://', _adapter)
+        _local.session = session
+    return session
+
+
+def http_get(url, params=None, headers=None, timeout=READ_TIMEOUT, **kwargs):
+    """GET url through the shared pools; timeout bounds each wait for the server, in seconds"""
+    return get_session().get(
+        url, params=params, headers=headers,
+        timeout=(min(CONNECT_TIMEOUT, timeout), timeout), **kwargs
+    )
+
+
+def pool_stats():
+    """Per-host connection counts, plus the overall connection reuse ratio"""
+    hosts = {}
+    total_requests = 0
+    total_connections = 0
+    pools = _adapter.poolmanager.pools
+    with pools.lock:
+        host_pools = list(pools._container.items())
+    for key, pool in host_pools:
+        requests_made = pool.num_requests
+        connections = pool.num_connections
+        total_requests += requests_made
+        total_connections += connections
+        hosts[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+            'requests': requests_made,
+            'connections_opened': connections,
+            # The queue holds None placeholders for connections not yet opened
+            'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+        }
+    return {
+        'requests': total_requests,
+        'connections_opened': total_connections,
+        'reuse_ratio': round(1 - total_connections / total_requests, 3) if total_requests else None,
+        'hosts': hosts,
+    }
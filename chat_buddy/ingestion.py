@@ -0,0 +1,246 @@
+"""
+Background ingestion of uploaded study materials.
+
+Uploads only store the file and enqueue an IngestionJob; the
+process_ingestion_jobs management command claims jobs and runs
+extraction + summarization outside the web request.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .ai_service import (
+    extract_pages_for_file, join_pages, summarize_pdf, summarize_image, summarize_document,
+)
+from .chunks import store_material_chunks
+from .extraction_cache import get_or_extract_pages
+from .history import UPLOAD_BUBBLE_PREFIX, UPLOAD_SUMMARY_PREFIX
+from .models import IngestionJob, ChatMessage, ChatSession, StudyMaterial
+from .retrieval import build_material_index
+
+# A running job whose worker has not reported progress for this long is
+# assumed dead and handed to another worker.
+STALE_JOB_TIMEOUT = timedelta(minutes=15)
+MAX_ATTEMPTS = 3
+
+# Progress (percent) reported at each stage of a job
+EXTRACTION_START = 5
+EXTRACTION_END = 70
+SUMMARY_START = 75
+SUMMARY_END = 95
+
+
+def enqueue_ingestion(study_material, session=None, user_instruction=''):
+    """Create a queued job for a freshly stored StudyMaterial"""
+    return IngestionJob.objects.create(
+        user=study_material.user,
+        study_material=study_material,
+        session=session,
+        user_instruction=user_instruction,
+    )
+
+
+def accept_upload(user, uploaded_file, file_type, content_hash, session_id=None, user_message=''):
+    """
+    Store an upload and queue its ingestion in one transaction: the
+    StudyMaterial, its chat session (the user's session_id if it exists,
+    else a new one), the user's upload message and the IngestionJob.
+    Returns (study_material, session, job).
+    """
+    with transaction.atomic():
+        study_material = StudyMaterial.objects.create(
+            user=user,
+            file=uploaded_file,
+            file_type=file_type,
+            content_hash=content_hash,
+            original_name=uploaded_file.name,
+        )
+
+        session = None
+        if session_id:
+            try:
+                session = ChatSession.objects.get(id=session_id, user=user)
+            except (ChatSession.DoesNotExist, ValueError):
+                session = None
+        if session:
+            session.study_material = study_material
+            session.save(update_fields=['study_material'])
+        else:
+            session = ChatSession.objects.create(user=user, study_material=study_material)
+
+        # The upload message appears in conversation history like any other
+        user_bubble = f"{UPLOAD_BUBBLE_PREFIX}{uploaded_file.name}"
+        if user_message:
+            user_bubble += f"\n\n{user_message}"
+        ChatMessage.objects.create(session=session, role='user', content=user_bubble)
+
+        job = enqueue_ingestion(study_material, session=session, user_instruction=user_message)
+    return study_material, session, job
+
+
+def extract_material(material, progress_callback=None):
+    """
+    Extract a stored material's text (reusing the extraction cache), persist
+    it as MaterialChunk rows and index them for retrieval. Returns the
+    extracted (page_number, text) pages.
+    """
+    file_path = material.file.path
+    pages = get_or_extract_pages(
+        material.content_hash, material.file_type,
+        lambda: extract_pages_for_file(file_path, material.file_type, progress_callback=progress_callback)
+    )
+    chunks = store_material_chunks(material, pages)
+    build_material_index(material, chunks)
+    return pages
+
+
+def requeue_stale_jobs():
+    """
+    Return jobs held by crashed workers to the queue. A job that has used up
+    its attempts is marked failed instead: it most likely crashed the worker
+    itself (out of memory, a segfault in poppler) and would do so again.
+    """
+    now = timezone.now()
+    stale = IngestionJob.objects.filter(
+        status=IngestionJob.STATUS_RUNNING,
+        locked_at__lt=now - STALE_JOB_TIMEOUT,
+    )
+    stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=IngestionJob.STATUS_FAILED, stage='failed',
+        error=f"Processing stopped responding on all {MAX_ATTEMPTS} attempts",
+        finished_at=now, updated_at=now,
+    )
+    return stale.filter(attempts__lt=MAX_ATTEMPTS).update(
+        status=IngestionJob.STATUS_QUEUED, worker_id='', updated_at=now
+    )
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically claim the oldest queued job for this worker, or return None.
+
+    Claiming is a conditional UPDATE (status must still be 'queued'), so when
+    several workers race for the same row exactly one of them wins. This works
+    on SQLite as well as PostgreSQL, unlike SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    candidates = (IngestionJob.objects
+                  .filter(status=IngestionJob.STATUS_QUEUED)
+                  .order_by('created_at')
+                  .values_list('id', flat=True)[:10])
+
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = IngestionJob.objects.filter(
+            pk=job_id,
+            status=IngestionJob.STATUS_QUEUED,
+        ).update(
+            status=IngestionJob.STATUS_RUNNING,
+            worker_id=worker_id,
+            locked_at=now,
+            updated_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return IngestionJob.objects.select_related('study_material', 'session').get(pk=job_id)
+
+    return None
+
+
+def _owned(job):
+    """The job's row, as long as this worker still holds it"""
+    return IngestionJob.objects.filter(
+        pk=job.pk, status=IngestionJob.STATUS_RUNNING, worker_id=job.worker_id
+    )
+
+
+def update_progress(job, progress, stage):
+    """
+    Record progress and refresh the lock so the job is not considered stale.
+    Returns False if the job was requeued and handed to another worker.
+    """
+    now = timezone.now()
+    owned = _owned(job).update(progress=progress, stage=stage, locked_at=now, updated_at=now)
+    job.progress = progress
+    job.stage = stage
+    return bool(owned)
+
+
+def run_job(job):
+    """Extract and summarize the job's material, then post the summary to its session"""
+    material = job.study_material
+    file_type = material.file_type
+    file_path = material.file.path
+
+    update_progress(job, EXTRACTION_START, 'extracting')
+
+    def on_pages_done(done, total):
+        # Called from several vision workers, which may report out of order
+        span = EXTRACTION_END - EXTRACTION_START
+        update_progress(job, max(job.progress, EXTRACTION_START + span * done // max(total, 1)), 'extracting')
+
+    extracted_text = join_pages(extract_material(material, progress_callback=on_pages_done))
+
+    update_progress(job, SUMMARY_START, 'summarizing')
+
+    def on_summary_steps_done(done, total):
+        # Long documents are condensed in several levels of calls; keep the
+        # lock fresh through all of them without moving progress backwards
+        span = SUMMARY_END - SUMMARY_START
+        update_progress(job, max(job.progress, SUMMARY_START + span * done // max(total, 1)), 'summarizing')
+
+    instruction = job.user_instruction or None
+    if file_type == 'pdf':
+        summarize = summarize_pdf
+    elif file_type == 'image':
+        summarize = summarize_image
+    else:  # document (Word documents)
+        summarize = summarize_document
+    summary = summarize(file_path, user_instruction=instruction, extracted_text=extracted_text,
+                        progress_callback=on_summary_steps_done)
+
+    # The summary, its chat message and the job's completion are committed
+    # together, and only by the worker that still holds the job: if it was
+    # requeued as stale meanwhile, the new worker posts the summary instead
+    with transaction.atomic():
+        now = timezone.now()
+        completed = _owned(job).update(
+            status=IngestionJob.STATUS_DONE, stage='done', progress=100,
+            error='', finished_at=now, updated_at=now,
+        )
+        if not completed:
+            print(f"Ingestion job {job.pk} was handed to another worker, dropping this result")
+            return
+
+        material.summary = summary
+        material.save(update_fields=['summary'])
+
+        # Store the upload event as an assistant message so it appears in
+        # conversation history for future turns.
+        if job.session_id:
+            ChatMessage.objects.create(
+                session_id=job.session_id,
+                role='assistant',
+                content=f"{UPLOAD_SUMMARY_PREFIX} {material.display_name}]\n\nSummary:\n{summary}"
+            )
+
+
+def process_job(job):
+    """Run a claimed job, retrying it later or marking it failed on error"""
+    try:
+        run_job(job)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        now = timezone.now()
+        # A job requeued as stale belongs to its new worker now; leave it be
+        if job.attempts < MAX_ATTEMPTS:
+            _owned(job).update(
+                status=IngestionJob.STATUS_QUEUED, worker_id='', error=str(e), updated_at=now
+            )
+        else:
+            _owned(job).update(
+                status=IngestionJob.STATUS_FAILED, stage='failed', error=str(e),
+                finished_at=now, updated_at=now,
+            )
@@ -0,0 +1,203 @@
+"""
+Single-pass intent routing for chat messages.
+
+A message is tokenized once and run through one token-level Aho-Corasick
+automaton holding every keyword and phrase of every intent, so all intent
+flags come out of a single scan. Matching whole tokens gives word
+boundaries for free: "now" no longer matches "know", nor "war" "software".
+
+Trivial messages (greetings, thanks, inappropriate requests) get a local
+reply, so they skip web search and Gemini entirely.
+"""
+import string
+from collections import deque
+from datetime import date
+from functools import lru_cache
+
+INTENT_CHRISTIAN = 'christian'
+INTENT_INAPPROPRIATE = 'inappropriate'
+# Questions whose answer changes over time (news, prices, dates ...)
+INTENT_TIME_SENSITIVE = 'time_sensitive'
+# Questions about specific people, places or topics that a reference lookup helps with
+INTENT_REFERENCE = 'reference'
+
+_this_year = date.today().year
+
+INTENT_PHRASES = {
+    INTENT_CHRISTIAN: [
+        'god', 'jesus', 'christ', 'bible', 'bibles', 'biblical', 'scripture', 'scriptures',
+        'prayer', 'prayers', 'pray', 'faith', 'christian', 'christians', 'christianity',
+        'church', 'churches', 'lord', 'salvation', 'gospel', 'gospels', 'holy spirit',
+        'worship',
+    ],
+    INTENT_INAPPROPRIATE: [
+        'sex', 'sexy', 'porn', 'porno', 'pornography', 'pornographic', 'nsfw',
+        'nude', 'nudes', 'nudity', 'sexually explicit', 'explicit content',
+        'explicit images', 'explicit pictures', 'explicit photos', 'explicit videos',
+    ],
+    INTENT_TIME_SENSITIVE: [
+        'now', 'today', 'tonight', 'current', 'currently', 'latest', 'recent', 'recently',
+        'happening', 'news', 'breaking', 'this week', 'this month', 'this year', 'update on',
+        'election', 'elections', 'weather', 'stock', 'stocks', 'crypto', 'price of',
+        'covid', 'pandemic',
+        # Dates ("may" is left out: it is far more often the verb)
+        'january', 'february', 'march', 'april', 'june', 'july', 'august',
+        'september', 'october', 'november', 'december',
+    ] + [str(year) for year in range(_this_year - 3, _this_year + 2)],
+    INTENT_REFERENCE: [
+        'situation', 'event', 'incident', 'crisis', 'war', 'conflict',
+        'who is', 'who was', 'who are', "who's",
+        'what is', "what's", 'what are',
+        'tell me about', 'explain', 'describe',
+        'biography', 'history of', 'origin of',
+        'when was', 'where is', 'how did',
+        'discography', 'songs', 'albums', 'minister', 'pastor', 'artist',
+        'singer', 'musician', 'actor', 'politician', 'author', 'founder',
+    ],
+}
+
+# A message made only of these words (with at least one from the first set)
+# is a greeting or a thank-you and nothing more
+GREETING_WORDS = frozenset("""
+hi hello hey heya hiya howdy yo greetings hallo morning afternoon evening
+""".split())
+THANKS_WORDS = frozenset("""
+thanks thank thx ty cheers appreciate appreciated
+""".split())
+SMALL_TALK_WORDS = frozenset("""
+good there buddy learnbuddy you so very much a lot it ok okay great again
+thats helpful all for the
+""".split())
+# Longest message that can still be a plain greeting or thank-you
+SMALL_TALK_MAX_TOKENS = 8
+
+GREETING_RESPONSE = "Hello! I'm LearnBuddy, your study assistant. Upload a PDF, image or document, or ask me any study question, and we'll get started."
+THANKS_RESPONSE = "You're welcome! Let me know if there's anything else you'd like to study or go over again."
+INAPPROPRIATE_RESPONSE = "I'm designed to be a study assistant focused on educational content. I'd be happy to help you with academic materials, study questions, or discussions about faith and biblical principles. What can I help you learn about today?"
+
+# Punctuation separates words, apostrophes are dropped ("who's" -> "whos").
+# str.translate + split is several times faster than a tokenizing regex.
+_TOKEN_TABLE = str.maketrans(
+    {char: ' ' for char in string.punctuation if char != "'"} | {"'": None, '’': None}
+)
+
+
+def tokenize(text):
+    """Lowercased word tokens of text"""
+    return text.lower().translate(_TOKEN_TABLE).split()
+
+
+class PhraseAutomaton:
+    """Aho-Corasick automaton over word tokens: finds every phrase in one pass"""
+
+    def __init__(self, phrases):
+        """phrases maps a label to the phrases that signal it"""
+        self.goto = [{}]
+        self.fail = [0]
+        outputs = [set()]
+        for label, label_phrases in phrases.items():
+            for phrase in label_phrases:
+                state = 0
+                for token in tokenize(phrase):
+                    if token not in self.goto[state]:
+                        self.goto.append({})
+                        self.fail.append(0)
+                        outputs.append(set())
+                        self.goto[state][token] = len(self.goto) - 1
+                    state = self.goto[state][token]
+                outputs[state].add(label)
+
+        # Breadth-first, so a state's failure target is final before its children need it
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in self.goto[state].items():
+                queue.append(child)
+                target = self.fail[state]
+                while target and token not in self.goto[target]:
+                    target = self.fail[target]
+                self.fail[child] = self.goto[target].get(token, 0)
+                outputs[child] |= outputs[self.fail[child]]
+        self.output = [frozenset(labels) for labels in outputs]
+
+    def labels(self, tokens):
+        """Labels of every phrase occurring in tokens"""
+        found = set()
+        state = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for token in tokens:
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+_automaton = PhraseAutomaton(INTENT_PHRASES)
+
+
+class Route:
+    """Intents found in a chat message, and the local reply if it needs no model"""
+
+    def __init__(self, intents, reply=None):
+        self.intents = frozenset(intents)
+        self.reply = reply
+
+    @property
+    def is_christian_topic(self):
+        return INTENT_CHRISTIAN in self.intents
+
+    @property
+    def is_inappropriate(self):
+        return INTENT_INAPPROPRIATE in self.intents
+
+    @property
+    def is_time_sensitive(self):
+        return INTENT_TIME_SENSITIVE in self.intents
+
+    @property
+    def needs_lookup(self):
+        """Whether a web reference search is likely to improve the answer"""
+        return INTENT_TIME_SENSITIVE in self.intents or INTENT_REFERENCE in self.intents
+
+    def __repr__(self):
+        return f"Route({sorted(self.intents)}, reply={self.reply is not None})"
+
+
+def _small_talk_reply(tokens):
+    if not tokens or len(tokens) > SMALL_TALK_MAX_TOKENS:
+        return None
+    greeting = thanks = False
+    for token in tokens:
+        if token in GREETING_WORDS:
+            greeting = True
+        elif token in THANKS_WORDS:
+            thanks = True
+        elif token not in SMALL_TALK_WORDS:
+            return None
+    if thanks:
+        return THANKS_RESPONSE
+    if greeting:
+        return GREETING_RESPONSE
+    return None
+
+
+@lru_cache(maxsize=4096)
+def route_message(message):
+    """Route a chat message; cached, since several modules ask about the same message"""
+    tokens = tokenize(message)
+    intents = _automaton.labels(tokens)
+    if INTENT_INAPPROPRIATE in intents:
+        return Route(intents, INAPPROPRIATE_RESPONSE)
+    return Route(intents, _small_talk_reply(tokens))
+
+
+def is_current_event_question(message):
+    """Whether the message is likely to benefit from a real-time or reference lookup"""
+    return route_message(message).needs_lookup
+
+
+def is_time_sensitive(message):
+    """Whether the answer to the message depends on when it is asked"""
+    return route_message(message).is_time_sensitive
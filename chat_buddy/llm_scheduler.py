@@ -0,0 +1,481 @@
+"""
+Process-wide scheduler for Gemini calls.
+
+Every generate_content call in the process goes through one shared limiter
+instead of each caller running its own thread pool. The limiter:
+- caps concurrent calls, adapting the cap with AIMD (additive increase on
+  success, multiplicative decrease on 429s / timeouts),
+- hands free slots to interactive chat calls before bulk page extraction,
+- retries throttled calls with jittered exponential backoff instead of
+  giving up on them,
+- bounds every call, retries included, by a per-priority deadline,
+- hedges slow interactive requests: once a request has run longer than
+  the LLM_HEDGE_PERCENTILE latency of recent ones, a duplicate is sent
+  (if a slot is free) and whichever answers first is used.
+
+Async callers (the ASGI chat views) share the same limiter: a free slot is
+taken without leaving the event loop, and only a caller that has to queue
+waits for its slot in a worker thread.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    # Signals that upstream is overloaded: back off and shrink the limit
+    OVERLOAD_ERRORS = (
+        google_exceptions.ResourceExhausted,   # 429
+        google_exceptions.TooManyRequests,     # 429
+        google_exceptions.ServiceUnavailable,  # 503
+        google_exceptions.DeadlineExceeded,    # 504
+        TimeoutError,
+    )
+    # Transient failures worth retrying without shrinking the limit
+    RETRYABLE_ERRORS = OVERLOAD_ERRORS + (google_exceptions.InternalServerError,)
+except ImportError:
+    OVERLOAD_ERRORS = (TimeoutError,)
+    RETRYABLE_ERRORS = OVERLOAD_ERRORS
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0  # chat answers a user is waiting on
+PRIORITY_SUMMARY = 1      # upload summaries and single-image reads
+PRIORITY_BULK = 2         # per-page vision extraction
+
+# Longest a call may take, queueing and retries included. A chat answer
+# gives up long before background summarization does.
+DEADLINES = {
+    PRIORITY_INTERACTIVE: getattr(settings, 'LLM_INTERACTIVE_DEADLINE', 45),
+    PRIORITY_SUMMARY: getattr(settings, 'LLM_DEADLINE', 300),
+    PRIORITY_BULK: getattr(settings, 'LLM_DEADLINE', 300),
+}
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """An LLM call ran out of time before any attempt succeeded"""
+
+
+class LatencyTracker:
+    """Latencies of recent successful requests, per kind of request"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def percentile(self, key, percent):
+        """The percent-th percentile latency for key, or None with too few samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._samples)
+        stats = {}
+        for kind, priority in keys:
+            stats[f"{kind}/{priority}"] = {
+                'samples': len(self._samples[(kind, priority)]),
+                'p50': self.percentile((kind, priority), 50),
+                'p95': self.percentile((kind, priority), 95),
+                'p99': self.percentile((kind, priority), 99),
+            }
+        return stats
+
+
+class AdaptiveLimiter:
+    """Priority-ordered concurrency limiter whose limit follows AIMD"""
+
+    def __init__(self, initial_limit, min_limit, max_limit, decrease_factor=0.5, cooldown=2.0):
+        self._limit = float(initial_limit)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._decrease_factor = decrease_factor
+        # One burst of 429s should shrink the limit once, not once per failed call
+        self._cooldown = cooldown
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.throttled = 0
+        self.completed = 0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self, priority, timeout=None):
+        """Wait for a slot; returns False if none came free within timeout seconds"""
+        deadline_at = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            while self._waiters[0] != ticket or self._in_flight >= int(self._limit):
+                remaining = None if deadline_at is None else deadline_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    # Whoever is now first may be able to go
+                    self._condition.notify_all()
+                    return False
+                self._condition.wait(remaining)
+            heapq.heappop(self._waiters)
+            self._in_flight += 1
+            # The next waiter may also fit under the limit
+            self._condition.notify_all()
+            return True
+
+    def try_acquire(self):
+        """Take a slot only if one is free and nobody is queued for it"""
+        with self._condition:
+            if self._waiters or self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    async def acquire_async(self, priority, timeout=None):
+        if self.try_acquire():
+            return True
+        waiter = asyncio.ensure_future(asyncio.to_thread(self.acquire, priority, timeout))
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # The thread may still get its slot; hand it straight back
+            def release_unused(future):
+                if not future.cancelled() and future.exception() is None and future.result():
+                    self.release()
+            waiter.add_done_callback(release_unused)
+            raise
+
+    def on_success(self):
+        with self._condition:
+            self.completed += 1
+            # Additive increase: roughly +1 slot per limit's worth of successes
+            self._limit = min(self._max_limit, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+
+    def on_overload(self):
+        with self._condition:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self._cooldown:
+                self._limit = max(self._min_limit, self._limit * self._decrease_factor)
+                self._last_decrease = now
+
+    def stats(self):
+        with self._condition:
+            return {
+                'limit': round(self._limit, 2),
+                'in_flight': self._in_flight,
+                'waiting': len(self._waiters),
+                'completed': self.completed,
+                'throttled': self.throttled,
+            }
+
+
+# Returned by _open_stream for a stream that ended without any chunk
+_END_OF_STREAM = object()
+
+
+async def _open_stream(fn):
+    """Start the streaming request fn() and wait for its first chunk"""
+    chunks = (await fn()).__aiter__()
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = _END_OF_STREAM
+    return chunks, first
+
+
+class LLMScheduler:
+    """Runs LLM calls under the shared limiter with jittered retries, deadlines and hedging"""
+
+    def __init__(self, limiter, max_retries=4, backoff_base=1.0, backoff_cap=30.0,
+                 deadlines=DEADLINES, hedge_percentile=95, hedge_min_delay=1.0,
+                 hedge_priorities=(PRIORITY_INTERACTIVE,), stream_idle_timeout=30.0):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.deadlines = deadlines
+        # 0 disables hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_priorities = hedge_priorities
+        # Longest wait between two chunks of a stream once it has started
+        self.stream_idle_timeout = stream_idle_timeout
+        self.latency = LatencyTracker()
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+
+    def _backoff(self, attempt):
+        # Full jitter: spreads retries from many callers over the window
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _deadline_at(self, priority, deadline):
+        if deadline is None:
+            deadline = self.deadlines.get(priority, max(self.deadlines.values()))
+        return time.monotonic() + deadline
+
+    def _remaining(self, deadline_at, error):
+        """Seconds left before deadline_at; raises once there are none"""
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            self.deadline_exceeded += 1
+            raise LLMDeadlineExceeded("LLM call ran past its deadline") from error
+        return remaining
+
+    def _slot_timed_out(self, error):
+        self.deadline_exceeded += 1
+        return LLMDeadlineExceeded("LLM call waited for a slot past its deadline")
+
+    @contextmanager
+    def _slot(self, priority, deadline_at, error):
+        """A limiter slot, waiting for it no longer than the deadline allows"""
+        if not self.limiter.acquire(priority, timeout=self._remaining(deadline_at, error)):
+            raise self._slot_timed_out(error) from error
+        try:
+            yield
+        finally:
+            self.limiter.release()
+
+    @asynccontextmanager
+    async def _slot_async(self, priority, deadline_at, error):
+        if not await self.limiter.acquire_async(priority, timeout=self._remaining(deadline_at, error)):
+            raise self._slot_timed_out(error) from error
+        try:
+            yield
+        finally:
+            self.limiter.release()
+
+    def _retry_delay(self, attempt, deadline_at):
+        return min(self._backoff(attempt), max(0.0, deadline_at - time.monotonic()))
+
+    def _hedge_delay(self, key):
+        """How long a request of this kind runs before it is hedged, or None to never hedge it"""
+        if not self.hedge_percentile or key[1] not in self.hedge_priorities:
+            return None
+        latency = self.latency.percentile(key, self.hedge_percentile)
+        if latency is None:
+            return None
+        return max(latency, self.hedge_min_delay)
+
+    async def _hedged(self, start, key):
+        """
+        Await start() (one request). If it is still running after the hedge
+        delay for key and a slot is free, start a duplicate and return
+        whichever succeeds first; the other one is cancelled.
+        """
+        started_at = {}
+
+        def launch():
+            task = asyncio.ensure_future(start())
+            started_at[task] = time.monotonic()
+            return task
+
+        primary = launch()
+        tasks = {primary}
+        hedge_slot = False
+        error = None
+        try:
+            delay = self._hedge_delay(key)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.limiter.try_acquire():
+                    hedge_slot = True
+                    self.hedged += 1
+                    tasks.add(launch())
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.record(key, time.monotonic() - started_at[task])
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if hedge_slot:
+                self.limiter.release()
+
+    def call(self, fn, priority=PRIORITY_BULK, deadline=None):
+        """
+        Run fn(timeout) (one LLM request, giving up after timeout seconds) in
+        a slot, retrying throttled/transient failures until the deadline.
+        Waiting for a slot counts against the deadline too.
+        """
+        deadline_at = self._deadline_at(priority, deadline)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            with self._slot(priority, deadline_at, error):
+                timeout = self._remaining(deadline_at, error)
+                started = time.monotonic()
+                try:
+                    result = fn(timeout)
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, OVERLOAD_ERRORS):
+                        self.limiter.on_overload()
+                    if attempt == self.max_retries:
+                        raise
+                    error = e
+                else:
+                    self.limiter.on_success()
+                    self.latency.record(('call', priority), time.monotonic() - started)
+                    return result
+
+            delay = self._retry_delay(attempt, deadline_at)
+            print(f"LLM call throttled ({type(error).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    async def call_async(self, fn, priority=PRIORITY_BULK, deadline=None):
+        """Async call(): fn() returns an awaitable LLM request, which may be hedged"""
+        deadline_at = self._deadline_at(priority, deadline)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            async with self._slot_async(priority, deadline_at, error):
+                timeout = self._remaining(deadline_at, error)
+                try:
+                    result = await asyncio.wait_for(self._hedged(fn, ('call', priority)), timeout)
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, OVERLOAD_ERRORS):
+                        self.limiter.on_overload()
+                    if attempt == self.max_retries:
+                        raise
+                    error = e
+                else:
+                    self.limiter.on_success()
+                    return result
+
+            delay = self._retry_delay(attempt, deadline_at)
+            print(f"LLM call throttled ({type(error).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def stream_async(self, fn, priority=PRIORITY_BULK, deadline=None):
+        """
+        Yield the chunks of fn() (an awaitable streaming LLM request), holding
+        a slot until the stream ends. The first chunk must arrive before the
+        deadline (the request is hedged like call_async's), later ones within
+        stream_idle_timeout of each other. A failure is retried only if
+        nothing has been yielded yet, since the caller may already have used
+        partial output.
+        """
+        deadline_at = self._deadline_at(priority, deadline)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            async with self._slot_async(priority, deadline_at, error):
+                timeout = self._remaining(deadline_at, error)
+                started = False
+                try:
+                    chunks, first = await asyncio.wait_for(
+                        self._hedged(lambda: _open_stream(fn), ('stream', priority)), timeout
+                    )
+                    if first is not _END_OF_STREAM:
+                        started = True
+                        yield first
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), self.stream_idle_timeout)
+                            except StopAsyncIteration:
+                                break
+                            yield chunk
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, OVERLOAD_ERRORS):
+                        self.limiter.on_overload()
+                    if started or attempt == self.max_retries:
+                        raise
+                    error = e
+                else:
+                    self.limiter.on_success()
+                    return
+
+            delay = self._retry_delay(attempt, deadline_at)
+            print(f"LLM stream throttled ({type(error).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            **self.limiter.stats(),
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'deadline_exceeded': self.deadline_exceeded,
+            'latency': self.latency.stats(),
+        }
+
+
+scheduler = LLMScheduler(
+    AdaptiveLimiter(
+        initial_limit=getattr(settings, 'LLM_INITIAL_CONCURRENCY', 4),
+        min_limit=getattr(settings, 'LLM_MIN_CONCURRENCY', 1),
+        max_limit=getattr(settings, 'LLM_MAX_CONCURRENCY', 8),
+    ),
+    max_retries=getattr(settings, 'LLM_MAX_RETRIES', 4),
+    hedge_percentile=getattr(settings, 'LLM_HEDGE_PERCENTILE', 95),
+    hedge_min_delay=getattr(settings, 'LLM_HEDGE_MIN_DELAY', 1.0),
+    stream_idle_timeout=getattr(settings, 'LLM_STREAM_IDLE_TIMEOUT', 30.0),
+)
+
+
+# The pinned SDK's generate_content takes no timeout, so sync requests run
+# here and the caller stops waiting at the timeout. An abandoned request
+# cannot be cancelled: it finishes in the background and its answer is
+# dropped. Sized well above LLM_MAX_CONCURRENCY so abandoned requests do
+# not hold up new ones.
+_request_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='llm-request')
+
+
+def _request_with_timeout(fn, timeout):
+    """Result of fn(), or TimeoutError if it takes longer than timeout seconds"""
+    future = _request_executor.submit(fn)
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        if not future.done():
+            raise TimeoutError(f"LLM request took longer than {timeout:.1f}s") from None
+        return future.result()
+
+
+def generate_content(model, contents, priority=PRIORITY_BULK, deadline=None, **kwargs):
+    """model.generate_content(contents, **kwargs) through the shared scheduler"""
+    return scheduler.call(
+        lambda timeout: _request_with_timeout(lambda: model.generate_content(contents, **kwargs), timeout),
+        priority=priority, deadline=deadline,
+    )
+
+
+async def generate_content_async(model, contents, priority=PRIORITY_BULK, deadline=None, **kwargs):
+    """await model.generate_content_async(contents, **kwargs) through the shared scheduler"""
+    return await scheduler.call_async(
+        lambda: model.generate_content_async(contents, **kwargs), priority=priority, deadline=deadline
+    )
+
+
+def stream_content_async(model, contents, priority=PRIORITY_BULK, deadline=None, **kwargs):
+    """Response chunks of model.generate_content_async(contents, stream=True) through the shared scheduler"""
+    return scheduler.stream_async(
+        lambda: model.generate_content_async(contents, stream=True, **kwargs),
+        priority=priority, deadline=deadline,
+    )
@@ -0,0 +1,185 @@
+"""
+Local stand-in for Gemini, for load and latency testing.
+
+`manage.py run_llm_stub` serves canned answers after an injected delay
+(with an occasional much slower straggler), and StubModel is a client
+with the generate_content / generate_content_async surface of
+genai.GenerativeModel that ai_service uses when LLM_STUB_URL is set. Both
+paths through llm_scheduler, deadlines and hedging included, can then be
+exercised without network access or API quota.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+import requests
+
+try:
+    from google.api_core.exceptions import ServiceUnavailable
+except ImportError:
+    class ServiceUnavailable(Exception):
+        pass
+
+STREAM_CHUNK_WORDS = 8
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class StubLLMServer(ThreadingHTTPServer):
+    """
+    POST /generate {"prompt": ..., "stream": bool} answers after about
+    `latency` seconds (+/- jitter); a slow_rate fraction of requests takes
+    slow_latency seconds instead, and an error_rate fraction fails with 503.
+    Streams send newline-delimited JSON chunks chunk_delay apart.
+    GET /stats reports request counts.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.5, jitter=0.2, slow_rate=0.05, slow_latency=10.0,
+                 error_rate=0.0, chunk_delay=0.05):
+        super().__init__(address, _StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self.slow = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def plan_request(self):
+        """(delay, fail) for the next request"""
+        with self._lock:
+            self.requests += 1
+            if random.random() < self.error_rate:
+                self.errors += 1
+                return 0.0, True
+            if random.random() < self.slow_rate:
+                self.slow += 1
+                return self.slow_latency, False
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)), False
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'slow': self.slow, 'errors': self.errors}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        delay, fail = self.server.plan_request()
+        time.sleep(delay)
+        if fail:
+            self._send_json(503, {'error': 'injected failure'})
+            return
+
+        question = request.get('prompt', '').strip().splitlines()[-2:-1] or ['']
+        text = f"Stub answer ({delay:.2f}s) to: {question[0][:200]}"
+        if not request.get('stream'):
+            self._send_json(200, {'text': text})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = text.split(' ')
+        for i in range(0, len(words), STREAM_CHUNK_WORDS):
+            if i:
+                time.sleep(self.server.chunk_delay)
+            piece = ' '.join(words[i:i + STREAM_CHUNK_WORDS]) + ' '
+            line = (json.dumps({'text': piece}) + '\n').encode('utf-8')
+            self.wfile.write(f"{len(line):x}\r\n".encode('ascii') + line + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def _prompt_text(contents):
+    if isinstance(contents, str):
+        return contents
+    # Multimodal contents: only the text parts matter to the stub
+    return "\n".join(part for part in contents if isinstance(part, str))
+
+
+def _check_request_fields(kwargs):
+    # The pinned google-generativeai (0.3.0) passes extra keyword arguments
+    # (request_options included) into GenerateContentRequest, which rejects
+    # them; the stub does too, so calls the real client refuses fail here
+    if kwargs:
+        raise ValueError(f"Unknown field for GenerateContentRequest: {next(iter(kwargs))}")
+
+
+class StubModel:
+    """The parts of genai.GenerativeModel's interface this app uses, served by a StubLLMServer"""
+
+    def __init__(self, base_url):
+        self.url = base_url.rstrip('/') + '/generate'
+
+    def generate_content(self, contents, *, generation_config=None, safety_settings=None, stream=False, **kwargs):
+        _check_request_fields(kwargs)
+        response = requests.post(self.url, json={'prompt': _prompt_text(contents)})
+        if response.status_code == 503:
+            raise ServiceUnavailable("Stub LLM server unavailable")
+        response.raise_for_status()
+        return StubResponse(response.json()['text'])
+
+    async def generate_content_async(self, contents, *, generation_config=None, safety_settings=None,
+                                     stream=False, **kwargs):
+        _check_request_fields(kwargs)
+        payload = {'prompt': _prompt_text(contents), 'stream': stream}
+        if stream:
+            return self._stream(payload)
+        async with aiohttp.ClientSession() as session:
+            async with session.post(self.url, json=payload) as response:
+                if response.status == 503:
+                    raise ServiceUnavailable("Stub LLM server unavailable")
+                response.raise_for_status()
+                return StubResponse((await response.json())['text'])
+
+    async def _stream(self, payload):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(self.url, json=payload) as response:
+                if response.status == 503:
+                    raise ServiceUnavailable("Stub LLM server unavailable")
+                response.raise_for_status()
+                async for line in response.content:
+                    if line.strip():
+                        yield StubResponse(json.loads(line)['text'])
@@ -0,0 +1,97 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat_buddy.intents import route_message
+
+SAMPLE_MESSAGES = [
+    "hi",
+    "Thank you so much!",
+    "Can you explain the difference between reflexive and symmetric relations?",
+    "What is the latest news about the election?",
+    "I know how to do the first exercise, but the software keeps crashing on the second one",
+    "Summarize page 12 of my lecture note",
+    "Who is the current finance minister?",
+    "What does the Bible say about patience and prayer?",
+    "Give me an explicit formula for the nth term of the sequence 2, 6, 18, 54",
+    "Walk me through the proof that every equivalence relation partitions a set into classes, "
+    "step by step, and then give two more examples of relations that are transitive but not "
+    "symmetric so I can practise before my exam on Monday",
+]
+
+# The routing it replaces: one substring scan per keyword list
+_LEGACY_CHRISTIAN = ['god', 'jesus', 'christ', 'bible', 'scripture', 'prayer',
+                     'faith', 'christian', 'church', 'lord', 'salvation',
+                     'gospel', 'holy spirit', 'worship']
+_LEGACY_INAPPROPRIATE = ['sex', 'porn', 'explicit', 'nsfw', 'nude']
+_LEGACY_LOOKUP = [
+    'now', 'today', 'current', 'latest', 'recent', 'happening',
+    'news', 'breaking', 'right now', 'this week', 'this month',
+    'update on', 'situation', 'event', 'incident', 'crisis',
+    'election', 'weather', 'stock', 'crypto',
+    'covid', 'pandemic', 'war', 'conflict',
+    'who is', 'who was', 'who are', "who's",
+    'what is', "what's", 'what are',
+    'tell me about', 'explain', 'describe',
+    'biography', 'history of', 'origin of',
+    'when was', 'where is', 'how did',
+    'discography', 'songs', 'albums', 'minister', 'pastor', 'artist',
+    'singer', 'musician', 'actor', 'politician', 'author', 'founder',
+    '2023', '2024', '2025', '2026',
+    'january', 'february', 'march', 'april',
+    'may', 'june', 'july', 'august', 'september',
+    'october', 'november', 'december',
+]
+
+
+def legacy_route(message):
+    message_lower = message.lower()
+    return (
+        any(keyword in message_lower for keyword in _LEGACY_CHRISTIAN),
+        any(keyword in message_lower for keyword in _LEGACY_INAPPROPRIATE),
+        any(keyword in message_lower for keyword in _LEGACY_LOOKUP),
+    )
+
+
+class Command(BaseCommand):
+    help = "Time the chat intent router against the substring scans it replaced"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000,
+                            help='Passes over the sample messages (default: 2000)')
+        parser.add_argument('--messages', default=None,
+                            help='File with one sample message per line (default: built-in samples)')
+
+    def handle(self, *args, **options):
+        messages = SAMPLE_MESSAGES
+        if options['messages']:
+            with open(options['messages'], encoding='utf-8') as f:
+                messages = [line.strip() for line in f if line.strip()]
+        iterations = options['iterations']
+        calls = iterations * len(messages)
+
+        # The router caches per message; time the uncached scan
+        route = route_message.__wrapped__
+        for name, func in (('substring scans', legacy_route), ('intent router', route)):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                for message in messages:
+                    func(message)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name:>16}: {elapsed * 1e6 / calls:7.2f} us/message ({calls} messages)")
+
+        self.stdout.write("")
+        for message in messages:
+            christian, inappropriate, lookup = legacy_route(message)
+            new = route(message)
+            changed = []
+            if christian != new.is_christian_topic:
+                changed.append(f"christian {christian}->{new.is_christian_topic}")
+            if inappropriate != new.is_inappropriate:
+                changed.append(f"inappropriate {inappropriate}->{new.is_inappropriate}")
+            if lookup != new.needs_lookup:
+                changed.append(f"lookup {lookup}->{new.needs_lookup}")
+            if new.reply:
+                changed.append("local reply")
+            if changed:
+                self.stdout.write(f"{message[:60]!r}: {', '.join(changed)}")
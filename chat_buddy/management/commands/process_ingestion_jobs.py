@@ -0,0 +1,60 @@
+import os
+import socket
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chat_buddy.ingestion import claim_next_job, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Run a worker that processes queued study material ingestion jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process every queued job, then exit instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--worker-id', default=None,
+                            help='Identifier recorded on claimed jobs (default: host:pid)')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or f"{socket.gethostname()}:{os.getpid()}"
+        poll_interval = options['poll_interval']
+        self.stdout.write(f"Ingestion worker {worker_id} started")
+
+        while True:
+            # Like Django does around each request: drop connections that
+            # broke or outlived CONN_MAX_AGE before using the database again
+            close_old_connections()
+            try:
+                job = self.process_next_job(worker_id)
+            except Exception as e:
+                if options['once']:
+                    raise
+                # e.g. the database connection dropped; keep the worker alive
+                traceback.print_exc()
+                self.stderr.write(f"Ingestion worker error, retrying in {poll_interval}s: {e}")
+                close_old_connections()
+                time.sleep(poll_interval)
+                continue
+
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(poll_interval)
+
+    def process_next_job(self, worker_id):
+        """Claim and run the next queued job; returns it, or None if the queue is empty"""
+        requeue_stale_jobs()
+        job = claim_next_job(worker_id)
+        if job is None:
+            return None
+
+        self.stdout.write(f"Processing job {job.id} ({job.study_material.file.name})")
+        started = time.monotonic()
+        process_job(job)
+        self.stdout.write(f"Job {job.id} finished in {time.monotonic() - started:.1f}s")
+        return job
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from chat_buddy.llm_stub import StubLLMServer
+
+
+class Command(BaseCommand):
+    help = "Serve a local stand-in for Gemini with injected latency (point LLM_STUB_URL at it)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.5,
+                            help='Typical seconds before an answer starts')
+        parser.add_argument('--jitter', type=float, default=0.2,
+                            help='Uniform +/- seconds added to the typical latency')
+        parser.add_argument('--slow-rate', type=float, default=0.05,
+                            help='Fraction of requests that are stragglers')
+        parser.add_argument('--slow-latency', type=float, default=10.0,
+                            help='Seconds a straggler takes')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests failing with 503')
+        parser.add_argument('--chunk-delay', type=float, default=0.05,
+                            help='Seconds between streamed chunks')
+
+    def handle(self, *args, **options):
+        server = StubLLMServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            slow_rate=options['slow_rate'],
+            slow_latency=options['slow_latency'],
+            error_rate=options['error_rate'],
+            chunk_delay=options['chunk_delay'],
+        )
+        self.stdout.write(f"Stub LLM server on http://{options['host']}:{options['port']} "
+                          f"(LLM_STUB_URL=http://{options['host']}:{options['port']})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(f"Served {server.stats()}")
+            server.server_close()
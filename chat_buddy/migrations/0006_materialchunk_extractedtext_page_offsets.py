@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 01:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_buddy', '0005_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractedtext',
+            name='page_offsets',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='MaterialChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField(blank=True, null=True)),
+                ('ordinal', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('char_start', models.PositiveIntegerField()),
+                ('char_end', models.PositiveIntegerField()),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='chat_buddy.studymaterial')),
+            ],
+            options={
+                'ordering': ['material', 'ordinal'],
+                'constraints': [models.UniqueConstraint(fields=('material', 'ordinal'), name='unique_material_chunk')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-17 01:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_buddy', '0006_materialchunk_extractedtext_page_offsets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveSmallIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_index', to='chat_buddy.studymaterial')),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_buddy', '0007_materialindex'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', '-created_at'], name='chatmessage_recent_idx'),
+        ),
+    ]
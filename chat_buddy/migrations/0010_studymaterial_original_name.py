@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_buddy', '0009_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studymaterial',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
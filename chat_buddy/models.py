@@ -1,3 +1,5 @@
+import os
+
 from django.db import models
 
 class StudyMaterial(models.Model):
@@ -5,6 +7,8 @@ class StudyMaterial(models.Model):
     file = models.FileField(upload_to='materials/')
     file_type = models.CharField(max_length=20) # pdf, mp4, etc.
     summary = models.TextField(blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the file bytes
+    original_name = models.CharField(max_length=255, blank=True)  # file name as uploaded, before storage renames it
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -14,12 +18,68 @@ class StudyMaterial(models.Model):
         user_str = self.user.username if self.user else "Anonymous"
         return f"{self.file.name} - {user_str}"
 
+    @property
+    def display_name(self):
+        """The name the user uploaded the file under"""
+        return self.original_name or os.path.basename(self.file.name)
+
+class ExtractedText(models.Model):
+    """Extracted text of an uploaded file, keyed by content hash so re-uploads skip extraction"""
+    content_hash = models.CharField(max_length=64)
+    file_type = models.CharField(max_length=20)
+    extractor_version = models.PositiveIntegerField()
+    text = models.TextField()
+    page_offsets = models.JSONField(default=list, blank=True)  # [[page_number, start offset in text], ...]
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_hash', 'file_type', 'extractor_version'],
+                name='unique_extracted_text',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.file_type} {self.content_hash[:12]} (v{self.extractor_version})"
+
+class MaterialChunk(models.Model):
+    """A slice of a StudyMaterial's extracted text, kept so it never has to be re-extracted"""
+    material = models.ForeignKey(StudyMaterial, on_delete=models.CASCADE, related_name='chunks')
+    page_number = models.PositiveIntegerField(null=True, blank=True)  # None for documents without pages
+    ordinal = models.PositiveIntegerField()  # position of the chunk within the material
+    text = models.TextField()
+    char_start = models.PositiveIntegerField()  # offsets into the material's full extracted text
+    char_end = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['material', 'ordinal']
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'ordinal'], name='unique_material_chunk'),
+        ]
+
+    def __str__(self):
+        return f"{self.material.file.name} #{self.ordinal} (page {self.page_number})"
+
+class MaterialIndex(models.Model):
+    """Serialized BM25 index over a StudyMaterial's chunks, built once at ingestion"""
+    material = models.OneToOneField(StudyMaterial, on_delete=models.CASCADE, related_name='search_index')
+    version = models.PositiveSmallIntegerField()  # retrieval.INDEX_VERSION the data was written with
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Index for {self.material.file.name} (v{self.version})"
+
 # models.py
 
 class ChatSession(models.Model):
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='chat_sessions', null=True, blank=True)
     study_material = models.ForeignKey(StudyMaterial, on_delete=models.CASCADE, related_name='chat_sessions', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Rolling summary of the conversation up to and including message summarized_through
+    summary = models.TextField(blank=True)
+    summarized_through = models.PositiveBigIntegerField(default=0)  # ChatMessage id
     
     class Meta:
         ordering = ['-created_at']
@@ -37,6 +97,47 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Serves "newest messages of a session" without scanning the session
+            models.Index(fields=['session', '-created_at'], name='chatmessage_recent_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.role}: {self.content[:50]}"
\ No newline at end of file
+        return f"{self.role}: {self.content[:50]}"
+
+class IngestionJob(models.Model):
+    """Background extraction + summarization of an uploaded StudyMaterial"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='ingestion_jobs', null=True, blank=True)
+    study_material = models.ForeignKey(StudyMaterial, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    session = models.ForeignKey(ChatSession, on_delete=models.SET_NULL, related_name='ingestion_jobs', null=True, blank=True)
+    user_instruction = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=30, blank=True)  # e.g. 'extracting', 'summarizing'
+    progress = models.PositiveSmallIntegerField(default=0)  # percent
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker_id = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='ingestionjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} - {self.status} ({self.progress}%)"
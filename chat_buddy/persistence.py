@@ -0,0 +1,126 @@
+"""
+Persistence of chat turns.
+
+A turn (the user's message and the reply, plus its session when the session
+is new) is written in one transaction, with one multi-row INSERT for the
+messages, so each turn takes the database write lock once instead of three
+times. On SQLite that lock is database-wide.
+
+With CHAT_WRITE_BEHIND enabled, turns of existing sessions are queued and
+written after the response has been sent, by a background writer that
+commits everything queued so far in a single transaction.
+"""
+import atexit
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .conversation_summary import schedule_summary_update
+from .models import ChatMessage
+
+WRITE_BEHIND = getattr(settings, 'CHAT_WRITE_BEHIND', False)
+# Most turns committed by the background writer in one transaction
+WRITE_BEHIND_BATCH = 100
+# How long process exit waits for queued turns to be written
+SHUTDOWN_FLUSH_SECONDS = 5
+
+
+def _turn_messages(session, user_message, response_text):
+    # Built in order so the reply's created_at and id sort after the question's
+    return [
+        ChatMessage(session=session, role='user', content=user_message),
+        ChatMessage(session=session, role='assistant', content=response_text),
+    ]
+
+
+def save_turn(session, user_message, response_text):
+    """Write a turn (and its session, if unsaved) in one transaction"""
+    with transaction.atomic():
+        if session.pk is None:
+            session.save()
+        ChatMessage.objects.bulk_create(_turn_messages(session, user_message, response_text))
+    schedule_summary_update(session)
+
+
+class TurnWriter:
+    """Background thread that writes queued turns in batched transactions"""
+
+    def __init__(self, batch_size=WRITE_BEHIND_BATCH):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, session, user_message, response_text):
+        self._ensure_started()
+        self._queue.put((session, user_message, response_text))
+
+    def flush(self, timeout=None):
+        """Wait until every queued turn has been written (or timeout seconds pass)"""
+        done = threading.Event()
+        threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True).start()
+        return done.wait(timeout)
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='turn-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Log and keep the thread alive for the turns queued after these
+                print(f"Write-behind writer failed, dropping {len(batch)} chat turns: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        close_old_connections()
+        messages = []
+        for session, user_message, response_text in batch:
+            messages.extend(_turn_messages(session, user_message, response_text))
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(messages)
+        except Exception as e:
+            print(f"Write-behind batch of {len(batch)} turns failed, writing them one by one: {e}")
+            for session, user_message, response_text in batch:
+                try:
+                    save_turn(session, user_message, response_text)
+                except Exception as e:
+                    print(f"Dropping chat turn for session {session.pk}: {e}")
+            return
+
+        for session in {session.pk: session for session, _, _ in batch}.values():
+            try:
+                schedule_summary_update(session)
+            except Exception as e:
+                print(f"Session summary scheduling failed for session {session.pk}: {e}")
+
+
+turn_writer = TurnWriter()
+atexit.register(lambda: turn_writer.flush(SHUTDOWN_FLUSH_SECONDS))
+
+
+def persist_turn(session, user_message, response_text):
+    """
+    Save a turn now, or queue it for the background writer in write-behind
+    mode. A new session is always written immediately so its id can be
+    returned to the client.
+    """
+    if WRITE_BEHIND and session.pk is not None:
+        turn_writer.submit(session, user_message, response_text)
+    else:
+        save_turn(session, user_message, response_text)
@@ -0,0 +1,277 @@
+"""
+BM25 retrieval over a StudyMaterial's chunks.
+
+The index is built once at ingestion and stored in MaterialIndex, so a chat
+turn only has to load it and score the question's terms. Postings are kept
+in flat typed arrays (one doc-id array and one term-frequency array, sliced
+per term by an offsets array) rather than per-term Python lists, which keeps
+the serialized form compact and loading cheap.
+"""
+import heapq
+import json
+import math
+import re
+import struct
+import sys
+import zlib
+from array import array
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import MaterialChunk, MaterialIndex
+from .tokens import estimate_tokens
+
+# Bump whenever tokenization or the serialized layout changes; stale indexes
+# are rebuilt from the stored chunks on first use.
+INDEX_VERSION = 1
+
+# Token budget for retrieved excerpts in a chat prompt, and how many
+# best-scoring chunks are considered for it
+MATERIAL_CONTEXT_TOKENS = getattr(settings, 'MATERIAL_CONTEXT_TOKENS', 1200)
+RETRIEVAL_TOP_K = getattr(settings, 'RETRIEVAL_TOP_K', 8)
+
+# Standard BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TERM_PATTERN = re.compile(r'[^\W_]+')
+_PAGE_REFERENCE = re.compile(r'\bpages?\s+(\d+)', re.IGNORECASE)
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from how i if in is it its me my
+of on or so that the their then there these this to was what when where which
+who why will with you your please explain tell about give
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word terms of text, without stopwords and single letters"""
+    return [
+        term for term in _TERM_PATTERN.findall(text.lower())
+        if term not in STOPWORDS and (len(term) > 1 or term.isdigit())
+    ]
+
+
+def _to_little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class BM25Index:
+    """Inverted index over chunks numbered 0..doc_count-1 (their ordinals)"""
+
+    def __init__(self, terms, offsets, doc_ids, term_freqs, doc_lengths, doc_pages):
+        self.terms = terms              # term -> position in offsets
+        self.offsets = offsets          # postings of term t: [offsets[t], offsets[t + 1])
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.doc_pages = doc_pages      # page number per chunk, 0 when unknown
+        self.doc_count = len(doc_lengths)
+        self.avg_length = (sum(doc_lengths) / self.doc_count) if self.doc_count else 0.0
+
+    @classmethod
+    def build(cls, chunks):
+        """Build from (page_number, text) pairs, one per chunk in ordinal order"""
+        postings = {}
+        doc_lengths = array('I')
+        doc_pages = array('I')
+        for doc_id, (page_number, text) in enumerate(chunks):
+            counts = {}
+            tokens = tokenize(text)
+            for term in tokens:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc_id, count))
+            doc_lengths.append(len(tokens))
+            doc_pages.append(page_number or 0)
+
+        terms = {}
+        offsets = array('I', [0])
+        doc_ids = array('I')
+        term_freqs = array('I')
+        for position, term in enumerate(sorted(postings)):
+            terms[term] = position
+            for doc_id, count in postings[term]:
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+            offsets.append(len(doc_ids))
+        return cls(terms, offsets, doc_ids, term_freqs, doc_lengths, doc_pages)
+
+    def search(self, query, top_k=RETRIEVAL_TOP_K):
+        """Return up to top_k (ordinal, score) pairs, best first"""
+        if not self.doc_count:
+            return []
+        scores = {}
+        for term in set(tokenize(query)):
+            position = self.terms.get(term)
+            if position is None:
+                continue
+            start, end = self.offsets[position], self.offsets[position + 1]
+            doc_freq = end - start
+            idf = math.log(1 + (self.doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            for i in range(start, end):
+                doc_id = self.doc_ids[i]
+                tf = self.term_freqs[i]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def page_chunks(self, query):
+        """Ordinals of chunks on pages the query names explicitly ("page 47")"""
+        pages = {int(number) for number in _PAGE_REFERENCE.findall(query)}
+        if not pages:
+            return []
+        return [doc_id for doc_id, page in enumerate(self.doc_pages) if page in pages]
+
+    def to_bytes(self):
+        header = json.dumps({
+            'terms': sorted(self.terms, key=self.terms.get),
+            'doc_count': self.doc_count,
+            'postings': len(self.doc_ids),
+        }).encode('utf-8')
+        payload = b''.join([
+            struct.pack('<I', len(header)),
+            header,
+            _to_little_endian(self.offsets),
+            _to_little_endian(self.doc_ids),
+            _to_little_endian(self.term_freqs),
+            _to_little_endian(self.doc_lengths),
+            _to_little_endian(self.doc_pages),
+        ])
+        return zlib.compress(payload)
+
+    @classmethod
+    def from_bytes(cls, data):
+        payload = zlib.decompress(data)
+        (header_length,) = struct.unpack_from('<I', payload)
+        position = 4 + header_length
+        header = json.loads(payload[4:position])
+        item_size = array('I').itemsize
+
+        def read(count):
+            nonlocal position
+            end = position + count * item_size
+            values = _from_little_endian('I', payload[position:end])
+            position = end
+            return values
+
+        terms = {term: i for i, term in enumerate(header['terms'])}
+        offsets = read(len(terms) + 1)
+        doc_ids = read(header['postings'])
+        term_freqs = read(header['postings'])
+        doc_lengths = read(header['doc_count'])
+        doc_pages = read(header['doc_count'])
+        return cls(terms, offsets, doc_ids, term_freqs, doc_lengths, doc_pages)
+
+
+def build_material_index(material, chunks=None):
+    """Build and store the BM25 index for a material's chunks"""
+    if chunks is None:
+        chunks = list(MaterialChunk.objects.filter(material=material).order_by('ordinal'))
+    index = BM25Index.build((chunk.page_number, chunk.text) for chunk in chunks)
+    MaterialIndex.objects.update_or_create(
+        material=material,
+        defaults={'version': INDEX_VERSION, 'data': index.to_bytes()},
+    )
+    return index
+
+
+def load_material_index(material):
+    """
+    Return the material's BM25 index, or None if it has no chunks.
+    Materials chunked before indexing existed, or indexed with an older
+    INDEX_VERSION, are (re)indexed from their stored chunks here.
+    """
+    stored = MaterialIndex.objects.filter(material=material).only('version', 'data').first()
+    if stored and stored.version == INDEX_VERSION:
+        return BM25Index.from_bytes(bytes(stored.data))
+    if not MaterialChunk.objects.filter(material=material).exists():
+        return None
+    return build_material_index(material)
+
+
+async def load_material_index_async(material):
+    """Async load_material_index"""
+    stored = await MaterialIndex.objects.filter(material=material).only('version', 'data').afirst()
+    if stored and stored.version == INDEX_VERSION:
+        return BM25Index.from_bytes(bytes(stored.data))
+    if not await MaterialChunk.objects.filter(material=material).aexists():
+        return None
+    return await sync_to_async(build_material_index)(material)
+
+
+def _rank_chunks(index, query, top_k):
+    """Ordinals to consider: pages named in the question first, then chunks by BM25 score"""
+    ranked = index.page_chunks(query) + [ordinal for ordinal, _ in index.search(query, top_k)]
+    return list(dict.fromkeys(ranked))
+
+
+def _chunk_queryset(material, ranked):
+    return (MaterialChunk.objects
+            .filter(material=material, ordinal__in=ranked)
+            .only('ordinal', 'page_number', 'text'))
+
+
+def _format_context(ranked, chunks, token_budget):
+    """Pack the ranked chunks into token_budget and render them in document order"""
+    chunks = {chunk.ordinal: chunk for chunk in chunks}
+    selected = []
+    used_tokens = 0
+    for ordinal in ranked:
+        chunk = chunks.get(ordinal)
+        if chunk is None:
+            continue
+        tokens = estimate_tokens(chunk.text)
+        if used_tokens + tokens > token_budget:
+            continue
+        selected.append(chunk)
+        used_tokens += tokens
+    if not selected:
+        return None
+
+    # Present the excerpts in document order
+    selected.sort(key=lambda chunk: chunk.ordinal)
+    sections = []
+    for chunk in selected:
+        label = f"[Page {chunk.page_number}]" if chunk.page_number else f"[Excerpt {chunk.ordinal + 1}]"
+        sections.append(f"{label}\n{chunk.text.strip()}")
+    return "\n\n".join(sections)
+
+
+def retrieve_material_context(material, query, token_budget=MATERIAL_CONTEXT_TOKENS, top_k=RETRIEVAL_TOP_K):
+    """
+    Return the material's chunks most relevant to query, as prompt text that
+    fits in token_budget, or None if the material has no index or nothing matches.
+    """
+    index = load_material_index(material)
+    if index is None:
+        return None
+    ranked = _rank_chunks(index, query, top_k)
+    if not ranked:
+        return None
+    return _format_context(ranked, _chunk_queryset(material, ranked), token_budget)
+
+
+async def retrieve_material_context_async(material, query, token_budget=MATERIAL_CONTEXT_TOKENS,
+                                          top_k=RETRIEVAL_TOP_K):
+    """Async retrieve_material_context"""
+    index = await load_material_index_async(material)
+    if index is None:
+        return None
+    ranked = _rank_chunks(index, query, top_k)
+    if not ranked:
+        return None
+    chunks = [chunk async for chunk in _chunk_queryset(material, ranked)]
+    return _format_context(ranked, chunks, token_budget)
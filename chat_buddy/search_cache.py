@@ -0,0 +1,401 @@
+"""
+Bounded cache for web search results, with pluggable backends.
+
+- 'memory': this process only; LRU with TTL and a byte cap (MemoryCache).
+- 'sqlite': a SQLite file shared by every worker process on the node; LRU
+  by last access, with TTL and a byte cap.
+- 'django': any configured Django cache (Redis, memcached ...), shared
+  across nodes; that backend enforces its own size limits, so only the
+  evictions this process can observe are counted.
+
+Values are JSON-serializable (dicts of search results, extracts), and
+their size is measured as JSON. Every backend has get / set / delete /
+clear / stats, with hit, miss and eviction counters kept per process.
+
+Reference sources are wrapped with @cached_source, which adds negative
+caching (a source that found nothing, or failed, is not asked again for
+a short while) and stale-while-revalidate (an expired result is served
+at once while a background thread fetches a fresh one).
+"""
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .memory_cache import MemoryCache
+
+SEARCH_CACHE_TTL = getattr(settings, 'SEARCH_CACHE_TTL', 60 * 60)
+SEARCH_CACHE_MAX_BYTES = getattr(settings, 'SEARCH_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+# How long a source with no result is left alone, and how long past its TTL
+# a result may still be served while it is refreshed (seconds)
+SEARCH_NEGATIVE_TTL = getattr(settings, 'SEARCH_NEGATIVE_TTL', 5 * 60)
+SEARCH_STALE_TTL = getattr(settings, 'SEARCH_STALE_TTL', 24 * 60 * 60)
+
+
+def json_size(value):
+    """Size in bytes of value serialized as JSON"""
+    return len(json.dumps(value).encode('utf-8'))
+
+
+class SQLiteCache:
+    """LRU + TTL cache in a SQLite file, shared by the processes that open it"""
+
+    # Reads are recorded for LRU order in batches rather than one write per
+    # hit, so hits in different workers do not queue for the write lock.
+    # A batch is written once this many reads are pending or the oldest is
+    # this many seconds old, and always before evicting.
+    ACCESS_BATCH = 100
+    ACCESS_FLUSH_INTERVAL = 5.0
+
+    def __init__(self, path, max_bytes, ttl):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._accessed = {}  # key -> last read time, not yet written
+        self._accessed_since = None
+        self._access_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._counter_lock = threading.Lock()
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def _connection(self):
+        # sqlite3 connections must stay on the thread that opened them
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # WAL lets readers in other workers proceed during a write
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, counter, amount=1):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get(self, key, default=None):
+        db = self._connection()
+        now = time.time()
+        row = db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count('misses')
+            return default
+        value, expires_at = row
+        if expires_at <= now:
+            db.execute("DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now))
+            self._count('expirations')
+            self._count('misses')
+            return default
+        self._count('hits')
+        self._touch(key, now)
+        return json.loads(value)
+
+    def _touch(self, key, now):
+        with self._access_lock:
+            self._accessed[key] = now
+            if self._accessed_since is None:
+                self._accessed_since = time.monotonic()
+            due = (len(self._accessed) >= self.ACCESS_BATCH
+                   or time.monotonic() - self._accessed_since >= self.ACCESS_FLUSH_INTERVAL)
+        if not due:
+            return
+        db = self._connection()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_accessed(db)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        except sqlite3.OperationalError as e:
+            # Only LRU order is lost; the read itself succeeded
+            print(f"Search cache access times not written: {e}")
+
+    def _flush_accessed(self, db):
+        """Write pending read times, inside the caller's transaction"""
+        with self._access_lock:
+            accessed, self._accessed, self._accessed_since = self._accessed, {}, None
+        if accessed:
+            db.executemany(
+                "UPDATE entries SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(at, key) for key, at in accessed.items()],
+            )
+
+    def set(self, key, value, ttl=None):
+        data = json.dumps(value)
+        size = len(data.encode('utf-8'))
+        if size > self.max_bytes:
+            return False
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, expires_at, now),
+            )
+            self._flush_accessed(db)
+            evicted = self._evict(db, now)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if evicted:
+            self._count('evictions', evicted)
+        return True
+
+    def _evict(self, db, now):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        evicted = 0
+        if total > self.max_bytes:
+            for key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        return evicted
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM entries")
+
+    def stats(self):
+        entries, total = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        with self._counter_lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'bytes': total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class DjangoCache:
+    """
+    Search cache stored in one of Django's CACHES. Size limits and eviction
+    are up to that backend; evictions counts the entries this process stored
+    that were gone before their TTL ran out (among the last TRACKED_KEYS).
+    clear() moves every process to a new cache version, leaving the old
+    entries to expire.
+    """
+
+    TRACKED_KEYS = 10000
+    # Seconds a process may keep using the cache version after another one cleared it
+    VERSION_CHECK_INTERVAL = 5.0
+
+    def __init__(self, alias, ttl, prefix='search:'):
+        from django.core.cache import caches
+
+        self.cache = caches[alias]
+        self.alias = alias
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._expiries = OrderedDict()  # key -> expiry (wall clock) of what this process stored
+        self._version = None
+        self._version_checked_at = 0.0
+        self._counter_lock = threading.Lock()
+
+    def _key(self, key):
+        # Hashed: queries may be long or contain characters memcached rejects
+        return self.prefix + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @property
+    def _version_key(self):
+        return self.prefix + 'version'
+
+    def _current_version(self):
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.VERSION_CHECK_INTERVAL:
+            self.cache.add(self._version_key, 1, timeout=None)
+            self._version = self.cache.get(self._version_key) or 1
+            self._version_checked_at = now
+        return self._version
+
+    def get(self, key, default=None):
+        value = self.cache.get(self._key(key), version=self._current_version())
+        with self._counter_lock:
+            if value is None:
+                self.misses += 1
+                expires_at = self._expiries.pop(key, None)
+                if expires_at is not None and expires_at > time.time():
+                    self.evictions += 1
+            else:
+                self.hits += 1
+        return default if value is None else value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.cache.set(self._key(key), value, timeout=ttl, version=self._current_version())
+        with self._counter_lock:
+            self._expiries.pop(key, None)
+            self._expiries[key] = time.time() + ttl
+            if len(self._expiries) > self.TRACKED_KEYS:
+                self._expiries.popitem(last=False)
+        return True
+
+    def delete(self, key):
+        self.cache.delete(self._key(key), version=self._current_version())
+        with self._counter_lock:
+            self._expiries.pop(key, None)
+
+    def clear(self):
+        self.cache.add(self._version_key, 1, timeout=None)
+        self._version = self.cache.incr(self._version_key)
+        self._version_checked_at = time.monotonic()
+        with self._counter_lock:
+            self._expiries.clear()
+
+    def stats(self):
+        with self._counter_lock:
+            lookups = self.hits + self.misses
+            return {
+                'alias': self.alias,
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+def make_search_cache(backend=None):
+    """The search cache configured by SEARCH_CACHE_BACKEND ('memory', 'sqlite' or 'django')"""
+    backend = backend or getattr(settings, 'SEARCH_CACHE_BACKEND', 'memory')
+    if backend == 'sqlite':
+        path = getattr(settings, 'SEARCH_CACHE_PATH', settings.BASE_DIR / 'search_cache.sqlite3')
+        return SQLiteCache(path, SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_TTL)
+    if backend == 'django':
+        return DjangoCache(getattr(settings, 'SEARCH_CACHE_ALIAS', 'default'), SEARCH_CACHE_TTL)
+    if backend == 'memory':
+        return MemoryCache(SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_TTL, sizeof=json_size)
+    raise ValueError(f"Unknown SEARCH_CACHE_BACKEND {backend!r}")
+
+
+search_cache = make_search_cache()
+
+
+# ---------------------------------------------------------------------------
+# Negative caching and stale-while-revalidate for reference sources
+# ---------------------------------------------------------------------------
+
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='search-refresh')
+_refreshing = set()
+_source_lock = threading.Lock()
+_source_counters = {'negative_hits': 0, 'stale_served': 0, 'refreshes': 0, 'refresh_failures': 0}
+
+
+def _count_source(counter):
+    with _source_lock:
+        _source_counters[counter] += 1
+
+
+def _store(key, value, negative_ttl):
+    """Cache a source result; None (nothing found, or a failure) is cached as a negative entry"""
+    if value is not None:
+        search_cache.set(key, {'value': value, 'fresh_until': time.time() + SEARCH_CACHE_TTL},
+                         ttl=SEARCH_CACHE_TTL + SEARCH_STALE_TTL)
+    else:
+        search_cache.set(key, {'value': None, 'fresh_until': time.time() + negative_ttl},
+                         ttl=negative_ttl)
+
+
+def _fetch(key, fetch):
+    """fetch(), with a failure reported as None like an empty result"""
+    try:
+        return fetch()
+    except Exception as e:
+        print(f"Search source error for {key}: {e}")
+        return None
+
+
+def _refresh(key, fetch, stale_value, negative_ttl):
+    try:
+        value = _fetch(key, fetch)
+        if value is not None:
+            _store(key, value, negative_ttl)
+        else:
+            # Keep serving the old result, and try again after negative_ttl
+            _count_source('refresh_failures')
+            search_cache.set(key, {'value': stale_value, 'fresh_until': time.time() + negative_ttl},
+                             ttl=negative_ttl + SEARCH_STALE_TTL)
+    except Exception as e:
+        print(f"Search cache refresh error for {key}: {e}")
+    finally:
+        with _source_lock:
+            _refreshing.discard(key)
+
+
+def cached_source(prefix, negative_ttl=None):
+    """
+    Cache a search_* function's results under '<prefix>:<query>'. Its first
+    argument is the query, and it returns None when it finds nothing; an
+    exception it raises is logged and treated the same way. Any other
+    value, empty ones included, is a result.
+    """
+    negative_ttl = SEARCH_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(query, *args, **kwargs):
+            key = f"{prefix}:{query}"
+            entry = search_cache.get(key)
+            if entry is None:
+                value = _fetch(key, functools.partial(func, query, *args, **kwargs))
+                _store(key, value, negative_ttl)
+                return value
+
+            value = entry['value']
+            if value is None:
+                _count_source('negative_hits')
+            elif entry['fresh_until'] <= time.time():
+                _count_source('stale_served')
+                with _source_lock:
+                    start = key not in _refreshing
+                    _refreshing.add(key)
+                if start:
+                    _count_source('refreshes')
+                    _refresh_executor.submit(
+                        _refresh, key, functools.partial(func, query, *args, **kwargs), value, negative_ttl
+                    )
+            return value
+        return wrapper
+    return decorator
+
+
+def source_cache_stats():
+    with _source_lock:
+        return dict(_source_counters, refreshing=len(_refreshing))
@@ -197,19 +197,34 @@ async function processFile() {
             body: formData
         });
 
-        removeLoadingIndicator();
-        const data = await response.json();
+        let data = await response.json();
         
         if (response.ok) {
             // Persist the session_id returned after linking the material
             if (data.session_id) {
                 currentSessionId = data.session_id;
             }
+
+            // The upload is processed in the background - poll until it finishes
+            if (data.job_id) {
+                data = await waitForJob(data.job_id);
+            }
+            removeLoadingIndicator();
+
+            if (data.status === 'failed') {
+                addMessage('assistant', `❌ Error: ${data.error || 'Failed to process file'}`);
+                return;
+            }
+            if (data.status === 'timeout') {
+                addMessage('assistant', '⏳ This file is taking longer than usual to process. Its summary will be in this chat once it is ready - reopen the chat to see it.');
+                return;
+            }
             
             // Add assistant message with summary
             addMessage('assistant', `✅ **${data.filename}** uploaded successfully!\n\n**📝 Summary:**\n\n${data.summary}\n\nFeel free to ask me any questions about this material!`);
             updateChatTitle(data.filename, data.filename);
         } else {
+            removeLoadingIndicator();
             addMessage('assistant', `❌ Error: ${data.error}`);
         }
     } catch (error) {
@@ -219,6 +234,30 @@ async function processFile() {
     }
 }
 
+// Stop polling an upload after this long; the job keeps running on the server
+const JOB_WAIT_TIMEOUT_MS = 20 * 60 * 1000;
+
+async function waitForJob(jobId) {
+    // Poll the ingestion job until it is done or failed, or give up after JOB_WAIT_TIMEOUT_MS
+    const giveUpAt = Date.now() + JOB_WAIT_TIMEOUT_MS;
+    while (Date.now() < giveUpAt) {
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        const response = await fetch(`/api/jobs/${jobId}/`);
+        const job = await response.json();
+        if (!response.ok) {
+            return { status: 'failed', error: job.error };
+        }
+        if (job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+        const loadingEl = document.querySelector('#loadingIndicator .message-content');
+        if (loadingEl && job.stage) {
+            loadingEl.dataset.progress = `${job.stage} ${job.progress}%`;
+        }
+    }
+    return { status: 'timeout' };
+}
+
 async function sendMessage() {
     const input = document.getElementById('messageInput');
     const message = input.value.trim();
@@ -240,8 +279,9 @@ async function sendMessage() {
     isLoading = true;
     showLoadingIndicator();
 
+    let contentEl = null;
     try {
-        const response = await fetch('/api/chat/', {
+        const response = await fetch('/api/chat/stream/', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -253,28 +293,89 @@ async function sendMessage() {
             })
         });
 
-        removeLoadingIndicator();
+        if (!response.ok || !response.body) {
+            removeLoadingIndicator();
+            addMessage('assistant', 'Sorry, I encountered an error. Please try again.');
+            return;
+        }
 
-        if (response.ok) {
-            const data = await response.json();
-            addMessage('assistant', data.response);
-            // CRITICAL: persist the real DB session_id for conversation continuity
-            if (data.session_id) {
+        // Render the answer as it streams in (Server-Sent Events)
+        let answer = '';
+        await readEventStream(response, (event, data) => {
+            if (event === 'session' || event === 'done') {
+                // CRITICAL: persist the real DB session_id for conversation continuity
+                // (new sessions are only saved with the turn, so it arrives with 'done')
                 currentSessionId = data.session_id;
+            } else if (event === 'token') {
+                if (!contentEl) {
+                    removeLoadingIndicator();
+                    contentEl = addMessage('assistant', '');
+                }
+                answer += data.text;
+                renderStreamingMessage(contentEl, answer);
             }
-            updateChatTitle(message);
-        } else {
+        });
+
+        removeLoadingIndicator();
+        if (!contentEl) {
             addMessage('assistant', 'Sorry, I encountered an error. Please try again.');
+            return;
         }
+        renderStreamingMessage(contentEl, answer, true);
+        updateChatTitle(message);
     } catch (error) {
         removeLoadingIndicator();
-        addMessage('assistant', 'Connection error. Please try again.');
+        if (!contentEl) {
+            addMessage('assistant', 'Connection error. Please try again.');
+        }
         console.error('Error:', error);
     } finally {
         isLoading = false;
     }
 }
 
+async function readEventStream(response, onEvent) {
+    // Parse a text/event-stream body, calling onEvent(event, data) per event
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+function renderStreamingMessage(contentEl, text, final = false) {
+    // Re-render markdown at most once per frame while tokens arrive
+    contentEl.dataset.pending = text;
+    if (contentEl.dataset.scheduled && !final) return;
+    const render = () => {
+        delete contentEl.dataset.scheduled;
+        contentEl.innerHTML = marked.parse(cleanMathNotation(contentEl.dataset.pending));
+        const container = document.getElementById('messagesContainer');
+        container.scrollTop = container.scrollHeight;
+    };
+    if (final) {
+        render();
+    } else {
+        contentEl.dataset.scheduled = '1';
+        requestAnimationFrame(render);
+    }
+}
+
 function cleanMathNotation(text) {
     // Unicode superscript and subscript characters
     const superscripts = {
@@ -458,6 +559,8 @@ function addMessage(role, content) {
     
     // Scroll to bottom
     document.getElementById('messagesContainer').scrollTop = document.getElementById('messagesContainer').scrollHeight;
+
+    return contentEl;
 }
 
 function showLoadingIndicator() {
@@ -0,0 +1,151 @@
+"""
+Hierarchical map-reduce condensing of long documents.
+
+The styled summary prompts in ai_service only have room for a few thousand
+words. Longer documents are split into chunks that are condensed into study
+notes in parallel (map), and the notes are merged in groups, level by level
+(reduce), until they fit in a single summary prompt. Each level runs in
+parallel, so wall-clock time grows with the number of levels (logarithmic in
+document length) rather than with the number of chunks.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .llm_scheduler import generate_content, PRIORITY_SUMMARY
+
+# Text up to this size goes straight into the final summary prompt
+SINGLE_PASS_CHARS = 15000
+# Size of each chunk sent to a map call, and of each group merged by a reduce call
+CHUNK_CHARS = 12000
+# Safety net against runaway reduce loops
+MAX_REDUCE_LEVELS = 4
+
+# Concurrency is capped by the shared LLM scheduler; this pool only has to be
+# large enough to keep that cap busy.
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'LLM_MAX_CONCURRENCY', 8),
+    thread_name_prefix='summarizer',
+)
+
+MAP_PROMPT = """You are condensing part {part} of {total} of a study document into notes.
+
+Keep every definition, theorem, formula, worked example, key fact and heading in the original order.
+Write dense bullet-point notes. Do not add an introduction or conclusion.
+
+Document part:
+{text}"""
+
+REDUCE_PROMPT = """Merge these consecutive sets of notes from one study document into a single set of notes.
+
+Keep every definition, theorem, formula, key fact and heading, in the original order. Remove repetition.
+Write dense bullet-point notes. Do not add an introduction or conclusion.
+
+Notes:
+{text}"""
+
+
+def split_into_chunks(text, chunk_chars=CHUNK_CHARS):
+    """Split text into chunks of at most chunk_chars, preferring paragraph boundaries"""
+    chunks = []
+    current = []
+    current_len = 0
+    for paragraph in text.split("\n\n"):
+        # Hard-split paragraphs that are larger than a chunk on their own
+        pieces = [paragraph[i:i + chunk_chars] for i in range(0, len(paragraph), chunk_chars)] or ['']
+        for piece in pieces:
+            if current and current_len + len(piece) + 2 > chunk_chars:
+                chunks.append("\n\n".join(current))
+                current = []
+                current_len = 0
+            current.append(piece)
+            current_len += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _group_for_reduce(notes, group_chars=CHUNK_CHARS):
+    """Group consecutive notes so each group fits in one reduce call (at least two per group)"""
+    groups = []
+    current = []
+    current_len = 0
+    for note in notes:
+        if len(current) >= 2 and current_len + len(note) > group_chars:
+            groups.append(current)
+            current = []
+            current_len = 0
+        current.append(note)
+        current_len += len(note)
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
+
+
+def _condense(model, prompt, fallback):
+    """Run one map/reduce call; on failure keep a truncated copy of the input"""
+    try:
+        response = generate_content(model, prompt, priority=PRIORITY_SUMMARY)
+        if response.text and response.text.strip():
+            return response.text.strip()
+    except Exception as e:
+        print(f"Summary map/reduce step failed, keeping truncated text: {e}")
+    return fallback
+
+
+def condense_text(model, text, target_chars=SINGLE_PASS_CHARS, progress_callback=None):
+    """
+    Return text unchanged if it fits in target_chars, otherwise a hierarchical
+    map-reduce condensation of it that does. progress_callback(done, total)
+    is called as the map or reduce calls of each level complete.
+    """
+    if len(text) <= target_chars:
+        return text
+
+    lock = threading.Lock()
+    progress = {'done': 0, 'total': 0}
+
+    def condense_step(prompt, fallback):
+        result = _condense(model, prompt, fallback)
+        if progress_callback:
+            with lock:
+                progress['done'] += 1
+                try:
+                    progress_callback(progress['done'], progress['total'])
+                except Exception as e:
+                    print(f"Summary progress callback failed: {e}")
+        return result
+
+    chunks = split_into_chunks(text)
+    fallback_chars = max(500, target_chars // max(len(chunks), 1))
+    print(f"Condensing {len(text)} characters in {len(chunks)} chunks")
+
+    # Map: condense every chunk in parallel
+    progress.update(done=0, total=len(chunks))
+    notes = list(_executor.map(
+        lambda args: condense_step(
+            MAP_PROMPT.format(part=args[0] + 1, total=len(chunks), text=args[1]),
+            args[1][:fallback_chars],
+        ),
+        enumerate(chunks),
+    ))
+
+    # Reduce: merge groups of notes level by level until they fit
+    level = 0
+    while len("\n\n".join(notes)) > target_chars and len(notes) > 1 and level < MAX_REDUCE_LEVELS:
+        groups = _group_for_reduce(notes)
+        progress.update(done=0, total=len(groups))
+        notes = list(_executor.map(
+            lambda group: condense_step(
+                REDUCE_PROMPT.format(text="\n\n---\n\n".join(group)),
+                "\n\n".join(group)[:CHUNK_CHARS // 2],
+            ),
+            groups,
+        ))
+        level += 1
+
+    return "\n\n".join(notes)[:target_chars]
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from chat_buddy.answer_cache import answer_cache_key, normalize_question
+from chat_buddy.memory_cache import MemoryCache
+
+
+class MemoryCacheTests(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted_past_max_bytes(self):
+        cache = MemoryCache(max_bytes=10, ttl=60)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        self.assertEqual(cache.get('a'), 'aaaa')  # 'b' is now the oldest
+        cache.set('c', 'cccc')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'aaaa')
+        self.assertEqual(cache.get('c'), 'cccc')
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (2, 8, 1))
+
+    def test_size_is_counted_in_utf8_bytes(self):
+        cache = MemoryCache(max_bytes=4, ttl=60)
+        self.assertTrue(cache.set('a', 'éé'))
+        self.assertFalse(cache.set('b', 'ééé'))
+        self.assertEqual(cache.stats()['bytes'], 4)
+
+    def test_expired_entries_are_misses(self):
+        cache = MemoryCache(max_bytes=100, ttl=60)
+        cache.set('old', 'value', ttl=0)
+        cache.set('new', 'value')
+        self.assertIsNone(cache.get('old'))
+        self.assertEqual(cache.get('new'), 'value')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations']), (1, 1, 1))
+        self.assertEqual(stats['bytes'], 5)
+
+    def test_replacing_a_key_does_not_double_count_it(self):
+        cache = MemoryCache(max_bytes=100, ttl=60)
+        cache.set('a', 'first')
+        cache.set('a', 'second')
+        self.assertEqual(cache.stats()['bytes'], 6)
+        cache.delete('a')
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+
+class AnswerCacheKeyTests(SimpleTestCase):
+    def test_equivalent_questions_share_a_key(self):
+        self.assertEqual(normalize_question("  What is   ATP?? "), "what is atp")
+        self.assertEqual(answer_cache_key("What is ATP?"), answer_cache_key("what is  atp"))
+
+    def test_key_depends_on_the_material(self):
+        notes = SimpleNamespace(pk=1, content_hash='abc')
+        same_file = SimpleNamespace(pk=2, content_hash='abc')
+        legacy = SimpleNamespace(pk=1, content_hash='')
+        key = answer_cache_key("What is ATP?", notes)
+        self.assertEqual(key, answer_cache_key("What is ATP?", same_file))
+        self.assertNotEqual(key, answer_cache_key("What is ATP?"))
+        self.assertNotEqual(key, answer_cache_key("What is ATP?", legacy))
+
+    def test_time_sensitive_questions_are_not_cached(self):
+        self.assertIsNone(answer_cache_key("What is the latest news on the election?"))
+        self.assertIsNone(answer_cache_key("What's the weather today"))
@@ -0,0 +1,50 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat_buddy import ai_service
+from chat_buddy.answer_cache import answer_cache, answer_cache_key, get_cached_answer
+from chat_buddy.models import ChatSession, StudyMaterial
+
+# Matches no reference-lookup keyword, so no web search is started
+QUESTION = "Summarize chapter two for me"
+
+
+class AnswerCacheDuringIngestionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='pw')
+        self.client.force_login(self.user)
+        self.material = StudyMaterial.objects.create(
+            user=self.user, file='materials/upload_1.pdf', file_type='pdf', content_hash='abc123',
+        )
+        answer_cache.clear()
+        self.addCleanup(answer_cache.clear)
+        patcher = mock.patch.object(ai_service, 'generate_content_async', mock.AsyncMock())
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ask(self, answer):
+        self.generate.return_value = mock.Mock(text=answer)
+        session = ChatSession.objects.create(user=self.user, study_material=self.material)
+        response = self.client.post(
+            '/api/chat/', json.dumps({'message': QUESTION, 'session_id': session.id}),
+            content_type='application/json',
+        )
+        return response.json()['response']
+
+    def test_answer_given_before_ingestion_completes_is_not_cached(self):
+        self.assertEqual(self.ask("I can't see the document yet"), "I can't see the document yet")
+        self.assertIsNone(get_cached_answer(answer_cache_key(QUESTION, self.material)))
+
+        # Once ingestion is done the next upload of the same file gets a real answer
+        StudyMaterial.objects.filter(pk=self.material.pk).update(summary="Chapter two covers the Krebs cycle.")
+        self.assertEqual(self.ask("Chapter two is about the Krebs cycle"), "Chapter two is about the Krebs cycle")
+        self.assertEqual(self.generate.await_count, 2)
+
+    def test_answer_about_an_ingested_material_is_cached(self):
+        StudyMaterial.objects.filter(pk=self.material.pk).update(summary="Chapter two covers the Krebs cycle.")
+        self.ask("Chapter two is about the Krebs cycle")
+        self.assertEqual(self.ask("a second, uncached answer"), "Chapter two is about the Krebs cycle")
+        self.assertEqual(self.generate.await_count, 1)
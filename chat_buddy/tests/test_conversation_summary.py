@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat_buddy import conversation_summary
+from chat_buddy.conversation_summary import (
+    KEEP_RECENT_MESSAGES, SUMMARY_EVERY_TURNS, schedule_summary_update, update_session_summary,
+)
+from chat_buddy.models import ChatMessage, ChatSession
+from chat_buddy.tests.test_llm_deadlines import StubServerTestCase
+
+
+class ConversationSummaryTests(TestCase, StubServerTestCase):
+    def setUp(self):
+        user = User.objects.create_user('student', password='pw')
+        self.session = ChatSession.objects.create(user=user)
+        server, stub_model = self.start_stub(latency=0)
+        patcher = mock.patch.object(conversation_summary, 'model', stub_model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_turns(self, count):
+        messages = []
+        for i in range(count):
+            messages.append(ChatMessage.objects.create(session=self.session, role='user', content=f"question {i}"))
+            messages.append(ChatMessage.objects.create(session=self.session, role='assistant', content=f"answer {i}"))
+        return messages
+
+    def test_update_is_scheduled_once_enough_turns_are_unsummarized(self):
+        threshold = KEEP_RECENT_MESSAGES + 2 * SUMMARY_EVERY_TURNS
+        self.addCleanup(conversation_summary._pending.clear)
+        with mock.patch.object(conversation_summary, '_executor') as executor:
+            self.add_turns(threshold // 2 - 1)
+            self.assertFalse(schedule_summary_update(self.session))
+            self.add_turns(1)
+            self.assertTrue(schedule_summary_update(self.session))
+            # Already queued for this session
+            self.assertFalse(schedule_summary_update(self.session))
+        executor.submit.assert_called_once_with(conversation_summary._run_update, self.session.pk)
+
+    def test_older_messages_are_folded_and_the_newest_kept_verbatim(self):
+        messages = self.add_turns(5)
+        self.assertTrue(update_session_summary(self.session.pk))
+        self.session.refresh_from_db()
+        self.assertTrue(self.session.summary.startswith("Stub answer"))
+        self.assertEqual(self.session.summarized_through, messages[-KEEP_RECENT_MESSAGES - 1].id)
+
+        # Nothing new has left the recent window
+        self.assertFalse(update_session_summary(self.session.pk))
+        messages += self.add_turns(2)
+        self.assertTrue(update_session_summary(self.session.pk))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summarized_through, messages[-KEEP_RECENT_MESSAGES - 1].id)
+
+    def test_update_is_dropped_if_another_one_advanced_the_summary_meanwhile(self):
+        messages = self.add_turns(5)
+        generate_content = conversation_summary.generate_content
+
+        def racing_update(*args, **kwargs):
+            ChatSession.objects.filter(pk=self.session.pk).update(
+                summary="newer summary", summarized_through=messages[1].id
+            )
+            return generate_content(*args, **kwargs)
+
+        with mock.patch.object(conversation_summary, 'generate_content', side_effect=racing_update):
+            self.assertFalse(update_session_summary(self.session.pk))
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.summary, self.session.summarized_through), ("newer summary", messages[1].id))
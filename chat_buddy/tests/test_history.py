@@ -0,0 +1,52 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat_buddy import history
+from chat_buddy.history import load_recent_history, load_recent_history_async
+from chat_buddy.models import ChatMessage, ChatSession
+
+
+def message_text(i):
+    """40 characters, i.e. 10 tokens"""
+    return f"message {i:02d} ".ljust(40, '.')
+
+
+class RecentHistoryTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('student', password='pw')
+        self.session = ChatSession.objects.create(user=user)
+        self.messages = [
+            ChatMessage.objects.create(
+                session=self.session, role='user' if i % 2 == 0 else 'assistant', content=message_text(i)
+            )
+            for i in range(12)
+        ]
+
+    def texts(self, entries):
+        return [entry['text'] for entry in entries]
+
+    def test_window_keeps_the_newest_messages_within_budget_oldest_first(self):
+        entries = load_recent_history(self.session, token_budget=35, message_tokens=100)
+        self.assertEqual(self.texts(entries), [message_text(i) for i in (9, 10, 11)])
+        self.assertEqual([entry['role'] for entry in entries], ['assistant', 'user', 'assistant'])
+
+    def test_row_count_is_bounded_whatever_the_budget(self):
+        with mock.patch.object(history, 'HISTORY_MAX_MESSAGES', 4):
+            entries = load_recent_history(self.session, token_budget=10000)
+        self.assertEqual(self.texts(entries), [message_text(i) for i in range(8, 12)])
+
+    def test_messages_covered_by_the_summary_are_skipped(self):
+        entries = load_recent_history(self.session, token_budget=10000, after_id=self.messages[9].id)
+        self.assertEqual(self.texts(entries), [message_text(10), message_text(11)])
+
+    def test_long_messages_are_cut_to_the_per_message_cap(self):
+        ChatMessage.objects.create(session=self.session, role='assistant', content="x" * 400)
+        entries = load_recent_history(self.session, token_budget=45, message_tokens=20)
+        self.assertEqual(self.texts(entries), [message_text(10), message_text(11), "x" * 80])
+
+    def test_async_loader_returns_the_same_window(self):
+        entries = async_to_sync(load_recent_history_async)(self.session, token_budget=35, message_tokens=100)
+        self.assertEqual(entries, load_recent_history(self.session, token_budget=35, message_tokens=100))
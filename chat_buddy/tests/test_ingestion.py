@@ -0,0 +1,152 @@
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from chat_buddy import ingestion
+from chat_buddy.ingestion import (
+    STALE_JOB_TIMEOUT, claim_next_job, enqueue_ingestion, process_job, requeue_stale_jobs,
+    run_job, update_progress,
+)
+from chat_buddy.management.commands import process_ingestion_jobs
+from chat_buddy.models import ChatMessage, ChatSession, IngestionJob, StudyMaterial
+
+
+class IngestionJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='pw')
+        # Extraction and summarization are patched, so the file is never opened
+        self.material = StudyMaterial.objects.create(
+            user=self.user, file='materials/upload_1.pdf', file_type='pdf', original_name='Biology Notes.pdf',
+        )
+        self.session = ChatSession.objects.create(user=self.user, study_material=self.material)
+        self.job = enqueue_ingestion(self.material, session=self.session)
+
+    def patch_pipeline(self, summarize=None):
+        for name, replacement in (
+            ('extract_material', mock.Mock(return_value=[(1, "Photosynthesis")])),
+            ('summarize_pdf', summarize or mock.Mock(return_value="A summary")),
+        ):
+            patcher = mock.patch.object(ingestion, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_a_queued_job_is_claimed_by_exactly_one_worker(self):
+        job = claim_next_job('worker-a')
+        self.assertEqual(job.pk, self.job.pk)
+        self.assertEqual((job.status, job.worker_id, job.attempts), (IngestionJob.STATUS_RUNNING, 'worker-a', 1))
+        self.assertIsNotNone(job.locked_at)
+        self.assertIsNone(claim_next_job('worker-b'))
+
+    def test_oldest_job_is_claimed_first(self):
+        newer = enqueue_ingestion(self.material)
+        self.assertEqual(claim_next_job('worker-a').pk, self.job.pk)
+        self.assertEqual(claim_next_job('worker-b').pk, newer.pk)
+
+    def test_only_stale_running_jobs_are_requeued(self):
+        enqueue_ingestion(self.material)
+        stale = claim_next_job('worker-a')
+        fresh = claim_next_job('worker-b')
+        IngestionJob.objects.filter(pk=stale.pk).update(locked_at=timezone.now() - STALE_JOB_TIMEOUT * 2)
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.worker_id), (IngestionJob.STATUS_QUEUED, ''))
+        self.assertEqual(fresh.status, IngestionJob.STATUS_RUNNING)
+        self.assertEqual(claim_next_job('worker-c').attempts, 2)
+
+    def test_stale_job_out_of_attempts_is_failed_instead_of_requeued(self):
+        IngestionJob.objects.filter(pk=self.job.pk).update(attempts=ingestion.MAX_ATTEMPTS - 1)
+        job = claim_next_job('worker-a')
+        IngestionJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - STALE_JOB_TIMEOUT * 2)
+
+        self.assertEqual(requeue_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestionJob.STATUS_FAILED)
+        self.assertIn("stopped responding", job.error)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(claim_next_job('worker-b'))
+
+    def test_progress_is_only_recorded_by_the_owning_worker(self):
+        job = claim_next_job('worker-a')
+        self.assertTrue(update_progress(job, 50, 'extracting'))
+        IngestionJob.objects.filter(pk=job.pk).update(worker_id='worker-b')
+        self.assertFalse(update_progress(job, 60, 'extracting'))
+        self.assertEqual(IngestionJob.objects.get(pk=job.pk).progress, 50)
+
+    def test_completed_job_posts_the_summary_under_the_upload_name(self):
+        self.patch_pipeline()
+        job = claim_next_job('worker-a')
+        run_job(job)
+
+        job.refresh_from_db()
+        self.material.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (IngestionJob.STATUS_DONE, 100))
+        self.assertEqual(self.material.summary, "A summary")
+        message = ChatMessage.objects.get(session=self.session, role='assistant')
+        self.assertIn("Biology Notes.pdf", message.content)
+
+    def test_result_of_a_worker_that_lost_the_job_is_dropped(self):
+        def summarize_slowly(*args, **kwargs):
+            # Meanwhile the job is declared stale and another worker takes it
+            IngestionJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - STALE_JOB_TIMEOUT * 2)
+            requeue_stale_jobs()
+            claim_next_job('worker-b')
+            return "A late summary"
+
+        self.patch_pipeline(summarize=summarize_slowly)
+        job = claim_next_job('worker-a')
+        with redirect_stdout(StringIO()):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.material.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id), (IngestionJob.STATUS_RUNNING, 'worker-b'))
+        self.assertEqual(self.material.summary, '')
+        self.assertFalse(ChatMessage.objects.filter(session=self.session, role='assistant').exists())
+
+    def test_failed_job_is_requeued_until_out_of_attempts(self):
+        self.patch_pipeline(summarize=mock.Mock(side_effect=RuntimeError("model unavailable")))
+        for attempt in range(1, ingestion.MAX_ATTEMPTS + 1):
+            job = claim_next_job('worker-a')
+            self.assertEqual(job.attempts, attempt)
+            with redirect_stderr(StringIO()):
+                process_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (IngestionJob.STATUS_FAILED, "model unavailable"))
+        self.assertIsNone(claim_next_job('worker-a'))
+
+
+class StopWorker(Exception):
+    pass
+
+
+class WorkerCommandTests(SimpleTestCase):
+    def test_database_error_does_not_stop_the_worker(self):
+        command = process_ingestion_jobs
+        with mock.patch.object(command, 'requeue_stale_jobs'), \
+                mock.patch.object(command, 'claim_next_job', side_effect=[OperationalError("gone away"), None]), \
+                mock.patch.object(command, 'close_old_connections') as close_old_connections, \
+                mock.patch.object(command.time, 'sleep', side_effect=[None, StopWorker]) as sleep, \
+                redirect_stderr(StringIO()):
+            stderr = StringIO()
+            with self.assertRaises(StopWorker):
+                call_command('process_ingestion_jobs', stdout=StringIO(), stderr=stderr)
+        # The error was logged, connections reset, and the next poll found an empty queue
+        self.assertIn("gone away", stderr.getvalue())
+        self.assertGreaterEqual(close_old_connections.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_once_mode_raises_errors(self):
+        command = process_ingestion_jobs
+        with mock.patch.object(command, 'requeue_stale_jobs', side_effect=OperationalError("gone away")), \
+                mock.patch.object(command, 'close_old_connections'):
+            with self.assertRaises(OperationalError):
+                call_command('process_ingestion_jobs', '--once', stdout=StringIO())
@@ -0,0 +1,50 @@
+from django.test import SimpleTestCase
+
+from chat_buddy.intents import (
+    GREETING_RESPONSE, INAPPROPRIATE_RESPONSE, THANKS_RESPONSE, PhraseAutomaton,
+    is_current_event_question, is_time_sensitive, route_message, tokenize,
+)
+
+
+class PhraseAutomatonTests(SimpleTestCase):
+    def test_finds_overlapping_phrases_in_one_pass(self):
+        automaton = PhraseAutomaton({'a': ['holy spirit'], 'b': ['spirit'], 'c': ['the holy grail']})
+        self.assertEqual(automaton.labels(tokenize("The Holy Spirit")), {'a', 'b'})
+        self.assertEqual(automaton.labels(tokenize("the holy grail")), {'c'})
+        self.assertEqual(automaton.labels(tokenize("holy water")), set())
+
+
+class RouteMessageTests(SimpleTestCase):
+    def test_greetings_and_thanks_are_answered_locally(self):
+        self.assertEqual(route_message("Hi there!").reply, GREETING_RESPONSE)
+        self.assertEqual(route_message("hello buddy").reply, GREETING_RESPONSE)
+        self.assertEqual(route_message("Thank you so much!").reply, THANKS_RESPONSE)
+        self.assertEqual(route_message("hey, thanks").reply, THANKS_RESPONSE)
+
+    def test_questions_are_not_small_talk(self):
+        self.assertIsNone(route_message("Hi, what is photosynthesis?").reply)
+        self.assertIsNone(route_message("good").reply)
+        self.assertIsNone(route_message("").reply)
+
+    def test_inappropriate_requests_are_refused_locally(self):
+        route = route_message("show me NSFW pictures")
+        self.assertTrue(route.is_inappropriate)
+        self.assertEqual(route.reply, INAPPROPRIATE_RESPONSE)
+        self.assertIsNone(route_message("explicit formula for the roots").reply)
+
+    def test_christian_topics(self):
+        self.assertTrue(route_message("What does the Bible say about forgiveness?").is_christian_topic)
+        self.assertTrue(route_message("Who is the Holy Spirit?").is_christian_topic)
+        self.assertFalse(route_message("Explain the spirit of the law").is_christian_topic)
+
+    def test_keywords_match_whole_words_only(self):
+        self.assertFalse(is_time_sensitive("I know the answer"))
+        self.assertFalse(is_current_event_question("How does software work?"))
+        self.assertTrue(is_time_sensitive("What is happening now?"))
+        self.assertTrue(is_time_sensitive("price of gold"))
+
+    def test_reference_questions_need_a_lookup(self):
+        route = route_message("Who's the founder of Wikipedia?")
+        self.assertTrue(route.needs_lookup)
+        self.assertFalse(route.is_time_sensitive)
+        self.assertFalse(route_message("Solve 2x + 3 = 7").needs_lookup)
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from chat_buddy.llm_scheduler import (
+    PRIORITY_INTERACTIVE, AdaptiveLimiter, LLMDeadlineExceeded, LLMScheduler, _request_with_timeout,
+)
+from chat_buddy.llm_stub import StubLLMServer, StubModel
+
+PROMPT = "Question: Walk me through the Krebs cycle step by step\nAnswer:"
+
+
+class StubServerTestCase(SimpleTestCase):
+    """Runs a StubLLMServer on a free port for the duration of a test"""
+
+    def start_stub(self, latency):
+        server = StubLLMServer(('127.0.0.1', 0), latency=latency, jitter=0, slow_rate=0, chunk_delay=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+        return server, StubModel(f"http://{host}:{port}")
+
+
+class SchedulerDeadlineTests(StubServerTestCase):
+    def test_waiting_for_a_slot_counts_against_the_deadline(self):
+        limiter = AdaptiveLimiter(1, 1, 1)
+        scheduler = LLMScheduler(limiter)
+        limiter.acquire(PRIORITY_INTERACTIVE)
+        calls = []
+        started = time.monotonic()
+        with self.assertRaises(LLMDeadlineExceeded):
+            scheduler.call(calls.append, priority=PRIORITY_INTERACTIVE, deadline=0.2)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(calls, [])
+        self.assertEqual(scheduler.deadline_exceeded, 1)
+        self.assertEqual(limiter.stats()['waiting'], 0)
+
+    def test_async_slot_wait_is_bounded_too(self):
+        limiter = AdaptiveLimiter(1, 1, 1)
+        scheduler = LLMScheduler(limiter)
+        limiter.acquire(PRIORITY_INTERACTIVE)
+
+        async def request():
+            return 'answer'
+
+        with self.assertRaises(LLMDeadlineExceeded):
+            asyncio.run(scheduler.call_async(request, priority=PRIORITY_INTERACTIVE, deadline=0.2))
+        limiter.release()
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+    def test_slow_sync_request_gives_up_at_the_deadline(self):
+        server, model = self.start_stub(latency=3)
+        scheduler = LLMScheduler(AdaptiveLimiter(2, 1, 2), max_retries=1, backoff_base=0)
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            scheduler.call(
+                lambda timeout: _request_with_timeout(lambda: model.generate_content("q"), timeout),
+                deadline=0.5,
+            )
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(scheduler.limiter.stats()['in_flight'], 0)
+
+    def test_fast_request_returns_the_stub_answer(self):
+        server, model = self.start_stub(latency=0)
+        scheduler = LLMScheduler(AdaptiveLimiter(2, 1, 2))
+        response = scheduler.call(
+            lambda timeout: _request_with_timeout(lambda: model.generate_content(PROMPT), timeout), deadline=5
+        )
+        self.assertIn("Walk me through the Krebs cycle", response.text)
+        self.assertEqual(server.stats()['requests'], 1)
+
+    def test_stream_yields_every_chunk(self):
+        server, model = self.start_stub(latency=0)
+        scheduler = LLMScheduler(AdaptiveLimiter(2, 1, 2))
+
+        async def collect():
+            chunks = scheduler.stream_async(lambda: model.generate_content_async(PROMPT, stream=True), deadline=5)
+            return [chunk.text async for chunk in chunks]
+
+        chunks = asyncio.run(collect())
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(''.join(chunks).strip().endswith("the Krebs cycle step by step"))
+        self.assertEqual(scheduler.limiter.stats()['in_flight'], 0)
+
+
+class StubModelTests(StubServerTestCase):
+    def test_unknown_request_fields_are_rejected_like_the_pinned_sdk(self):
+        server, model = self.start_stub(latency=0)
+        with self.assertRaisesMessage(ValueError, "request_options"):
+            model.generate_content("q", request_options={'timeout': 5})
+        with self.assertRaises(ValueError):
+            asyncio.run(model.generate_content_async("q", request_options={'timeout': 5}))
+        self.assertEqual(server.stats()['requests'], 0)
+
+
+class HedgingTests(SimpleTestCase):
+    def test_slow_interactive_request_is_hedged_and_the_faster_copy_wins(self):
+        scheduler = LLMScheduler(AdaptiveLimiter(2, 1, 2), hedge_min_delay=0.05)
+        for _ in range(20):
+            scheduler.latency.record(('call', PRIORITY_INTERACTIVE), 0.05)
+        attempts = []
+
+        async def request():
+            first = not attempts
+            attempts.append(time.monotonic())
+            await asyncio.sleep(2 if first else 0)
+            return 'primary' if first else 'hedge'
+
+        started = time.monotonic()
+        result = asyncio.run(scheduler.call_async(request, priority=PRIORITY_INTERACTIVE, deadline=5))
+        self.assertEqual(result, 'hedge')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((scheduler.hedged, scheduler.hedge_wins), (1, 1))
+        self.assertEqual(scheduler.limiter.stats()['in_flight'], 0)
+
+    def test_bulk_requests_are_not_hedged(self):
+        scheduler = LLMScheduler(AdaptiveLimiter(2, 1, 2), hedge_min_delay=0.01)
+        for _ in range(20):
+            scheduler.latency.record(('call', PRIORITY_INTERACTIVE), 0.01)
+
+        async def request():
+            await asyncio.sleep(0.1)
+            return 'answer'
+
+        self.assertEqual(asyncio.run(scheduler.call_async(request, deadline=5)), 'answer')
+        self.assertEqual(scheduler.hedged, 0)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from chat_buddy.llm_scheduler import (
+    AdaptiveLimiter, LLMScheduler, PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_SUMMARY,
+)
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    def test_overload_halves_limit_once_per_cooldown(self):
+        limiter = AdaptiveLimiter(initial_limit=8, min_limit=1, max_limit=8, cooldown=60)
+        limiter.on_overload()
+        limiter.on_overload()
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.stats()['throttled'], 2)
+
+    def test_overload_never_goes_below_min_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=2, min_limit=1, max_limit=8, cooldown=0)
+        for _ in range(5):
+            limiter.on_overload()
+        self.assertEqual(limiter.limit, 1)
+
+    def test_success_grows_limit_additively_up_to_max(self):
+        limiter = AdaptiveLimiter(initial_limit=2, min_limit=1, max_limit=3)
+        # +1/limit per success: 2 -> 2.5 -> 2.9 -> 3
+        limiter.on_success()
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 2)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+        for _ in range(20):
+            limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+
+    def test_free_slot_goes_to_highest_priority_waiter(self):
+        limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_limit=1)
+        limiter.acquire(PRIORITY_BULK)
+        order = []
+
+        def wait_for_slot(priority):
+            limiter.acquire(priority)
+            order.append(priority)
+            limiter.release()
+
+        threads = []
+        for priority in (PRIORITY_BULK, PRIORITY_SUMMARY, PRIORITY_INTERACTIVE):
+            thread = threading.Thread(target=wait_for_slot, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            # Queue them in this order, lowest priority first
+            while limiter.stats()['waiting'] < len(threads):
+                time.sleep(0.01)
+
+        limiter.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, [PRIORITY_INTERACTIVE, PRIORITY_SUMMARY, PRIORITY_BULK])
+
+    def test_try_acquire_does_not_jump_the_queue(self):
+        limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_limit=1)
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release()
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+
+class SchedulerRetryTests(SimpleTestCase):
+    def test_throttled_call_is_retried_and_shrinks_the_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=4, min_limit=1, max_limit=8)
+        scheduler = LLMScheduler(limiter, max_retries=2, backoff_base=0)
+        attempts = []
+
+        def flaky(timeout):
+            attempts.append(timeout)
+            if len(attempts) == 1:
+                raise TimeoutError("throttled")
+            return 'answer'
+
+        self.assertEqual(scheduler.call(flaky, deadline=10), 'answer')
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+    def test_other_errors_are_not_retried(self):
+        scheduler = LLMScheduler(AdaptiveLimiter(2, 1, 2), backoff_base=0)
+        calls = []
+
+        def broken(timeout):
+            calls.append(timeout)
+            raise ValueError("bad request")
+
+        with self.assertRaises(ValueError):
+            scheduler.call(broken, deadline=10)
+        self.assertEqual(len(calls), 1)
@@ -0,0 +1,84 @@
+import os
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase
+from PIL import Image
+
+from chat_buddy import ai_service
+from chat_buddy.ai_service import extract_pdf_pages
+from chat_buddy.extraction_cache import get_cached_pages, get_or_extract_pages
+
+TEXT_PAGE = "Photosynthesis converts light energy into chemical energy stored in glucose."
+
+
+def write_pdf(path, page_texts):
+    """Write a minimal PDF with one page per entry; None gives a page with no text layer"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in page_texts:
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode('latin-1') if text else b""
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R"
+                       b" /Resources << /Font << /F1 3 0 R >> >> >>" % len(objects))
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+class MixedPdfExtractionTests(TestCase):
+    """A PDF with a text layer on most pages and one scanned (image-only) page"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'notes.pdf')
+        write_pdf(self.path, [TEXT_PAGE, None, TEXT_PAGE.replace('glucose', 'starch')])
+
+    def extract(self):
+        with redirect_stdout(StringIO()):
+            return extract_pdf_pages(self.path)
+
+    def test_rasterization_failure_keeps_the_text_layer_pages(self):
+        with mock.patch.object(ai_service, 'convert_from_path', side_effect=OSError("poppler not installed")):
+            pages = self.extract()
+        self.assertEqual([number for number, _ in pages], [1, 3])
+        self.assertIn("stored in starch", pages[1][1])
+        self.assertEqual(pages.failed_pages, [2])
+
+    def test_vision_failure_on_a_page_keeps_the_other_pages(self):
+        with mock.patch.object(ai_service, 'convert_from_path', return_value=[Image.new('RGB', (20, 20))]), \
+                mock.patch.object(ai_service, 'generate_content', side_effect=TimeoutError("deadline")):
+            pages = self.extract()
+        self.assertEqual([number for number, _ in pages], [1, 3])
+        self.assertEqual(pages.failed_pages, [2])
+
+    def test_scanned_page_is_transcribed_when_vision_works(self):
+        response = mock.Mock(text="Handwritten notes on the Calvin cycle")
+        with mock.patch.object(ai_service, 'convert_from_path', return_value=[Image.new('RGB', (20, 20))]), \
+                mock.patch.object(ai_service, 'generate_content', return_value=response):
+            pages = self.extract()
+        self.assertEqual(pages[1], (2, "Handwritten notes on the Calvin cycle"))
+        self.assertEqual(pages.failed_pages, [])
+
+    def test_partial_extraction_is_not_cached(self):
+        with mock.patch.object(ai_service, 'convert_from_path', side_effect=OSError("poppler not installed")), \
+                redirect_stdout(StringIO()):
+            pages = get_or_extract_pages('abc123', 'pdf', lambda: extract_pdf_pages(self.path))
+        self.assertEqual(len(pages), 2)
+        self.assertIsNone(get_cached_pages('abc123', 'pdf'))
@@ -0,0 +1,67 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase
+
+from chat_buddy import persistence
+from chat_buddy.models import ChatMessage, ChatSession
+from chat_buddy.persistence import TurnWriter, persist_turn
+
+
+class WriteBehindTests(TransactionTestCase):
+    """The writer thread uses its own connection, so turns must really be committed"""
+
+    def setUp(self):
+        user = User.objects.create_user('student', password='pw')
+        self.session = ChatSession.objects.create(user=user)
+        self.writer = TurnWriter()
+        for name, value in (('WRITE_BEHIND', True), ('turn_writer', self.writer)):
+            patcher = mock.patch.object(persistence, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def contents(self, session):
+        return list(ChatMessage.objects.filter(session=session).order_by('id').values_list('role', 'content'))
+
+    def test_submitted_turns_are_written_in_order(self):
+        for i in range(3):
+            persist_turn(self.session, f"question {i}", f"answer {i}")
+        self.assertTrue(self.writer.flush(5))
+        self.assertEqual(self.contents(self.session), [
+            ('user', 'question 0'), ('assistant', 'answer 0'),
+            ('user', 'question 1'), ('assistant', 'answer 1'),
+            ('user', 'question 2'), ('assistant', 'answer 2'),
+        ])
+
+    def test_new_session_is_written_immediately(self):
+        session = ChatSession(user=self.session.user)
+        persist_turn(session, "hello?", "hi!")
+        self.assertIsNotNone(session.pk)
+        self.assertEqual(len(self.contents(session)), 2)
+        self.assertIsNone(self.writer._thread)
+
+    def test_failed_batch_is_retried_turn_by_turn_and_the_bad_turn_logged(self):
+        deleted = ChatSession.objects.create(user=self.session.user)
+        ChatSession.objects.filter(pk=deleted.pk).delete()
+        out = StringIO()
+        with redirect_stdout(out):
+            # Queued together, so they are written as one batch
+            self.writer._queue.put((self.session, "question", "answer"))
+            self.writer._queue.put((deleted, "orphan question", "orphan answer"))
+            self.writer._ensure_started()
+            self.assertTrue(self.writer.flush(5))
+        self.assertEqual(self.contents(self.session), [('user', 'question'), ('assistant', 'answer')])
+        self.assertIn(f"Dropping chat turn for session {deleted.pk}", out.getvalue())
+
+    def test_writer_error_is_logged_and_later_turns_still_written(self):
+        out = StringIO()
+        with redirect_stdout(out), \
+                mock.patch.object(persistence, 'close_old_connections', side_effect=[RuntimeError("boom"), None]):
+            persist_turn(self.session, "lost question", "lost answer")
+            self.assertTrue(self.writer.flush(5))
+            persist_turn(self.session, "question", "answer")
+            self.assertTrue(self.writer.flush(5))
+        self.assertIn("Write-behind writer failed, dropping 1 chat turns: boom", out.getvalue())
+        self.assertEqual(self.contents(self.session), [('user', 'question'), ('assistant', 'answer')])
@@ -0,0 +1,63 @@
+from contextlib import redirect_stdout
+from io import StringIO
+
+from django.test import SimpleTestCase
+
+from chat_buddy.prompts import (
+    SECTION_HISTORY, SECTION_MATERIAL, SECTION_REFERENCE, SECTION_SEPARATOR, PromptAssembler,
+)
+
+
+def build(assembler):
+    with redirect_stdout(StringIO()):
+        return assembler.build()
+
+
+class PromptAssemblerTests(SimpleTestCase):
+    def test_sections_are_joined_in_order_and_empty_ones_skipped(self):
+        prompt = build(
+            PromptAssembler('test', 1000)
+            .add('system', "Be helpful.")
+            .add('material', '', header="Material:\n", priority=SECTION_MATERIAL)
+            .add('question', "What is ATP?", header="Question: ")
+        )
+        self.assertEqual(prompt, "Be helpful." + SECTION_SEPARATOR + "Question: What is ATP?")
+
+    def test_section_cap_keeps_the_configured_end(self):
+        assembler = (
+            PromptAssembler('test', 1000)
+            .add('material', "a" * 40 + "b" * 40, priority=SECTION_MATERIAL, max_tokens=10)
+            .add('history', "c" * 40 + "d" * 40, priority=SECTION_HISTORY, max_tokens=10, keep='end')
+        )
+        material, history = build(assembler).split(SECTION_SEPARATOR)
+        self.assertEqual(material, "a" * 40)
+        self.assertEqual(history, "d" * 40)
+
+    def test_over_budget_trims_lowest_priority_first(self):
+        assembler = (
+            PromptAssembler('test', 30)
+            .add('system', "s" * 80)
+            .add('material', "m" * 80, priority=SECTION_MATERIAL)
+            .add('reference', "r" * 80, priority=SECTION_REFERENCE)
+            .add('history', "h" * 80, priority=SECTION_HISTORY, keep='end')
+        )
+        build(assembler)
+        sizes = {section.name: section.tokens for section in assembler.sections}
+        # 50 tokens over: history (20) and reference (20) go entirely, then
+        # material gives up the remaining 10
+        self.assertEqual(sizes, {'system': 20, 'material': 10})
+
+    def test_required_sections_are_never_trimmed(self):
+        assembler = PromptAssembler('test', 5).add('system', "s" * 80).add('question', "q" * 80)
+        self.assertEqual(build(assembler), "s" * 80 + SECTION_SEPARATOR + "q" * 80)
+
+    def test_build_logs_the_size_breakdown(self):
+        out = StringIO()
+        assembler = (
+            PromptAssembler('chat', 25)
+            .add('system', "s" * 40)
+            .add('history', "h" * 80, priority=SECTION_HISTORY)
+        )
+        with redirect_stdout(out):
+            assembler.build()
+        self.assertEqual(out.getvalue().strip(), "Prompt [chat]: ~25 tokens (system=10, history=15), trimmed: history")
@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from chat_buddy.models import MaterialChunk, MaterialIndex, StudyMaterial
+from chat_buddy.retrieval import (
+    INDEX_VERSION, BM25Index, load_material_index, retrieve_material_context, tokenize,
+)
+
+CHUNKS = [
+    (1, "Photosynthesis converts light energy into chemical energy in plants."),
+    (2, "The mitochondria is the powerhouse of the cell and makes ATP."),
+    (3, "Chlorophyll absorbs light; photosynthesis happens in the chloroplast."),
+    (None, "Cell division: mitosis produces two identical daughter cells."),
+]
+
+
+class BM25IndexTests(SimpleTestCase):
+    def test_tokenize_drops_stopwords_and_single_letters(self):
+        self.assertEqual(tokenize("What is the Krebs cycle, a b 7?"), ['krebs', 'cycle', '7'])
+
+    def test_search_ranks_matching_chunks_best_first(self):
+        index = BM25Index.build(CHUNKS)
+        ranked = [ordinal for ordinal, _ in index.search("how does photosynthesis use light")]
+        self.assertEqual(set(ranked), {0, 2})
+        self.assertNotIn(1, ranked)
+
+    def test_rarer_terms_weigh_more(self):
+        index = BM25Index.build(CHUNKS)
+        # 'chloroplast' occurs in one chunk, 'cell' in two
+        best, _ = index.search("cell chloroplast")[0]
+        self.assertEqual(best, 2)
+
+    def test_search_respects_top_k_and_unknown_terms(self):
+        index = BM25Index.build(CHUNKS)
+        self.assertEqual(len(index.search("cell light energy", top_k=1)), 1)
+        self.assertEqual(index.search("quantum chromodynamics"), [])
+        self.assertEqual(BM25Index.build([]).search("cell"), [])
+
+    def test_page_references_select_chunks_on_that_page(self):
+        index = BM25Index.build(CHUNKS)
+        self.assertEqual(index.page_chunks("what does page 2 say?"), [1])
+        self.assertEqual(index.page_chunks("summarize the chapter"), [])
+
+    def test_serialization_round_trip_preserves_scores(self):
+        index = BM25Index.build(CHUNKS)
+        restored = BM25Index.from_bytes(index.to_bytes())
+        self.assertEqual(restored.terms, index.terms)
+        self.assertEqual(list(restored.doc_pages), [1, 2, 3, 0])
+        for query in ("photosynthesis light", "cell", "mitosis daughter cells"):
+            self.assertEqual(restored.search(query), index.search(query))
+
+
+class MaterialRetrievalTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('reader', password='pw')
+        self.material = StudyMaterial.objects.create(user=user, file='materials/bio.pdf', file_type='pdf')
+        for ordinal, (page_number, text) in enumerate(CHUNKS):
+            MaterialChunk.objects.create(
+                material=self.material, ordinal=ordinal, page_number=page_number, text=text,
+                char_start=0, char_end=len(text),
+            )
+
+    def test_missing_or_outdated_index_is_rebuilt_from_chunks(self):
+        self.assertIsNotNone(load_material_index(self.material))
+        MaterialIndex.objects.filter(material=self.material).update(version=INDEX_VERSION - 1)
+        load_material_index(self.material)
+        self.assertEqual(MaterialIndex.objects.get(material=self.material).version, INDEX_VERSION)
+
+    def test_context_lists_excerpts_in_document_order(self):
+        context = retrieve_material_context(self.material, "chloroplast photosynthesis")
+        self.assertLess(context.index("[Page 1]"), context.index("[Page 3]"))
+        self.assertNotIn("mitochondria", context)
+
+    def test_context_stays_within_token_budget(self):
+        self.assertIsNone(retrieve_material_context(self.material, "photosynthesis", token_budget=1))
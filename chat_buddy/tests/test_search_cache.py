@@ -0,0 +1,173 @@
+import sqlite3
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chat_buddy import search_cache
+from chat_buddy.memory_cache import MemoryCache
+from chat_buddy.search_cache import DjangoCache, SQLiteCache, cached_source, json_size, source_cache_stats
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'cache.sqlite3'
+
+    def accessed_at(self, key):
+        with sqlite3.connect(self.path) as db:
+            return db.execute("SELECT accessed_at FROM entries WHERE key = ?", (key,)).fetchone()[0]
+
+    def test_least_recently_read_entry_is_evicted_past_max_bytes(self):
+        # JSON of 'aaaa' is 6 bytes, so two entries fit
+        cache = SQLiteCache(self.path, max_bytes=12, ttl=60)
+        cache.set('a', 'aaaa')
+        time.sleep(0.01)
+        cache.set('b', 'bbbb')
+        time.sleep(0.01)
+        self.assertEqual(cache.get('a'), 'aaaa')
+        time.sleep(0.01)
+        cache.set('c', 'cccc')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), ('aaaa', 'cccc'))
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (2, 12, 1))
+
+    def test_reads_are_written_in_batches(self):
+        cache = SQLiteCache(self.path, max_bytes=100, ttl=60)
+        cache.ACCESS_BATCH = 2
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        stored_at = self.accessed_at('a')
+        time.sleep(0.01)
+        cache.get('a')
+        cache.get('a')
+        self.assertEqual(self.accessed_at('a'), stored_at)
+        # The second distinct key read fills the batch
+        cache.get('b')
+        self.assertGreater(self.accessed_at('a'), stored_at)
+        self.assertGreater(self.accessed_at('b'), stored_at)
+
+    def test_expired_entries_are_misses(self):
+        cache = SQLiteCache(self.path, max_bytes=100, ttl=60)
+        cache.set('old', 'value', ttl=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('old'))
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['misses'], stats['expirations']), (0, 1, 1))
+
+    def test_entries_are_shared_through_the_file(self):
+        SQLiteCache(self.path, max_bytes=100, ttl=60).set('key', {'title': 'ATP'})
+        other_worker = SQLiteCache(self.path, max_bytes=100, ttl=60)
+        self.assertEqual(other_worker.get('key'), {'title': 'ATP'})
+        other_worker.clear()
+        self.assertEqual(other_worker.stats()['entries'], 0)
+
+
+class DjangoCacheTests(SimpleTestCase):
+    def make_cache(self):
+        # The test settings' default cache is local memory; a per-test prefix keeps tests apart
+        return DjangoCache('default', ttl=60, prefix=f"test-search:{self._testMethodName}:")
+
+    def test_get_set_delete(self):
+        cache = self.make_cache()
+        cache.set('query with spaces', {'title': 'ATP'})
+        self.assertEqual(cache.get('query with spaces'), {'title': 'ATP'})
+        cache.delete('query with spaces')
+        self.assertIsNone(cache.get('query with spaces'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 1, 0))
+
+    def test_clear_moves_every_process_to_a_new_version(self):
+        cache, other_worker = self.make_cache(), self.make_cache()
+        other_worker.VERSION_CHECK_INTERVAL = 0
+        cache.set('key', 'value')
+        self.assertEqual(other_worker.get('key'), 'value')
+        cache.clear()
+        self.assertIsNone(cache.get('key'))
+        self.assertIsNone(other_worker.get('key'))
+        self.assertEqual(cache.stats()['version'], 2)
+
+    def test_entries_dropped_by_the_backend_count_as_evictions(self):
+        cache = self.make_cache()
+        cache.set('key', 'value')
+        cache.set('expired', 'value', ttl=0)
+        cache.cache.delete(cache._key('key'), version=cache._current_version())
+        self.assertIsNone(cache.get('key'))
+        self.assertIsNone(cache.get('expired'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class CachedSourceTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(search_cache, 'search_cache', MemoryCache(10000, 60, sizeof=json_size))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def source(self, *results, negative_ttl=60):
+        """A cached source returning results in turn; exceptions are raised"""
+        @cached_source('test', negative_ttl=negative_ttl)
+        def search(query):
+            result = results[len(self.calls)]
+            self.calls.append(query)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return search
+
+    def wait_for_refresh(self):
+        for _ in range(200):
+            if not source_cache_stats()['refreshing']:
+                return
+            time.sleep(0.01)
+        self.fail("background refresh did not finish")
+
+    def test_nothing_found_is_cached_as_a_negative_entry(self):
+        search = self.source(None, 'late result')
+        negative_hits = source_cache_stats()['negative_hits']
+        self.assertIsNone(search('ATP'))
+        self.assertIsNone(search('ATP'))
+        self.assertEqual(self.calls, ['ATP'])
+        self.assertEqual(source_cache_stats()['negative_hits'], negative_hits + 1)
+
+    def test_failure_is_cached_as_a_negative_entry(self):
+        search = self.source(ConnectionError("down"), 'late result')
+        with redirect_stdout(StringIO()):
+            self.assertIsNone(search('ATP'))
+        self.assertIsNone(search('ATP'))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_empty_results_are_results(self):
+        search = self.source([], ['late result'])
+        self.assertEqual(search('ATP'), [])
+        self.assertEqual(search('ATP'), [])
+        self.assertEqual(len(self.calls), 1)
+
+    @mock.patch.object(search_cache, 'SEARCH_CACHE_TTL', 0)
+    def test_stale_result_is_served_while_refreshed(self):
+        search = self.source('old', 'new', 'newer')
+        self.assertEqual(search('ATP'), 'old')
+        self.assertEqual(search('ATP'), 'old')
+        self.wait_for_refresh()
+        self.assertEqual(self.calls, ['ATP', 'ATP'])
+        self.assertEqual(search('ATP'), 'new')
+        self.wait_for_refresh()
+
+    @mock.patch.object(search_cache, 'SEARCH_CACHE_TTL', 0)
+    def test_failed_refresh_keeps_the_stale_result(self):
+        search = self.source('old', ConnectionError("down"))
+        failures = source_cache_stats()['refresh_failures']
+        with redirect_stdout(StringIO()):
+            self.assertEqual(search('ATP'), 'old')
+            self.assertEqual(search('ATP'), 'old')
+            self.wait_for_refresh()
+        # Not refreshed again until negative_ttl has passed
+        self.assertEqual(search('ATP'), 'old')
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(source_cache_stats()['refresh_failures'], failures + 1)
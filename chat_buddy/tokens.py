@@ -0,0 +1,20 @@
+"""
+Cheap token accounting for prompt budgets.
+
+Gemini does not expose a local tokenizer, so budgets use the usual
+~4 characters per token approximation for English text.
+"""
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Approximate the number of tokens in text"""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def chars_for_tokens(token_count):
+    """Approximate the number of characters that fit in token_count tokens"""
+    return token_count * CHARS_PER_TOKEN
@@ -7,10 +7,13 @@ urlpatterns = [
     path('auth/signup/', views.signup_view, name='signup'),
     path('auth/logout/', views.logout_view, name='logout'),
     path('chat/', views.chat_view, name='chat'),
-    path('api/process-pdf/', views.PDFUploadView.as_view(), name='process-pdf'),
-    path('api/process-image/', views.ImageUploadView.as_view(), name='process-image'),
+    path('api/process-pdf/', views.process_pdf, name='process-pdf'),
+    path('api/process-image/', views.process_image, name='process-image'),
     path('api/chat/', views.chat_api, name='chat-api'),
-    path('api/upload/', views.FileUploadView.as_view(), name='upload-file'),
+    path('api/chat/stream/', views.chat_stream_api, name='chat-stream-api'),
+    path('api/upload/', views.upload_file, name='upload-file'),
+    path('api/jobs/<int:job_id>/', views.get_job_status, name='job-status'),
+    path('api/metrics/', views.get_metrics, name='metrics'),
     path('api/chat-history/', views.get_chat_history, name='chat-history'),
     path('api/current-user/', views.get_current_user, name='current-user'),
 ]
@@ -6,19 +6,30 @@ from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.views import APIView
-from .models import StudyMaterial, ChatSession, ChatMessage
-from .ai_service import summarize_pdf, summarize_image, summarize_document, ask_buddy
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from .models import StudyMaterial, ChatSession, IngestionJob
+from .ai_service import (
+    summarize_pdf, summarize_image, ask_buddy_async, stream_buddy_async, count_pdf_pages, join_pages,
+    ReferenceLookup,
+)
+from .extraction_cache import hash_uploaded_file
+from .answer_cache import answer_cache, answer_cache_key
+from .llm_scheduler import scheduler as llm_scheduler
+from .history import load_recent_history_async, is_upload_message
+from .http_client import pool_stats as http_pool_stats
+from .intents import route_message
+from .ingestion import accept_upload, extract_material
+from .persistence import persist_turn
+from .prompts import CHAT_SYSTEM_PROMPT
+from .retrieval import retrieve_material_context_async
+from .search_cache import search_cache, source_cache_stats
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.authtoken.models import Token
-import os
 import json
-import PyPDF2
 
 def landing_view(request):
     """Render the landing page with user context"""
@@ -177,7 +188,7 @@ def get_chat_history(request):
         
         chat_data = []
         for session in sessions:
-            messages = session.messages.all().order_by('created_at')
+            messages = session.messages.all().order_by('created_at', 'id')
             chat_data.append({
                 'session_id': session.id,
                 'created_at': session.created_at.isoformat(),
@@ -220,304 +231,298 @@ def register_view(request):
         'username': user.username
     }, status=status.HTTP_201_CREATED)
 
-@method_decorator(csrf_exempt, name='dispatch')
-class PDFUploadView(APIView):
-    parser_classes = (MultiPartParser, FormParser)
-    
-    def post(self, request, *args, **kwargs):
+def _request_data(request):
+    """Body of a plain (non-DRF) view's request: parsed JSON, or form fields"""
+    if request.content_type == 'application/json':
         try:
-            pdf_file = request.FILES.get('pdf')
-            
-            if not pdf_file:
-                return Response({'error': 'No PDF file provided'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            
-            if not pdf_file.name.lower().endswith('.pdf'):
-                return Response({'error': 'File must be a PDF'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            
-            # Handle both in-memory and temporary files
-            if hasattr(pdf_file, 'temporary_file_path'):
-                pdf_path = pdf_file.temporary_file_path()
-            else:
-                # For in-memory files, save temporarily
-                import tempfile
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-                    for chunk in pdf_file.chunks():
-                        tmp.write(chunk)
-                    pdf_path = tmp.name
-            
-            try:
-                # Extract page count
-                page_count = 0
-                try:
-                    with open(pdf_path, 'rb') as f:
-                        pdf_reader = PyPDF2.PdfReader(f)
-                        page_count = len(pdf_reader.pages)
-                except:
-                    page_count = "Unknown"
-                
-                # Get AI summary using Gemini
-                summary_response = summarize_pdf(pdf_path)
-                
-                # Parse the summary to extract key topics
-                key_topics = []
-                try:
-                    # Try to extract topics from summary
-                    if "topics:" in summary_response.lower():
-                        topics_section = summary_response.lower().split("topics:")[1].split("\n")[0]
-                        key_topics = [t.strip() for t in topics_section.split(",")][:5]
-                    else:
-                        # Generate basic topics from first few words
-                        words = summary_response.split()[:10]
-                        key_topics = [w for w in words if len(w) > 5][:3]
-                except:
-                    key_topics = ["Study Material", "Educational Content"]
-                
-                # Save to database
-                study_material = StudyMaterial.objects.create(
-                    file=pdf_file,
-                    file_type='pdf',
-                    summary=summary_response
-                )
-                
-                return Response({
-                    'id': study_material.id,
-                    'filename': pdf_file.name,
-                    'pages': page_count,
-                    'summary': summary_response,
-                    'key_topics': key_topics,
-                    'uploaded_at': study_material.uploaded_at.isoformat()
-                }, status=status.HTTP_201_CREATED)
-                
-            finally:
-                # Clean up temp file if we created one
-                if not hasattr(pdf_file, 'temporary_file_path'):
-                    try:
-                        os.unlink(pdf_path)
-                    except:
-                        pass
-            
-        except Exception as e:
-            return Response({
-                'error': f'Failed to process PDF: {str(e)}',
-                'details': 'Please ensure the PDF is not corrupted and try again.'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
 
 
-@method_decorator(csrf_exempt, name='dispatch')
-class ImageUploadView(APIView):
-    parser_classes = (MultiPartParser, FormParser)
-    
-    def post(self, request, *args, **kwargs):
+async def _discard_material(study_material):
+    """Delete a material that could not be processed, with its stored file"""
+    await sync_to_async(study_material.file.delete)(save=False)
+    await study_material.adelete()
+
+
+@csrf_exempt
+@require_POST
+async def process_pdf(request):
+    try:
+        pdf_file = request.FILES.get('pdf')
+        
+        if not pdf_file:
+            return JsonResponse({'error': 'No PDF file provided'}, 
+                                status=status.HTTP_400_BAD_REQUEST)
+        
+        if not pdf_file.name.lower().endswith('.pdf'):
+            return JsonResponse({'error': 'File must be a PDF'}, 
+                                status=status.HTTP_400_BAD_REQUEST)
+        
+        content_hash = await sync_to_async(hash_uploaded_file)(pdf_file)
+
+        # Write the upload to storage once and extract from the stored copy
+        study_material = await StudyMaterial.objects.acreate(
+            file=pdf_file,
+            file_type='pdf',
+            content_hash=content_hash
+        )
+        pdf_path = study_material.file.path
+        
         try:
-            image_file = request.FILES.get('image')
-            
-            if not image_file:
-                return Response({'error': 'No image file provided'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            
-            # Check if file is an image
-            allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-            if not any(image_file.name.lower().endswith(ext) for ext in allowed_extensions):
-                return Response({'error': 'File must be an image (JPG, PNG, GIF, BMP, WebP)'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
+            # Extract page count
+            page_count = 0
+            try:
+                page_count = await sync_to_async(count_pdf_pages)(pdf_path)
+            except:
+                page_count = "Unknown"
             
-            # Handle both in-memory and temporary files
-            if hasattr(image_file, 'temporary_file_path'):
-                image_path = image_file.temporary_file_path()
-            else:
-                # For in-memory files, save temporarily
-                import tempfile
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp:
-                    for chunk in image_file.chunks():
-                        tmp.write(chunk)
-                    image_path = tmp.name
+            # Get AI summary using Gemini (extraction is skipped for known files).
+            # Extraction and map-reduce summarization are thread-pool work, so
+            # they run off the event loop.
+            pdf_text = join_pages(await sync_to_async(extract_material)(study_material))
+            summary_response = await sync_to_async(summarize_pdf)(pdf_path, extracted_text=pdf_text)
             
+            # Parse the summary to extract key topics
+            key_topics = []
             try:
-                # Get AI summary using image OCR
-                summary_response = summarize_image(image_path)
-                
-                # Parse the summary to extract key topics
-                key_topics = []
-                try:
+                # Try to extract topics from summary
+                if "topics:" in summary_response.lower():
+                    topics_section = summary_response.lower().split("topics:")[1].split("\n")[0]
+                    key_topics = [t.strip() for t in topics_section.split(",")][:5]
+                else:
+                    # Generate basic topics from first few words
                     words = summary_response.split()[:10]
                     key_topics = [w for w in words if len(w) > 5][:3]
-                except:
-                    key_topics = ["Image Content", "Extracted Text"]
-                
-                # Save to database
-                study_material = StudyMaterial.objects.create(
-                    file=image_file,
-                    file_type='image',
-                    summary=summary_response
-                )
-                
-                return Response({
-                    'id': study_material.id,
-                    'filename': image_file.name,
-                    'summary': summary_response,
-                    'key_topics': key_topics,
-                    'uploaded_at': study_material.uploaded_at.isoformat()
-                }, status=status.HTTP_201_CREATED)
-                
-            finally:
-                # Clean up temp file if we created one
-                if not hasattr(image_file, 'temporary_file_path'):
-                    try:
-                        os.unlink(image_path)
-                    except:
-                        pass
+            except:
+                key_topics = ["Study Material", "Educational Content"]
+            
+            # Save to database
+            study_material.summary = summary_response
+            await study_material.asave(update_fields=['summary'])
             
-        except Exception as e:
-            return Response({
-                'error': f'Failed to process image: {str(e)}',
-                'details': 'Please ensure the image is valid and try again.'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return JsonResponse({
+                'id': study_material.id,
+                'filename': pdf_file.name,
+                'pages': page_count,
+                'summary': summary_response,
+                'key_topics': key_topics,
+                'uploaded_at': study_material.uploaded_at.isoformat()
+            }, status=status.HTTP_201_CREATED)
+            
+        except Exception:
+            # Don't keep materials that could not be processed
+            await _discard_material(study_material)
+            raise
+        
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Failed to process PDF: {str(e)}',
+            'details': 'Please ensure the PDF is not corrupted and try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@api_view(['POST'])
-def chat_api(request):
+@csrf_exempt
+@require_POST
+async def process_image(request):
     try:
-        # SECURITY: Require authentication
-        if not request.user.is_authenticated:
-            return JsonResponse({'error': 'Not authenticated'}, status=401)
-        
-        # Get data from request
-        user_message = request.data.get('message', '').strip()
-        session_id = request.data.get('session_id')
-        
-        if not user_message:
-            return JsonResponse({'error': 'Message is required'}, status=400)
+        image_file = request.FILES.get('image')
         
-        # Check for Christian/Biblical content
-        christian_keywords = ['god', 'jesus', 'christ', 'bible', 'scripture', 'prayer', 
-                            'faith', 'christian', 'church', 'lord', 'salvation', 
-                            'gospel', 'holy spirit', 'worship']
-        is_christian_topic = any(keyword in user_message.lower() for keyword in christian_keywords)
+        if not image_file:
+            return JsonResponse({'error': 'No image file provided'}, 
+                                status=status.HTTP_400_BAD_REQUEST)
         
-        # Check for inappropriate content
-        inappropriate_keywords = ['sex', 'porn', 'explicit', 'nsfw', 'nude']
-        is_inappropriate = any(keyword in user_message.lower() for keyword in inappropriate_keywords)
+        # Check if file is an image
+        allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
+        if not any(image_file.name.lower().endswith(ext) for ext in allowed_extensions):
+            return JsonResponse({'error': 'File must be an image (JPG, PNG, GIF, BMP, WebP)'}, 
+                                status=status.HTTP_400_BAD_REQUEST)
         
-        # Get or create chat session
-        session = None
-        material = None
-        material_context = None
+        content_hash = await sync_to_async(hash_uploaded_file)(image_file)
+
+        # Write the upload to storage once and extract from the stored copy
+        study_material = await StudyMaterial.objects.acreate(
+            file=image_file,
+            file_type='image',
+            content_hash=content_hash
+        )
+        image_path = study_material.file.path
         
-        if session_id:
+        try:
+            # Get AI summary using image OCR (extraction is skipped for known files)
+            image_text = join_pages(await sync_to_async(extract_material)(study_material))
+            summary_response = await sync_to_async(summarize_image)(image_path, extracted_text=image_text)
+            
+            # Parse the summary to extract key topics
+            key_topics = []
             try:
-                session = ChatSession.objects.get(id=session_id, user=request.user)
-                if session.study_material:
-                    material = session.study_material
-                    material_context = f"Document Context ({material.file.name}):\n{material.summary}"
-            except ChatSession.DoesNotExist:
-                # Create new session if not found (only for current user)
-                session = ChatSession.objects.create(user=request.user)
-        else:
-            # Create new session associated with current user
-            session = ChatSession.objects.create(user=request.user)
-        
-        # Build system context for AI
-        system_context = """You are LearnBuddy, a friendly and helpful AI study assistant with EXPERT-LEVEL mathematics expertise. Your personality:
-
-1. CHRISTIAN TOPICS: You are VERY engaged, encouraging, and knowledgeable about Biblical topics. 
-   - Provide Scripture references when relevant
-   - Encourage spiritual growth and Bible study
-   - Be warm and uplifting in discussing faith matters
-   - Quote relevant Bible verses to support your explanations
-   
-2. EDUCATIONAL CONTENT: You help students understand study materials deeply
-   - Break down complex topics into simple explanations
-   - Provide examples and analogies
-   - Ask clarifying questions to ensure understanding
-   - Be patient and supportive
-   
-3. MATHEMATICAL TOPICS: You are a MATHEMATICS GENIUS who helps students master math.
-   
-   CORE MATHEMATICS INSTRUCTIONS:
-   - Solve problems step-by-step with crystal clear explanations
-   - Use proper mathematical terminology (not LaTeX symbols)
-   - Never use raw symbols like $ or fractions like \frac{}{} - convert to readable formats
-   - Example: Instead of "x = \frac{12}{3}" write "x = 12 divided by 3 = 4"
-   - Example: Instead of "$x^2 + 5x + 6$" write "x squared plus 5x plus 6"
-   
-   FORMATTING FOR MATH:
-   - Use words for mathematical operations: "divided by", "times", "plus", "minus", "equals"
-   - Use "^" for exponents: "x^2 means x squared"
-   - Use "/" for fractions: "12/3 = 4" (read as "12 divided by 3 equals 4")
-   - Use special symbols when available: ≈ (approximately), ≠ (not equal), ≤ (less than or equal)
-   - Break equations into digestible parts with explanations between steps
-   
-   SOLVING PROBLEMS:
-   - Always show work step-by-step
-   - Label each step clearly: "Step 1:", "Step 2:", etc.
-   - Explain WHY you're doing each operation
-   - Highlight the final answer clearly
-   - Simplify to lowest terms and simplest form
-   - Show alternative methods when useful
-   
-   TONE FOR MATH:
-   - Make the student feel confident and capable
-   - Celebrate small victories in the problem
-   - Use encouraging language: "Great question!", "Let's break this down!", "You've got this!"
-   - Make complex math feel simple and achievable
-   - Help user feel like a mathematics genius when solving with you
-   
-4. INAPPROPRIATE CONTENT: Politely redirect to educational topics
-   - Stay professional and respectful
-   - Guide conversation back to learning
-   
-5. GENERAL TONE: Friendly, encouraging, and helpful with emojis for warmth"""
-
-        if is_inappropriate:
-            response_text = "I'm designed to be a study assistant focused on educational content. I'd be happy to help you with academic materials, study questions, or discussions about faith and biblical principles. What can I help you learn about today?"
-        else:
-            # Build conversation history from database
-            conversation_history = []
-            db_messages = session.messages.order_by('created_at')[:30]  # Last 30 messages
+                words = summary_response.split()[:10]
+                key_topics = [w for w in words if len(w) > 5][:3]
+            except:
+                key_topics = ["Image Content", "Extracted Text"]
             
-            for msg in db_messages:
-                conversation_history.append({
-                    "role": msg.role if msg.role in ['user', 'assistant'] else 'user',
-                    "parts": [msg.content],
-                    "text": msg.content
-                })
+            # Save to database
+            study_material.summary = summary_response
+            await study_material.asave(update_fields=['summary'])
             
-            # Add enhanced context for Christian topics
-            if is_christian_topic:
-                system_context += "\n\nNOTE: This is a question about Christian faith. Provide a warm, biblically-grounded response with Scripture references."
+            return JsonResponse({
+                'id': study_material.id,
+                'filename': image_file.name,
+                'summary': summary_response,
+                'key_topics': key_topics,
+                'uploaded_at': study_material.uploaded_at.isoformat()
+            }, status=status.HTTP_201_CREATED)
             
+        except Exception:
+            # Don't keep materials that could not be processed
+            await _discard_material(study_material)
+            raise
+        
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Failed to process image: {str(e)}',
+            'details': 'Please ensure the image is valid and try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def _prepare_chat_turn(request):
+    """
+    Validate a chat request and gather everything needed to answer it.
+    Returns (turn, None) with turn a dict of ask_buddy arguments plus the
+    session, or (None, error_response).
+    """
+    # SECURITY: Require authentication
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None, JsonResponse({'error': 'Not authenticated'}, status=401)
+    
+    # Get data from request
+    data = _request_data(request)
+    user_message = str(data.get('message') or '').strip()
+    session_id = data.get('session_id')
+    
+    if not user_message:
+        return None, JsonResponse({'error': 'Message is required'}, status=400)
+    
+    # Christian/Biblical topic, inappropriate content, greetings etc. in one
+    # scan; trivial and inappropriate messages get a local reply
+    route = route_message(user_message)
+    local_reply = route.reply
+
+    # Start the web reference search now, so it runs while the session,
+    # history and material excerpts load; the answer waits for it only
+    # until its deadline
+    reference_lookup = None if local_reply else ReferenceLookup(user_message)
+    
+    # Get or create chat session
+    session = None
+    material = None
+    material_context = None
+    # Until ingestion finishes a material has no excerpts and no summary
+    material_pending = False
+    
+    if session_id:
+        try:
+            session = await (ChatSession.objects
+                             .select_related('study_material')
+                             .aget(id=session_id, user=user))
+            material = session.study_material
+            if material and not local_reply:
+                excerpts = await retrieve_material_context_async(material, user_message)
+                if excerpts:
+                    material_context = f"Document Excerpts ({material.file.name}):\n{excerpts}"
+                else:
+                    # Nothing in the document matches (e.g. "summarize this"): fall back to the summary
+                    material_context = f"Document Context ({material.file.name}):\n{material.summary}"
+                    material_pending = not material.summary
+        except ChatSession.DoesNotExist:
+            # Start a new session if not found (only for current user)
+            session = ChatSession(user=user)
+    else:
+        # New session for the current user; it is saved together with the turn
+        session = ChatSession(user=user)
+    
+    # Static instructions, identical on every turn so they can be cached upstream
+    system_context = CHAT_SYSTEM_PROMPT
+
+    conversation_history = []
+    cache_key = None
+    if not local_reply:
+        # Messages since the rolling summary, within the history token budget
+        if session.pk is not None:
+            conversation_history = await load_recent_history_async(session, after_id=session.summarized_through)
+
+        # Answers that do not depend on the conversation so far can be shared:
+        # first questions (upload messages aside), or when the client opts in.
+        # An answer given before the material was ingested saw none of it, so
+        # it must not be cached under the material.
+        standalone = str(data.get('standalone', '')).lower() in ('1', 'true')
+        if not material_pending and (standalone or (not session.summary and all(
+                is_upload_message(msg['text']) for msg in conversation_history))):
+            cache_key = answer_cache_key(user_message, material)
+
+    return {
+        'session': session,
+        'user_message': user_message,
+        'conversation_history': conversation_history,
+        'conversation_summary': session.summary,
+        'material_context': material_context,
+        'system_context': system_context,
+        'is_christian_topic': route.is_christian_topic,
+        'local_reply': local_reply,
+        'cache_key': cache_key,
+        'reference_lookup': reference_lookup,
+    }, None
+
+
+def _fallback_response(turn):
+    """Reply used when the AI service fails for a turn"""
+    if turn['is_christian_topic']:
+        return "That's a wonderful question about faith! While I'm having trouble accessing my full knowledge right now, I'd encourage you to explore the Scriptures directly. The Bible says in James 1:5, 'If any of you lacks wisdom, you should ask God, who gives generously to all without finding fault, and it will be given to you.' Could you rephrase your question, or would you like to discuss a specific Bible passage?"
+    elif turn['material_context']:
+        return "I understand you're asking about the material you uploaded. I'm having a brief technical issue, but I'm here to help! Could you please rephrase your question or be more specific about which section you'd like me to explain?"
+    return "I'm experiencing a brief technical difficulty. Please try rephrasing your question, or if you have study materials, upload them so I can provide more specific help!"
+
+
+async def _save_turn(session, user_message, response_text):
+    """Save a user message and the assistant's reply (and a new session) in one transaction"""
+    await sync_to_async(persist_turn)(session, user_message, response_text)
+
+
+def _ask_buddy_kwargs(turn):
+    return {
+        'conversation_history': turn['conversation_history'],
+        'conversation_summary': turn['conversation_summary'],
+        'material_context': turn['material_context'],
+        'system_context': turn['system_context'],
+        'is_christian_topic': turn['is_christian_topic'],
+        'cache_key': turn['cache_key'],
+        'reference_lookup': turn['reference_lookup'],
+    }
+
+
+@require_POST
+async def chat_api(request):
+    try:
+        turn, error_response = await _prepare_chat_turn(request)
+        if error_response:
+            return error_response
+        session = turn['session']
+
+        if turn['local_reply']:
+            response_text = turn['local_reply']
+        else:
             # Get AI response
             try:
-                response_text = ask_buddy(
-                    user_message,
-                    conversation_history=conversation_history,
-                    material_context=material_context,
-                    system_context=system_context,
-                    is_christian_topic=is_christian_topic
-                )
+                response_text = await ask_buddy_async(turn['user_message'], **_ask_buddy_kwargs(turn))
             except Exception as e:
                 # Fallback response if AI service fails
-                if is_christian_topic:
-                    response_text = "That's a wonderful question about faith! While I'm having trouble accessing my full knowledge right now, I'd encourage you to explore the Scriptures directly. The Bible says in James 1:5, 'If any of you lacks wisdom, you should ask God, who gives generously to all without finding fault, and it will be given to you.' Could you rephrase your question, or would you like to discuss a specific Bible passage?"
-                elif material_context:
-                    response_text = "I understand you're asking about the material you uploaded. I'm having a brief technical issue, but I'm here to help! Could you please rephrase your question or be more specific about which section you'd like me to explain?"
-                else:
-                    response_text = "I'm experiencing a brief technical difficulty. Please try rephrasing your question, or if you have study materials, upload them so I can provide more specific help!"
+                response_text = _fallback_response(turn)
         
         # Save messages to database
-        ChatMessage.objects.create(
-            session=session,
-            role='user',
-            content=user_message
-        )
-        
-        ChatMessage.objects.create(
-            session=session,
-            role='assistant',
-            content=response_text
-        )
+        await _save_turn(session, turn['user_message'], response_text)
         
         return JsonResponse({
             'response': response_text,
@@ -534,135 +539,175 @@ def chat_api(request):
         }, status=500)
 
 
-# Unified file upload and summarization endpoint
-@method_decorator(csrf_exempt, name='dispatch')
-class FileUploadView(APIView):
-    parser_classes = (MultiPartParser, FormParser)
-    
-    def post(self, request, *args, **kwargs):
+def _sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@require_POST
+async def chat_stream_api(request):
+    """
+    Streaming variant of chat_api. The answer is sent as Server-Sent Events
+    while Gemini generates it: a 'session' event (for existing sessions;
+    new ones are only saved with the turn), 'token' events carrying text
+    pieces, then 'done' with the session id once the reply has been saved.
+    """
+    try:
+        turn, error_response = await _prepare_chat_turn(request)
+        if error_response:
+            return error_response
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({
+            'error': 'An error occurred processing your message',
+            'details': str(e)
+        }, status=500)
+
+    session = turn['session']
+
+    async def events():
+        if session.pk is not None:
+            yield _sse_event('session', {'session_id': session.id})
+        pieces = []
+        completed = False
         try:
-            # SECURITY: Require authentication
-            if not request.user.is_authenticated:
-                return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
-            
-            uploaded_file = request.FILES.get('file')
-            
-            if not uploaded_file:
-                return Response({'error': 'No file provided'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            
-            filename = uploaded_file.name.lower()
-            file_type = 'unknown'
-            summary = ""
-            
-            # Determine file type
-            if filename.endswith('.pdf'):
-                file_type = 'pdf'
-            elif filename.endswith(('.jpg', '.jpeg')):
-                file_type = 'image'
-            elif filename.endswith('.png'):
-                file_type = 'image'
-            elif filename.endswith('.gif'):
-                file_type = 'image'
-            elif filename.endswith(('.doc', '.docx')):
-                file_type = 'document'
+            if turn['local_reply']:
+                pieces.append(turn['local_reply'])
+                yield _sse_event('token', {'text': turn['local_reply']})
             else:
-                return Response({'error': 'File type not supported. Please use PDF, images (JPG, JPEG, PNG, GIF), or documents (DOC, DOCX)'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            
-            # Save file temporarily and process
-            import tempfile
-            temp_path = None
-            
-            try:
-                # Create temp file
-                if file_type == 'pdf':
-                    suffix = '.pdf'
-                elif file_type == 'image':
-                    suffix = filename[filename.rfind('.'):]
-                elif file_type == 'document':
-                    suffix = filename[filename.rfind('.'):]
-                else:
-                    suffix = ''
-                
-                with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                    for chunk in uploaded_file.chunks():
-                        tmp.write(chunk)
-                    temp_path = tmp.name
-                
-                # Process based on file type
-                user_message = request.data.get('user_message', '').strip()
-                if file_type == 'pdf':
-                    summary = summarize_pdf(temp_path, user_instruction=user_message)
-                elif file_type == 'image':
-                    summary = summarize_image(temp_path, user_instruction=user_message)
-                else:  # document (Word documents)
-                    summary = summarize_document(temp_path, user_instruction=user_message)
-                
-                # Save to database (associate with current user)
-                study_material = StudyMaterial.objects.create(
-                    user=request.user,
-                    file=uploaded_file,
-                    file_type=file_type,
-                    summary=summary
-                )
-
-                # Link material to the current chat session so follow-up questions
-                # can reference it.  Accept an optional session_id from the frontend.
-                session_id = request.data.get('session_id')
-                session = None
-                if session_id:
-                    try:
-                        session = ChatSession.objects.get(id=session_id, user=request.user)
-                        session.study_material = study_material
-                        session.save()
-                    except (ChatSession.DoesNotExist, ValueError):
-                        session = None
-
-                # No active session yet - create one bound to this material
-                if not session:
-                    session = ChatSession.objects.create(
-                        user=request.user,
-                        study_material=study_material
-                    )
-
-                # Store the user's upload message so it appears in conversation history.
-                user_bubble = f"\ud83d\udcce {uploaded_file.name}"
-                if user_message:
-                    user_bubble += f"\n\n{user_message}"
-                ChatMessage.objects.create(
-                    session=session,
-                    role='user',
-                    content=user_bubble
-                )
-
-                # Store the upload event as an assistant message so it appears in
-                # conversation history for future turns.
-                ChatMessage.objects.create(
-                    session=session,
-                    role='assistant',
-                    content=f"[Uploaded file: {uploaded_file.name}]\n\nSummary:\n{summary}"
-                )
-
-                return Response({
-                    'id': study_material.id,
-                    'filename': uploaded_file.name,
-                    'file_type': file_type,
-                    'summary': summary,
-                    'uploaded_at': study_material.uploaded_at,
-                    'session_id': session.id,
-                }, status=status.HTTP_201_CREATED)
-                
-            finally:
-                # Clean up temp file
-                if temp_path and os.path.exists(temp_path):
-                    try:
-                        os.unlink(temp_path)
-                    except:
-                        pass
-            
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return Response({'error': f'Failed to process file: {str(e)}'}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+                try:
+                    async for piece in stream_buddy_async(turn['user_message'], **_ask_buddy_kwargs(turn)):
+                        pieces.append(piece)
+                        yield _sse_event('token', {'text': piece})
+                except Exception as e:
+                    print(f"Chat stream failed after {len(pieces)} pieces: {e}")
+                    if not pieces:
+                        fallback = _fallback_response(turn)
+                        pieces.append(fallback)
+                        yield _sse_event('token', {'text': fallback})
+            completed = True
+        finally:
+            # Also runs when the client disconnects mid-answer, so the
+            # partial reply is kept in the conversation
+            if pieces:
+                await _save_turn(session, turn['user_message'], ''.join(pieces))
+        if completed:
+            yield _sse_event('done', {
+                'session_id': session.id,
+                'timestamp': str(session.created_at),
+            })
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the whole stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Unified file upload endpoint: stores the file and queues ingestion
+@csrf_exempt
+@require_POST
+async def upload_file(request):
+    try:
+        # SECURITY: Require authentication
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
+        
+        uploaded_file = request.FILES.get('file')
+        
+        if not uploaded_file:
+            return JsonResponse({'error': 'No file provided'}, 
+                                status=status.HTTP_400_BAD_REQUEST)
+        
+        filename = uploaded_file.name.lower()
+        file_type = 'unknown'
+        
+        # Determine file type
+        if filename.endswith('.pdf'):
+            file_type = 'pdf'
+        elif filename.endswith(('.jpg', '.jpeg')):
+            file_type = 'image'
+        elif filename.endswith('.png'):
+            file_type = 'image'
+        elif filename.endswith('.gif'):
+            file_type = 'image'
+        elif filename.endswith(('.doc', '.docx')):
+            file_type = 'document'
+        else:
+            return JsonResponse({'error': 'File type not supported. Please use PDF, images (JPG, JPEG, PNG, GIF), or documents (DOC, DOCX)'}, 
+                                status=status.HTTP_400_BAD_REQUEST)
+        
+        content_hash = await sync_to_async(hash_uploaded_file)(uploaded_file)
+        user_message = request.POST.get('user_message', '').strip()
+
+        # Store the file, link it to the chat session (an optional session_id
+        # from the frontend, else a new session bound to the material), post
+        # the upload bubble and queue the job, all in one transaction.
+        # Extraction and summarization run in the ingestion worker.
+        study_material, session, job = await sync_to_async(accept_upload)(
+            user, uploaded_file, file_type, content_hash,
+            session_id=request.POST.get('session_id'),
+            user_message=user_message,
+        )
+
+        return JsonResponse({
+            'job_id': job.id,
+            'status': job.status,
+            'id': study_material.id,
+            'filename': uploaded_file.name,
+            'file_type': file_type,
+            'uploaded_at': study_material.uploaded_at,
+            'session_id': session.id,
+        }, status=status.HTTP_202_ACCEPTED)
+        
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'error': f'Failed to process file: {str(e)}'}, 
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def get_job_status(request, job_id):
+    """Report status, progress and (when done) the summary of an ingestion job"""
+    try:
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Not authenticated'}, status=401)
+
+        try:
+            job = IngestionJob.objects.select_related('study_material').get(id=job_id, user=request.user)
+        except IngestionJob.DoesNotExist:
+            return JsonResponse({'error': 'Job not found'}, status=404)
+
+        material = job.study_material
+        return JsonResponse({
+            'job_id': job.id,
+            'status': job.status,
+            'stage': job.stage,
+            'progress': job.progress,
+            'error': job.error if job.status == IngestionJob.STATUS_FAILED else None,
+            'id': material.id,
+            'filename': material.display_name,
+            'file_type': material.file_type,
+            'summary': material.summary if job.status == IngestionJob.STATUS_DONE else None,
+            'session_id': job.session_id,
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_metrics(request):
+    """Cache, LLM scheduler and outbound HTTP pool counters, for staff"""
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({'error': 'Not authorized'}, status=403)
+
+    return JsonResponse({
+        'answer_cache': answer_cache.stats(),
+        'llm_scheduler': llm_scheduler.stats(),
+        'http_pools': http_pool_stats(),
+        'search_cache': search_cache.stats(),
+        'search_sources': source_cache_stats(),
+    })
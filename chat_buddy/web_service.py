@@ -1,13 +1,20 @@
 import aiohttp
 import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as futures_wait
 from bs4 import BeautifulSoup
-import requests
 import re
 from urllib.parse import quote
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 
+from django.conf import settings
+
+from .http_client import http_get
+from .intents import route_message
+from .memory_cache import MemoryCache
+from .search_cache import cached_source, search_cache
+
 try:
     import feedparser
     FEEDPARSER_AVAILABLE = True
@@ -15,41 +22,21 @@ except ImportError:
     FEEDPARSER_AVAILABLE = False
     print("Note: feedparser not installed – Google News RSS disabled. Run: pip install feedparser")
 
-# Simple in-memory cache to avoid duplicate requests
-search_cache = {}
-CACHE_DURATION = 3600  # Cache for 1 hour
-
-def get_cached_search(query):
-    """Get cached search results if they exist and are fresh"""
-    if query in search_cache:
-        cached_time, cached_results = search_cache[query]
-        if datetime.now() - cached_time < timedelta(seconds=CACHE_DURATION):
-            return cached_results
-    return None
-
-def cache_search_results(query, results):
-    """Cache search results"""
-    search_cache[query] = (datetime.now(), results)
+# Search results are cached under '<source>:<query>' keys; see search_cache.py
 
 
 # ---------------------------------------------------------------------------
 # Wikipedia helpers
 # ---------------------------------------------------------------------------
 
-def search_wikipedia(query):
+@cached_source('wiki')
+def search_wikipedia(query, timeout=8):
     """
     Search Wikipedia for information about a topic.
     Returns a dict with title, snippet, url.
     """
     try:
-        cached = get_cached_search(f"wiki:{query}")
-        if cached:
-            return cached
-
         search_url = "https://en.wikipedia.org/w/api.php"
-        headers = {
-            'User-Agent': 'LearnBuddy/1.0 (Educational AI Assistant; +https://learnbuddy.app)'
-        }
         params = {
             'action': 'query',
             'list': 'search',
@@ -58,7 +45,7 @@ def search_wikipedia(query):
             'srlimit': 3
         }
 
-        response = requests.get(search_url, params=params, headers=headers, timeout=8)
+        response = http_get(search_url, params=params, timeout=timeout)
         response.raise_for_status()
 
         data = response.json()
@@ -76,7 +63,6 @@ def search_wikipedia(query):
                 'snippet': snippet,
                 'url': f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}"
             }
-            cache_search_results(f"wiki:{query}", result)
             return result
 
         return None
@@ -86,20 +72,14 @@ def search_wikipedia(query):
         return None
 
 
-def get_wikipedia_full_extract(title):
+@cached_source('wiki_extract')
+def get_wikipedia_full_extract(title, timeout=10):
     """
     Fetch the full plain-text extract of a Wikipedia article by its title.
     Returns up to 6 000 characters of text.
     """
     try:
-        cached = get_cached_search(f"wiki_extract:{title}")
-        if cached:
-            return cached
-
         url = "https://en.wikipedia.org/w/api.php"
-        headers = {
-            'User-Agent': 'LearnBuddy/1.0 (Educational AI Assistant; +https://learnbuddy.app)'
-        }
         params = {
             'action': 'query',
             'prop': 'extracts',
@@ -109,7 +89,7 @@ def get_wikipedia_full_extract(title):
             'format': 'json',
         }
 
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = http_get(url, params=params, timeout=timeout)
         response.raise_for_status()
         data = response.json()
 
@@ -119,7 +99,6 @@ def get_wikipedia_full_extract(title):
                 extract = page.get('extract', '')
                 if extract:
                     extract = extract[:6000]
-                    cache_search_results(f"wiki_extract:{title}", extract)
                     return extract
 
         return None
@@ -133,17 +112,14 @@ def get_wikipedia_full_extract(title):
 # DuckDuckGo Instant Answer
 # ---------------------------------------------------------------------------
 
-def search_duckduckgo_instant(query):
+@cached_source('ddg')
+def search_duckduckgo_instant(query, timeout=10):
     """
     Query the free DuckDuckGo Instant Answer API.
     Returns a structured dict with abstract, infobox, related topics, etc.
     Works well for people, places, organisations, concepts.
     """
     try:
-        cached = get_cached_search(f"ddg:{query}")
-        if cached:
-            return cached
-
         url = "https://api.duckduckgo.com/"
         params = {
             'q': query,
@@ -152,11 +128,8 @@ def search_duckduckgo_instant(query):
             'skip_disambig': '1',
             't': 'learnbuddy'
         }
-        headers = {
-            'User-Agent': 'LearnBuddy/1.0 (Educational AI Assistant; +https://learnbuddy.app)'
-        }
 
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = http_get(url, params=params, timeout=timeout)
         response.raise_for_status()
         data = response.json()
 
@@ -194,7 +167,6 @@ def search_duckduckgo_instant(query):
                 result['related_topics'] = topics
 
         if result:
-            cache_search_results(f"ddg:{query}", result)
             return result
 
         return None
@@ -243,25 +215,19 @@ def _query_is_book(q):
 # MusicBrainz  – free, no API key required, great for artists/albums
 # ---------------------------------------------------------------------------
 
-def search_musicbrainz(query):
+@cached_source('mb')
+def search_musicbrainz(query, timeout=10):
     """
     Search MusicBrainz for artist info → releases → recordings.
     Returns a structured dict with biography, albums, and recent songs.
     """
     try:
-        cached = get_cached_search(f"mb:{query}")
-        if cached:
-            return cached
-
-        headers = {
-            'User-Agent': 'LearnBuddy/1.0 (Educational AI Assistant; learnbuddy@example.com)',
-            'Accept': 'application/json',
-        }
+        headers = {'Accept': 'application/json'}
 
         # Step 1 – find the artist
         artist_url = "https://musicbrainz.org/ws/2/artist/"
         params = {'query': query, 'fmt': 'json', 'limit': 3}
-        r = requests.get(artist_url, params=params, headers=headers, timeout=10)
+        r = http_get(artist_url, params=params, headers=headers, timeout=timeout)
         r.raise_for_status()
         artists = r.json().get('artists', [])
 
@@ -291,7 +257,7 @@ def search_musicbrainz(query):
                 'limit': 10,
                 'type': 'album',
             }
-            rr = requests.get(releases_url, params=rp, headers=headers, timeout=10)
+            rr = http_get(releases_url, params=rp, headers=headers, timeout=timeout)
             if rr.ok:
                 for rel in rr.json().get('releases', [])[:10]:
                     result['albums'].append({
@@ -303,12 +269,11 @@ def search_musicbrainz(query):
             # Step 3 – top recordings
             rec_url = "https://musicbrainz.org/ws/2/recording/"
             rec_p = {'artist': artist_id, 'fmt': 'json', 'limit': 10}
-            rc = requests.get(rec_url, params=rec_p, headers=headers, timeout=10)
+            rc = http_get(rec_url, params=rec_p, headers=headers, timeout=timeout)
             if rc.ok:
                 for rec in rc.json().get('recordings', [])[:10]:
                     result['recordings'].append(rec.get('title', ''))
 
-        cache_search_results(f"mb:{query}", result)
         return result
 
     except Exception as e:
@@ -320,20 +285,65 @@ def search_musicbrainz(query):
 # Wikidata  – free structured knowledge graph, excellent for people/entities
 # ---------------------------------------------------------------------------
 
-def search_wikidata(query):
+WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+# wbgetentities accepts at most 50 ids per request
+WIKIDATA_IDS_PER_REQUEST = 50
+
+# English labels of referenced entities ("United States", "singer") are
+# shared by many queries and rarely change, so they are kept far longer
+# than search results
+wikidata_labels = MemoryCache(
+    getattr(settings, 'WIKIDATA_LABEL_CACHE_MAX_BYTES', 2 * 1024 * 1024),
+    getattr(settings, 'WIKIDATA_LABEL_CACHE_TTL', 7 * 24 * 60 * 60),
+)
+
+
+def resolve_wikidata_labels(entity_ids, timeout=10):
+    """
+    English labels for entity ids, as {id: label}. Uncached ids are fetched
+    WIKIDATA_IDS_PER_REQUEST at a time; ids without an English label map to
+    themselves, and ids whose lookup failed are left out.
+    """
+    labels = {}
+    missing = []
+    for eid in dict.fromkeys(entity_ids):
+        label = wikidata_labels.get(eid)
+        if label is None:
+            missing.append(eid)
+        else:
+            labels[eid] = label
+
+    for i in range(0, len(missing), WIKIDATA_IDS_PER_REQUEST):
+        batch = missing[i:i + WIKIDATA_IDS_PER_REQUEST]
+        try:
+            r = http_get(
+                WIKIDATA_API_URL,
+                params={'action': 'wbgetentities', 'ids': '|'.join(batch),
+                        'props': 'labels', 'languages': 'en', 'format': 'json'},
+                timeout=timeout
+            )
+            r.raise_for_status()
+            entities = r.json().get('entities', {})
+        except Exception as e:
+            print(f"Wikidata label lookup error: {e}")
+            continue
+        for eid in batch:
+            if eid not in entities:
+                continue
+            label = entities[eid].get('labels', {}).get('en', {}).get('value', eid)
+            wikidata_labels.set(eid, label)
+            labels[eid] = label
+    return labels
+
+
+@cached_source('wd')
+def search_wikidata(query, timeout=10):
     """
     Search Wikidata for a person / organisation / place.
     Returns structured facts: description, birth date, nationality, occupation, etc.
     """
     try:
-        cached = get_cached_search(f"wd:{query}")
-        if cached:
-            return cached
-
-        headers = {'User-Agent': 'LearnBuddy/1.0 (learnbuddy@example.com)'}
-
         # Step 1 – entity search
-        search_url = "https://www.wikidata.org/w/api.php"
         params = {
             'action': 'wbsearchentities',
             'search': query,
@@ -341,7 +351,7 @@ def search_wikidata(query):
             'format': 'json',
             'limit': 3,
         }
-        r = requests.get(search_url, params=params, headers=headers, timeout=8)
+        r = http_get(WIKIDATA_API_URL, params=params, timeout=timeout)
         r.raise_for_status()
         entities = r.json().get('search', [])
 
@@ -358,11 +368,9 @@ def search_wikidata(query):
         }
 
         if not entity_id:
-            cache_search_results(f"wd:{query}", result)
             return result
 
         # Step 2 – fetch notable claims
-        claims_url = "https://www.wikidata.org/w/api.php"
         cp = {
             'action': 'wbgetentities',
             'ids': entity_id,
@@ -370,9 +378,8 @@ def search_wikidata(query):
             'languages': 'en',
             'format': 'json',
         }
-        cr = requests.get(claims_url, params=cp, headers=headers, timeout=10)
+        cr = http_get(WIKIDATA_API_URL, params=cp, timeout=timeout)
         if not cr.ok:
-            cache_search_results(f"wd:{query}", result)
             return result
 
         entity_data = cr.json().get('entities', {}).get(entity_id, {})
@@ -389,7 +396,15 @@ def search_wikidata(query):
             'P413': 'Position played', 'P54':  'Member of sports team',
         }
 
-        def resolve_value(snak):
+        def entity_id_of(snak):
+            """The Q-id a snak refers to, if it is entity-valued."""
+            dv = snak.get('datavalue', {})
+            val = dv.get('value')
+            if dv.get('type') == 'wikibase-entityid' and isinstance(val, dict):
+                return val.get('id')
+            return None
+
+        def resolve_value(snak, labels):
             """Pull a readable value out of a Wikidata snak."""
             dv = snak.get('datavalue', {})
             dtype = dv.get('type')
@@ -401,39 +416,26 @@ def search_wikidata(query):
                 raw = val.get('time', '') if isinstance(val, dict) else ''
                 return raw.lstrip('+').split('T')[0]
             if dtype == 'wikibase-entityid':
-                eid = val.get('id') if isinstance(val, dict) else None
-                if eid:
-                    # Quick label lookup
-                    try:
-                        lr = requests.get(
-                            "https://www.wikidata.org/w/api.php",
-                            params={'action': 'wbgetentities', 'ids': eid,
-                                    'props': 'labels', 'languages': 'en', 'format': 'json'},
-                            headers=headers, timeout=5
-                        )
-                        if lr.ok:
-                            return (lr.json().get('entities', {})
-                                    .get(eid, {})
-                                    .get('labels', {})
-                                    .get('en', {})
-                                    .get('value', eid))
-                    except Exception:
-                        pass
-                return eid
+                eid = entity_id_of(snak)
+                return labels.get(eid, eid)
             return str(val) if val else None
 
-        for prop_id, prop_label in prop_map.items():
-            if prop_id in claims:
-                values = []
-                for claim in claims[prop_id][:3]:
-                    ms = claim.get('mainsnak', {})
-                    v = resolve_value(ms)
-                    if v:
-                        values.append(v)
-                if values:
-                    result['facts'][prop_label] = ', '.join(values)
-
-        cache_search_results(f"wd:{query}", result)
+        snaks = {
+            prop_label: [claim.get('mainsnak', {}) for claim in claims[prop_id][:3]]
+            for prop_id, prop_label in prop_map.items()
+            if prop_id in claims
+        }
+        # Labels of every referenced entity, in one request rather than one each
+        labels = resolve_wikidata_labels(
+            [eid for prop_snaks in snaks.values() for eid in map(entity_id_of, prop_snaks) if eid],
+            timeout=timeout,
+        )
+
+        for prop_label, prop_snaks in snaks.items():
+            values = [v for v in (resolve_value(ms, labels) for ms in prop_snaks) if v]
+            if values:
+                result['facts'][prop_label] = ', '.join(values)
+
         return result
 
     except Exception as e:
@@ -445,7 +447,8 @@ def search_wikidata(query):
 # Google News RSS  – free, no API key, current headlines
 # ---------------------------------------------------------------------------
 
-def search_google_news(query):
+@cached_source('gnews', negative_ttl=60)
+def search_google_news(query, timeout=10):
     """
     Fetch current news headlines via Google News RSS feed.
     Returns up to 6 recent articles (title + snippet + url + date).
@@ -454,13 +457,8 @@ def search_google_news(query):
     if not FEEDPARSER_AVAILABLE:
         return None
     try:
-        cached = get_cached_search(f"gnews:{query}")
-        if cached:
-            return cached
-
         rss_url = f"https://news.google.com/rss/search?q={quote(query)}&hl=en-US&gl=US&ceid=US:en"
-        headers = {'User-Agent': 'LearnBuddy/1.0 (learnbuddy@example.com)'}
-        r = requests.get(rss_url, headers=headers, timeout=10)
+        r = http_get(rss_url, timeout=timeout)
         r.raise_for_status()
 
         feed = feedparser.parse(r.text)
@@ -477,7 +475,6 @@ def search_google_news(query):
             })
 
         if articles:
-            cache_search_results(f"gnews:{query}", articles)
             return articles
 
         return None
@@ -491,16 +488,13 @@ def search_google_news(query):
 # Reddit JSON API  – free, no key needed for public searches
 # ---------------------------------------------------------------------------
 
-def search_reddit(query):
+@cached_source('reddit')
+def search_reddit(query, timeout=10):
     """
     Search Reddit for community discussions and context.
     Returns up to 5 relevant posts (title + body snippet + subreddit).
     """
     try:
-        cached = get_cached_search(f"reddit:{query}")
-        if cached:
-            return cached
-
         url = "https://www.reddit.com/search.json"
         params = {
             'q': query,
@@ -509,11 +503,8 @@ def search_reddit(query):
             't': 'year',
             'type': 'link',
         }
-        headers = {
-            'User-Agent': 'LearnBuddy/1.0 (Educational AI; learnbuddy@example.com)'
-        }
 
-        r = requests.get(url, params=params, headers=headers, timeout=10)
+        r = http_get(url, params=params, timeout=timeout)
         r.raise_for_status()
         posts = r.json().get('data', {}).get('children', [])
 
@@ -534,8 +525,6 @@ def search_reddit(query):
             })
 
         if results:
-            # Only cache if we found something useful
-            cache_search_results(f"reddit:{query}", results)
             return results
 
         return None
@@ -549,25 +538,21 @@ def search_reddit(query):
 # Open Library  – free, no key, books / authors
 # ---------------------------------------------------------------------------
 
-def search_open_library(query):
+@cached_source('ol')
+def search_open_library(query, timeout=10):
     """
     Search Open Library (Internet Archive) for books and authors.
     Returns up to 5 results with title, author, year, description.
     """
     try:
-        cached = get_cached_search(f"ol:{query}")
-        if cached:
-            return cached
-
         url = "https://openlibrary.org/search.json"
         params = {
             'q': query,
             'limit': 5,
             'fields': 'title,author_name,first_publish_year,subject,isbn,description',
         }
-        headers = {'User-Agent': 'LearnBuddy/1.0 (learnbuddy@example.com)'}
 
-        r = requests.get(url, params=params, headers=headers, timeout=10)
+        r = http_get(url, params=params, timeout=timeout)
         r.raise_for_status()
         docs = r.json().get('docs', [])
 
@@ -581,7 +566,6 @@ def search_open_library(query):
             })
 
         if results:
-            cache_search_results(f"ol:{query}", results)
             return results
 
         return None
@@ -591,9 +575,85 @@ def search_open_library(query):
         return None
 
 
-def search_web(query, max_results=3):
+# ---- Concurrent fan-out -----------------------------------------------------
+
+# Each source gets its own deadline (also used as its HTTP timeout), and the
+# whole search returns with whatever arrived within WEB_SEARCH_BUDGET seconds
+SOURCE_DEADLINES = {
+    'wikipedia': 5.0,     # search + full extract, two requests in sequence
+    'ddg': 4.0,
+    'musicbrainz': 5.0,
+    'wikidata': 5.0,
+    'news': 4.0,
+    'reddit': 4.0,
+    'books': 4.0,
+}
+WEB_SEARCH_BUDGET = getattr(settings, 'WEB_SEARCH_BUDGET', 6.0)
+
+# Shared by all searches; sources are I/O-bound, so threads are cheap here
+_source_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='web-source')
+
+
+def _search_wikipedia_with_extract(query, timeout=10):
+    wiki_result = search_wikipedia(query, timeout=timeout)
+    if not wiki_result:
+        return None
+    return wiki_result, get_wikipedia_full_extract(wiki_result['title'], timeout=timeout)
+
+
+_SOURCES = {
+    'wikipedia': _search_wikipedia_with_extract,
+    'ddg': search_duckduckgo_instant,
+    'musicbrainz': search_musicbrainz,
+    'wikidata': search_wikidata,
+    'news': search_google_news,
+    'reddit': search_reddit,
+    'books': search_open_library,
+}
+
+
+class _SourceFanOut:
+    """Sources of one search running in parallel, each against its own deadline"""
+
+    def __init__(self, query, budget):
+        self.query = query
+        self.deadline_at = time.monotonic() + budget
+        self.pending = {}   # future -> (source name, deadline)
+        self.found = {}
+        self.missed = []
+
+    def start(self, name):
+        deadline = SOURCE_DEADLINES[name]
+        future = _source_executor.submit(_SOURCES[name], self.query, timeout=deadline)
+        self.pending[future] = (name, min(time.monotonic() + deadline, self.deadline_at))
+
+    def wait(self, names=None):
+        """Collect results until the named sources (default: all) are done or past their deadline"""
+        while True:
+            waiting = [f for f, (name, _) in self.pending.items() if names is None or name in names]
+            if not waiting:
+                return
+            now = time.monotonic()
+            for future in waiting:
+                name, deadline = self.pending[future]
+                if future.done():
+                    del self.pending[future]
+                    try:
+                        self.found[name] = future.result()
+                    except Exception as e:
+                        print(f"Web search source {name} failed: {e}")
+                elif deadline <= now:
+                    # Left running: its own HTTP timeout ends it soon after
+                    del self.pending[future]
+                    self.missed.append(name)
+            next_deadline = min((self.pending[f][1] for f in waiting if f in self.pending), default=now)
+            futures_wait([f for f in waiting if f in self.pending],
+                         timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+
+
+def search_web(query, max_results=3, budget=None):
     """
-    Multi-source research engine – pulls from up to 7 sources:
+    Multi-source research engine – pulls from up to 7 sources, in parallel:
       1. Wikipedia (full article extract)
       2. DuckDuckGo Instant Answer API
       3. MusicBrainz  (artists / albums / recordings – music queries)
@@ -601,9 +661,11 @@ def search_web(query, max_results=3):
       5. Google News RSS (current headlines – news queries)
       6. Reddit JSON API (community context – most queries)
       7. Open Library (books / authors – academic queries)
+    Returns within budget seconds (default WEB_SEARCH_BUDGET) with the
+    sources that answered by then; 'missed_sources' lists the others.
     """
     try:
-        cached = get_cached_search(f"web:{query}")
+        cached = search_cache.get(f"web:{query}")
         if cached:
             return cached
 
@@ -617,6 +679,7 @@ def search_web(query, max_results=3):
             'news': None,
             'reddit': None,
             'books': None,
+            'missed_sources': [],
             'timestamp': datetime.now().isoformat(),
         }
 
@@ -624,49 +687,37 @@ def search_web(query, max_results=3):
         is_news  = _query_is_news(query)
         is_book  = _query_is_book(query)
 
-        # 1 – Wikipedia (always)
-        wiki_result = search_wikipedia(query)
-        if wiki_result:
-            results['knowledge'] = wiki_result
-            full_extract = get_wikipedia_full_extract(wiki_result['title'])
-            if full_extract:
-                results['full_extract'] = full_extract
-
-        # 2 – DuckDuckGo (always)
-        ddg_result = search_duckduckgo_instant(query)
-        if ddg_result:
-            results['ddg'] = ddg_result
-
-        # 3 – MusicBrainz (music queries OR when Wikipedia/DDG come up short)
-        if is_music or (not results['full_extract'] and not (results['ddg'] or {}).get('abstract')):
-            mb = search_musicbrainz(query)
-            if mb:
-                results['musicbrainz'] = mb
-
-        # 4 – Wikidata (people / entities – almost always useful)
-        wd = search_wikidata(query)
-        if wd:
-            results['wikidata'] = wd
-
-        # 5 – Google News (news / current-events queries)
-        if is_news:
-            news = search_google_news(query)
-            if news:
-                results['news'] = news
-
-        # 6 – Reddit (general context, skip for pure music/book lookups)
-        if not is_book:
-            reddit = search_reddit(query)
-            if reddit:
-                results['reddit'] = reddit
-
-        # 7 – Open Library (books / academic topics)
-        if is_book:
-            books = search_open_library(query)
-            if books:
-                results['books'] = books
-
-        cache_search_results(f"web:{query}", results)
+        fan_out = _SourceFanOut(query, WEB_SEARCH_BUDGET if budget is None else budget)
+        # Wikipedia, DuckDuckGo and Wikidata always; News for news queries;
+        # Reddit unless it is a book lookup; Open Library for book queries
+        for name, wanted in (('wikipedia', True), ('ddg', True), ('musicbrainz', is_music),
+                             ('wikidata', True), ('news', is_news), ('reddit', not is_book),
+                             ('books', is_book)):
+            if wanted:
+                fan_out.start(name)
+
+        # MusicBrainz also runs when Wikipedia and DuckDuckGo come up short
+        if not is_music:
+            fan_out.wait({'wikipedia', 'ddg'})
+            wiki = fan_out.found.get('wikipedia')
+            if not (wiki and wiki[1]) and not (fan_out.found.get('ddg') or {}).get('abstract'):
+                if fan_out.deadline_at > time.monotonic():
+                    fan_out.start('musicbrainz')
+        fan_out.wait()
+
+        found = fan_out.found
+        if found.get('wikipedia'):
+            results['knowledge'], results['full_extract'] = found['wikipedia']
+        for name in ('ddg', 'musicbrainz', 'wikidata', 'news', 'reddit', 'books'):
+            if found.get(name):
+                results[name] = found[name]
+        results['missed_sources'] = fan_out.missed
+        if fan_out.missed:
+            # Not cached: the late sources cache their own results, and the
+            # next search for this query picks them up
+            print(f"Web search for {query!r} answered without: {', '.join(fan_out.missed)}")
+        else:
+            search_cache.set(f"web:{query}", results)
         return results
 
     except Exception as e:
@@ -807,10 +858,23 @@ def format_search_results_for_ai(search_results):
 # Async wrapper
 # ---------------------------------------------------------------------------
 
+# Own pool so slow searches cannot starve the loop's default executor,
+# which Django uses to run sync ORM and view code for async views
+_search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='web-search')
+
+
+def submit_search(query):
+    """
+    Start search_web in the search pool and return its concurrent Future.
+    The search runs to completion, and caches its results, whether or not
+    anyone is still waiting for it.
+    """
+    return _search_executor.submit(search_web, query)
+
+
 async def search_web_async(query):
     """Asynchronous version – runs blocking I/O in a thread pool."""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, search_web, query)
+    return await asyncio.wrap_future(submit_search(query))
 
 
 # ---------------------------------------------------------------------------
@@ -824,39 +888,9 @@ def is_current_event_question(user_message):
       - Time-sensitive queries (news, weather, prices …)
       - Questions about specific people, organisations, or topics
       - General "tell me about" / "who is" / "what is" queries
+    The keywords live in the intent router, which matches whole words.
     """
-    # Keywords that almost always need a lookup
-    lookup_keywords = [
-        # Time-sensitive
-        'now', 'today', 'current', 'latest', 'recent', 'happening',
-        'news', 'breaking', 'right now', 'this week', 'this month',
-        'update on', 'situation', 'event', 'incident', 'crisis',
-        'election', 'weather', 'stock', 'crypto',
-        'covid', 'pandemic', 'war', 'conflict',
-        # Informational / biographical
-        'who is', 'who was', 'who are', "who's",
-        'what is', "what's", 'what are',
-        'tell me about', 'explain', 'describe',
-        'biography', 'history of', 'origin of',
-        'when was', 'where is', 'how did',
-        'discography', 'songs', 'albums', 'minister', 'pastor', 'artist',
-        'singer', 'musician', 'actor', 'politician', 'author', 'founder',
-    ]
-
-    # Current year references
-    current_years = [
-        '2023', '2024', '2025', '2026',
-        'january', 'february', 'march', 'april',
-        'may', 'june', 'july', 'august', 'september',
-        'october', 'november', 'december',
-    ]
-
-    message_lower = user_message.lower()
-
-    has_lookup_keyword = any(kw in message_lower for kw in lookup_keywords)
-    has_time_reference = any(yr in message_lower for yr in current_years)
-
-    return has_lookup_keyword or has_time_reference
+    return route_message(user_message).needs_lookup
 
 
 # ---------------------------------------------------------------------------
@@ -866,7 +900,7 @@ def is_current_event_question(user_message):
 def search_web_recommendations(query):
     """Kept for backward compatibility. Returns basic resource recommendations."""
     try:
-        cached = get_cached_search(f"recommendations:{query}")
+        cached = search_cache.get(f"recommendations:{query}")
         if cached:
             return cached
 
@@ -880,7 +914,7 @@ def search_web_recommendations(query):
                 'source': 'Wikipedia'
             })
 
-        cache_search_results(f"recommendations:{query}", results)
+        search_cache.set(f"recommendations:{query}", results)
         return results
 
     except Exception as e: